@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import sys
+import tempfile
 import django_heroku
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -38,16 +40,20 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'record',
+    'record.apps.RecordConfig',
     'accounts',
 ]
 
 MIDDLEWARE = [
+    # 計測は他のミドルウェアも含めるため先頭に置く
+    'record.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # スタッフが ?_profile=1 を付けたリクエストだけ cProfile で測る
+    'record.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -56,7 +62,9 @@ ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'record.instrumentation.TimedDjangoTemplates',
+        # 別名はモジュール名から付くので、標準の 'django' のままにしておく
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -83,6 +91,43 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+# gunicorn のワーカー間で無効化を共有するため DB キャッシュを使う
+# (python manage.py createcachetable が必要)
+
+CACHES = {
+    # ページ・集計と世代番号。ページのキーは URL とユーザーと世代番号ごとにでき、古い世代の
+    # エントリーも期限まで残るので、既定の 300 件では書くたびに世代番号ごと追い出される。
+    # 一杯になったら期限切れと、キー順に 1/3 を消す (消えた世代番号は新しい値で作り直される)
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'record_cache',
+        'OPTIONS': {'MAX_ENTRIES': 20000, 'CULL_FREQUENCY': 3},
+    },
+}
+
+# 一覧・詳細ページのキャッシュ (データが変わるまで有効)
+RECORD_PAGE_CACHE = True
+RECORD_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# リクエストごとの処理時間を Server-Timing ヘッダーで返す
+RECORD_SERVER_TIMING = True
+# ?_profile=1 で取ったプロファイル (.prof と折りたたみスタック) の保存先
+RECORD_PROFILING = True
+RECORD_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+# /metrics (Prometheus 形式) の集計。gunicorn のワーカー間はローカルの SQLite ファイルで共有する
+# (テストでは集計せず、開発サーバーのファイルにも触らない)
+RECORD_METRICS = 'test' not in sys.argv[1:2]
+RECORD_METRICS_DB = ':memory:' if 'test' in sys.argv[1:2] else \
+    os.path.join(tempfile.gettempdir(), 'record_metrics.sqlite3')
+RECORD_METRICS_TOKEN = os.environ.get('RECORD_METRICS_TOKEN')
+# 同じ形の SQL が1リクエストで閾値より多く実行されたら N+1 として知らせる
+# (テストでは例外にして失敗させ、開発中はログに出す)
+RECORD_NPLUSONE = 'raise' if 'test' in sys.argv[1:2] else 'log' if DEBUG else None
+RECORD_NPLUSONE_THRESHOLD = 3
+# これより遅い SQL を EXPLAIN 付きでログに出し、形ごとに集計する (None で無効)
+RECORD_SLOW_QUERY_MS = 100
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -131,4 +176,18 @@ FORMAT_MODULE_PATH = [
 
 LOGIN_REDIRECT_URL = '/'
 
+# 一覧ページの1ページあたりの件数 (?size= で RECORD_MAX_PAGE_SIZE まで変更可)
+RECORD_PAGE_SIZE = 50
+RECORD_MAX_PAGE_SIZE = 200
+
 django_heroku.settings(locals())
+
+# リクエストごとの計測ログ。1リクエスト1行になるので、出すときは RECORD_REQUEST_LOG_LEVEL=INFO にする
+LOGGING['loggers']['record.requests'] = {
+    'handlers': ['console'],
+    'level': os.environ.get('RECORD_REQUEST_LOG_LEVEL', 'WARNING'),
+    'propagate': False,
+}
+LOGGING['loggers']['record.nplusone'] = {'handlers': ['console'], 'level': 'WARNING', 'propagate': False}
+LOGGING['loggers']['record.slowqueries'] = {'handlers': ['console'], 'level': 'WARNING', 'propagate': False}
+LOGGING['loggers']['record.metrics'] = {'handlers': ['console'], 'level': 'WARNING', 'propagate': False}
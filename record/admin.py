@@ -1,8 +1,29 @@
 from django.contrib import admin
-from .models import Game, Rival, Player, Stats
+from .models import Game, Rival, Player, Stats, PlayerCareerTotals, RivalRecord, \
+    Season, PlayerSeasonTotals, RivalSeasonRecord, PlayerCumulativeTotals, RivalCumulativeRecord
+
+
+class GameAdmin(admin.ModelAdmin):
+    list_select_related = ('rival',)
+
+
+class StatsAdmin(admin.ModelAdmin):
+    list_select_related = ('game__rival', 'player')
+
+
+class SeasonAdmin(admin.ModelAdmin):
+    list_display = ('name', 'start', 'end')
+
 
 # Register your models here.
-admin.site.register(Game)
+admin.site.register(Game, GameAdmin)
 admin.site.register(Rival)
 admin.site.register(Player)
-admin.site.register(Stats)
+admin.site.register(Stats, StatsAdmin)
+admin.site.register(PlayerCareerTotals)
+admin.site.register(RivalRecord)
+admin.site.register(Season, SeasonAdmin)
+admin.site.register(PlayerSeasonTotals)
+admin.site.register(RivalSeasonRecord)
+admin.site.register(PlayerCumulativeTotals)
+admin.site.register(RivalCumulativeRecord)
@@ -0,0 +1,189 @@
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from .cache import get_versions
+from .leaderboards import cached_leaderboards, parse_params
+from .models import Game, Player, Rival, Stats, WIN, LOSE, EVEN
+from .rolling import current_form, form_names, form_of, with_rolling_form
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+GAME_FIELDS = ('id', 'game_date', 'rival_id', 'rival__team_name', 'field',
+               'point_gain', 'point_reduce', 'remark')
+PLAYER_FIELDS = ('id', 'name', 'sebango', 'remark')
+CAREER_FIELDS = ('appearances', 'goals', 'assists', 'passes', 'intercepts', 'dribbles', 'tuckles')
+RIVAL_FIELDS = ('id', 'team_name', 'home', 'remark')
+RECORD_FIELDS = ('played', 'won', 'lost', 'drawn', 'goals_for', 'goals_against', 'last_played')
+STATS_ROW_FIELDS = ('game_id', 'player_id', 'goals', 'assists', 'passes',
+                    'intercepts', 'dribbles', 'tuckles', 'remark')
+
+# 各エンドポイントの結果が依存するモデルの世代番号
+DEPENDENCIES = {
+    'games': ('game', 'rival'),
+    'game': ('game', 'rival', 'stats', 'player'),
+    'players': ('player', 'stats'),
+    'player': ('player', 'stats', 'game', 'rival'),
+    'rivals': ('rival', 'game'),
+    'rival': ('rival', 'game'),
+    'leaderboards': ('stats', 'game', 'player'),
+}
+
+
+def _versions(request, resource):
+    # etag と last_modified の両方で使うのでリクエストごとに1回だけ読む
+    if not hasattr(request, '_record_api_versions'):
+        request._record_api_versions = get_versions(DEPENDENCIES[resource])
+    return request._record_api_versions
+
+
+def _etag(resource):
+    def etag(request, *args, **kwargs):
+        versions = _versions(request, resource)
+        raw = '|'.join([request.get_full_path()] + ['%s:%s' % kv for kv in sorted(versions.items())])
+        return hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return etag
+
+
+def _last_modified(resource):
+    def last_modified(request, *args, **kwargs):
+        # 世代番号はミリ秒のタイムスタンプなので、そのまま更新時刻になる
+        return datetime.fromtimestamp(max(_versions(request, resource).values()) / 1000, tz=timezone.utc)
+    return last_modified
+
+
+def conditional(resource):
+    def decorator(view):
+        return require_GET(condition(etag_func=_etag(resource),
+                                     last_modified_func=_last_modified(resource))(view))
+    return decorator
+
+
+def _limit(request):
+    default = getattr(settings, 'RECORD_API_LIMIT', DEFAULT_LIMIT)
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _page(request, queryset, fields, serialize, extend=None):
+    """Keyset page ordered by id: ?after=<id>&limit=<n>.
+
+    ``extend(results)`` may add data for the whole page at once.
+    """
+    limit = _limit(request)
+    after = request.GET.get('after')
+    if after and after.isdigit():
+        queryset = queryset.filter(id__gt=int(after))
+    rows = list(queryset.order_by('id').values(*fields)[:limit + 1])
+    results = [serialize(row) for row in rows[:limit]]
+    if extend is not None and results:
+        extend(results)
+    next_after = rows[limit - 1]['id'] if len(rows) > limit else None
+    return JsonResponse({'results': results, 'next_after': next_after})
+
+
+def _result(gain, reduce):
+    if gain > reduce:
+        return WIN
+    elif gain < reduce:
+        return LOSE
+    return EVEN
+
+
+def _nested(row, prefix, fields, name):
+    row[name] = {f: row.pop(prefix + f) for f in fields}
+    return row
+
+
+def serialize_game(row):
+    row['rival_name'] = row.pop('rival__team_name')
+    row['result'] = _result(row['point_gain'], row['point_reduce'])
+    return row
+
+
+def serialize_player(row):
+    return _nested(row, 'career_totals__', CAREER_FIELDS, 'career_totals')
+
+
+def serialize_rival(row):
+    return _nested(row, 'head_to_head__', RECORD_FIELDS, 'record')
+
+
+def _get(queryset, pk, fields, serialize):
+    row = queryset.filter(pk=pk).values(*fields).first()
+    if row is None:
+        raise Http404
+    return serialize(row)
+
+
+@conditional('games')
+def game_list(request):
+    games = Game.objects.all()
+    rival = request.GET.get('rival')
+    if rival and rival.isdigit():
+        games = games.filter(rival_id=int(rival))
+    return _page(request, games, GAME_FIELDS, serialize_game)
+
+
+@conditional('game')
+def game_detail(request, pk):
+    game = _get(Game.objects.all(), pk, GAME_FIELDS, serialize_game)
+    game['stats'] = list(Stats.objects.filter(game_id=pk).order_by('id')
+                         .values('player__name', *STATS_ROW_FIELDS))
+    return JsonResponse(game)
+
+
+@conditional('players')
+def player_list(request):
+    fields = PLAYER_FIELDS + tuple('career_totals__' + f for f in CAREER_FIELDS)
+    return _page(request, Player.objects.all(), fields, serialize_player, extend=add_form)
+
+
+def add_form(players):
+    # ページ内の選手の直近成績を1クエリで付ける
+    forms = current_form([p['id'] for p in players])
+    for p in players:
+        p['form'] = forms.get(p['id']) or form_of({})
+
+
+@conditional('player')
+def player_detail(request, pk):
+    fields = PLAYER_FIELDS + tuple('career_totals__' + f for f in CAREER_FIELDS)
+    player = _get(Player.objects.all(), pk, fields, serialize_player)
+    stats = with_rolling_form(Stats.objects.filter(player_id=pk)).order_by('game__game_date', 'game_id')
+    player['stats'] = list(stats.values('game__game_date', 'game__rival__team_name',
+                                        *(STATS_ROW_FIELDS + tuple(form_names()))))
+    player['form'] = form_of(player['stats'][-1] if player['stats'] else {})
+    return JsonResponse(player)
+
+
+@conditional('rivals')
+def rival_list(request):
+    fields = RIVAL_FIELDS + tuple('head_to_head__' + f for f in RECORD_FIELDS)
+    return _page(request, Rival.objects.all(), fields, serialize_rival)
+
+
+@conditional('rival')
+def rival_detail(request, pk):
+    fields = RIVAL_FIELDS + tuple('head_to_head__' + f for f in RECORD_FIELDS)
+    rival = _get(Rival.objects.all(), pk, fields, serialize_rival)
+    games = Game.objects.filter(rival_id=pk).order_by('game_date', 'id')
+    rival['games'] = [serialize_game(row) for row in games.values(*GAME_FIELDS)]
+    return JsonResponse(rival)
+
+
+@conditional('leaderboards')
+def leaderboards(request):
+    try:
+        params = parse_params(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse({'top': params['top'], 'rank': params['method'],
+                         'boards': cached_leaderboards(**params)})
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RecordConfig(AppConfig):
     name = 'record'
+
+    def ready(self):
+        from . import signals, slowqueries  # noqa: F401
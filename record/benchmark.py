@@ -0,0 +1,199 @@
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .models import Game, Player, Rival, Stats
+from .synthetic import generate
+
+# 各サイズのデータ件数 (累計)。小さいサイズから順に足していく
+SIZES = {
+    'small': {'players': 20, 'rivals': 10, 'games': 50},
+    'medium': {'players': 40, 'rivals': 40, 'games': 500},
+    'large': {'players': 60, 'rivals': 100, 'games': 3000},
+}
+
+# url name -> reverse の引数。モデルは一番データの多いオブジェクトの pk に置き換える
+URL_ARGS = {
+    'record_index': (),
+    'game_list': (),
+    'game_detail': (Game,),
+    'game_new': (),
+    'game_new_player': (1,),
+    'game_new_rival': (),
+    'game_update': (Game,),
+    'game_add_stats': (Game,),
+    'rival_list': (),
+    'rival_detail': (Rival,),
+    'rival_new': (),
+    'rival_update': (Rival,),
+    'player_list': (),
+    'player_detail': (Player,),
+    'player_new': (),
+    'player_update': (Player,),
+    'stats_update': (Stats,),
+    'leaderboards': (),
+    'export': ('stats', 'csv'),
+    'api_game_list': (),
+    'api_game_detail': (Game,),
+    'api_player_list': (),
+    'api_player_detail': (Player,),
+    'api_rival_list': (),
+    'api_rival_detail': (Rival,),
+    'api_leaderboards': (),
+    'metrics': (),
+}
+
+
+def current_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(settings.BASE_DIR),
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+class Benchmark:
+    """Time every route of record/urls.py against growing synthetic datasets.
+
+    For each url the wall time of ``repeat`` requests (after one warm-up), the
+    query count and the peak Python memory of one request are recorded. The
+    page and row caches are off unless ``use_cache`` is set, so the numbers
+    are those of an actual render.
+    """
+
+    def __init__(self, sizes=None, repeat=5, use_cache=False, seed=0, stdout=None):
+        self.sizes = sizes if sizes is not None else SIZES
+        self.repeat = max(1, repeat)
+        self.use_cache = use_cache
+        self.seed = seed
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def run(self):
+        user, _ = User.objects.get_or_create(username='benchmark')
+        self.client = Client()
+        self.client.force_login(user)
+
+        results = {'commit': current_commit(),
+                   'created': datetime.now().isoformat(timespec='seconds'),
+                   'repeat': self.repeat,
+                   'use_cache': self.use_cache,
+                   'sizes': {}}
+        cache_settings = {} if self.use_cache else {'RECORD_PAGE_CACHE': False}
+        # /metrics の集計は開発サーバーと共有しない使い捨てのファイルに書く
+        with tempfile.TemporaryDirectory() as tmp, \
+                override_settings(RECORD_METRICS_DB=os.path.join(tmp, 'metrics.sqlite3'), **cache_settings):
+            for name, target in self.sizes.items():
+                self.grow(target)
+                dataset = self.dataset()
+                self.log("%s: %s" % (name, ', '.join('%s=%d' % kv for kv in dataset.items())))
+                urls = {}
+                for url_name in URL_ARGS:
+                    urls[url_name] = self.measure(self.url(url_name))
+                    self.log("  %-20s %8.1f ms %4d queries %8.1f KiB" % (
+                        url_name, urls[url_name]['wall_ms'], urls[url_name]['queries'], urls[url_name]['peak_kib']))
+                results['sizes'][name] = {'dataset': dataset, 'urls': urls}
+        return results
+
+    def grow(self, target):
+        missing = {
+            'players': target.get('players', 0) - Player.objects.count(),
+            'rivals': target.get('rivals', 0) - Rival.objects.count(),
+            'games': target.get('games', 0) - Game.objects.count(),
+        }
+        generate(stats_per_game=target.get('stats_per_game', 11), seed=self.seed,
+                 **{k: max(0, v) for k, v in missing.items()})
+
+    def dataset(self):
+        return {'players': Player.objects.count(), 'rivals': Rival.objects.count(),
+                'games': Game.objects.count(), 'stats': Stats.objects.count()}
+
+    def url(self, name):
+        # 詳細ページは一番重いオブジェクトで測る
+        heaviest = {
+            Game: lambda: Game.objects.order_by('-game_date', '-id').first(),
+            Rival: lambda: Rival.objects.annotate(n=Count('rival')).order_by('-n', 'id').first(),
+            Player: lambda: Player.objects.annotate(n=Count('player')).order_by('-n', 'id').first(),
+            Stats: lambda: Stats.objects.order_by('-id').first(),
+        }
+        args = []
+        for arg in URL_ARGS[name]:
+            if arg in heaviest:
+                obj = heaviest[arg]()
+                arg = obj.pk if obj else 1
+            args.append(arg)
+        return reverse(name, args=args)
+
+    def request(self, url):
+        res = self.client.get(url)
+        if res.streaming:
+            b''.join(res.streaming_content)
+        return res
+
+    def measure(self, url):
+        self.request(url)
+        times = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            res = self.request(url)
+            times.append((time.perf_counter() - started) * 1000)
+
+        # captured_queries は遅延評価で、次のリクエストで queries_log が消えるので先に数える
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            self.request(url)
+        queries = len(ctx)
+
+        tracemalloc.start()
+        try:
+            self.request(url)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {'url': url,
+                'status': res.status_code,
+                'wall_ms': round(statistics.median(times), 2),
+                'wall_ms_min': round(min(times), 2),
+                'queries': queries,
+                'peak_kib': round(peak / 1024, 1)}
+
+
+def compare(old, new, threshold=1.25):
+    """Return (lines, regressions) comparing two benchmark results.
+
+    A url regresses when its median time grows by more than ``threshold``
+    times or when it issues more queries than before.
+    """
+    lines, regressions = [], []
+    for size, data in new['sizes'].items():
+        before = old.get('sizes', {}).get(size)
+        if before is None:
+            continue
+        for name, now in data['urls'].items():
+            was = before['urls'].get(name)
+            if was is None:
+                continue
+            ratio = now['wall_ms'] / was['wall_ms'] if was['wall_ms'] else 1.0
+            line = "%-7s %-20s %8.1f -> %8.1f ms (x%.2f)  queries %d -> %d" % (
+                size, name, was['wall_ms'], now['wall_ms'], ratio, was['queries'], now['queries'])
+            if ratio > threshold or now['queries'] > was['queries']:
+                regressions.append(line)
+            lines.append(line)
+    return lines, regressions
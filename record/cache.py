@@ -0,0 +1,123 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .instrumentation import count_cache
+from .nplusone import untracked
+
+VERSION_KEY = 'record:version:%s'
+PAGE_KEY = 'record:page:%s'
+PAGE_TIMEOUT = 60 * 60 * 24
+
+# 世代番号とページのキーは、読み書きの回数がモデル名の数で決まる (行の数によらない) ので
+# N+1 の検出では数えない (untracked)
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+@untracked()
+def get_version(name):
+    """Return the current generation of ``name``.
+
+    Versions are millisecond timestamps, so a counter that was evicted from the
+    cache comes back with a value that was never used before.
+    """
+    key = VERSION_KEY % name
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _now_ms(), None)
+        version = cache.get(key)
+    return version
+
+
+@untracked()
+def get_versions(names):
+    """Return {name: version} for several names.
+
+    One get_many when every version exists; the missing ones are added and
+    the whole set is read again, so a cold cache costs one add per missing
+    name and a second get_many.
+    """
+    keys = {VERSION_KEY % name: name for name in names}
+    found = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = _now_ms()
+        for key in missing:
+            cache.add(key, now, None)
+        found = cache.get_many(list(keys))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def bump_version(name):
+    bump_versions([name])
+
+
+def bump_versions(names):
+    """Advance several versions with one read and one write per bump."""
+    keys = [VERSION_KEY % name for name in set(names)]
+    if not keys:
+        return
+
+    @untracked()
+    def bump():
+        now = _now_ms()
+        current = cache.get_many(keys)
+        cache.set_many({key: max(now, (current.get(key) or 0) + 1) for key in keys}, None)
+
+    # コミット前に計算されたキャッシュを残さないよう、コミット後にももう一度進める
+    bump()
+    transaction.on_commit(bump)
+
+
+def page_key(request, names):
+    """Cache key for a page: URL, who is looking at it and the data versions it depends on."""
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    versions = get_versions(names) if names else {}
+    raw = '|'.join([request.method, request.get_full_path(), str(user)] +
+                   ['%s:%s' % kv for kv in sorted(versions.items())])
+    return PAGE_KEY % hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def cache_page_versioned(*names):
+    """Cache a GET page until one of the models in ``names`` is written.
+
+    The key contains the current version of every name, so a bump by the
+    post_save/post_delete receivers makes only the pages that depend on that
+    model miss; the stale entries simply expire.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not getattr(settings, 'RECORD_PAGE_CACHE', True) or request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, names)
+            with untracked():
+                response = cache.get(key)
+            count_cache(hits=response is not None, misses=response is None)
+            if response is not None:
+                return response
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                timeout = getattr(settings, 'RECORD_PAGE_CACHE_TIMEOUT', PAGE_TIMEOUT)
+
+                @untracked()
+                def store(r):
+                    cache.set(key, r, timeout)
+
+                if hasattr(response, 'render') and callable(response.render):
+                    response.add_post_render_callback(store)
+                else:
+                    store(response)
+            return response
+        return wrapped
+    return decorator
+
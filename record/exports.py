@@ -0,0 +1,141 @@
+import csv
+import json
+from datetime import datetime, timedelta
+
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+
+from .models import Game, Rival, Stats
+
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# 列名は import_matches と同じにして、書き出したものをそのまま取り込めるようにする
+EXPORTS = {
+    'games': (Game, (
+        ('game_id', 'id'),
+        ('game_date', 'game_date'),
+        ('rival', 'rival__team_name'),
+        ('field', 'field'),
+        ('point_gain', 'point_gain'),
+        ('point_reduce', 'point_reduce'),
+        ('game_remark', 'remark'),
+    ), ('game_date', 'id')),
+    'stats': (Stats, (
+        ('game_id', 'game_id'),
+        ('game_date', 'game__game_date'),
+        ('rival', 'game__rival__team_name'),
+        ('field', 'game__field'),
+        ('point_gain', 'game__point_gain'),
+        ('point_reduce', 'game__point_reduce'),
+        ('game_remark', 'game__remark'),
+        ('player', 'player__name'),
+        ('sebango', 'player__sebango'),
+        ('goals', 'goals'),
+        ('assists', 'assists'),
+        ('passes', 'passes'),
+        ('intercepts', 'intercepts'),
+        ('dribbles', 'dribbles'),
+        ('tuckles', 'tuckles'),
+        ('remark', 'remark'),
+    ), ('game__game_date', 'game_id', 'player_id')),
+    'rivals': (Rival, (
+        ('rival_id', 'id'),
+        ('rival', 'team_name'),
+        ('home', 'home'),
+        ('played', 'head_to_head__played'),
+        ('won', 'head_to_head__won'),
+        ('lost', 'head_to_head__lost'),
+        ('drawn', 'head_to_head__drawn'),
+        ('goals_for', 'head_to_head__goals_for'),
+        ('goals_against', 'head_to_head__goals_against'),
+        ('last_played', 'head_to_head__last_played'),
+    ), ('id',)),
+}
+
+# 試合日と対戦相手で絞り込むときの項目
+FILTER_FIELDS = {
+    'games': ('game_date', 'rival_id'),
+    'stats': ('game__game_date', 'game__rival_id'),
+    'rivals': (None, 'id'),
+}
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the csv writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_view(request, name, fmt):
+    if name not in EXPORTS or fmt not in CONTENT_TYPES:
+        raise Http404
+    model, columns, ordering = EXPORTS[name]
+
+    try:
+        queryset = filter_queryset(model.objects.all(), name, request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    headers = [c[0] for c in columns]
+    rows = (queryset.order_by(*ordering)
+            .values_list(*[c[1] for c in columns])
+            .iterator(chunk_size=CHUNK_SIZE))
+
+    if fmt == 'csv':
+        content = stream_csv(headers, rows)
+    else:
+        content = stream_jsonl(headers, rows)
+
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (name, fmt)
+    return response
+
+
+def filter_queryset(queryset, name, params):
+    date_field, rival_field = FILTER_FIELDS[name]
+    if date_field:
+        start = parse_day(params.get('from'))
+        end = parse_day(params.get('to'))
+        if start:
+            queryset = queryset.filter(**{date_field + '__gte': start})
+        if end:
+            queryset = queryset.filter(**{date_field + '__lt': end + timedelta(days=1)})
+    rival = params.get('rival')
+    if rival:
+        if not rival.isdigit():
+            raise ValueError("rival must be an id")
+        queryset = queryset.filter(**{rival_field: int(rival)})
+    return queryset
+
+
+def parse_day(value):
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError("dates must be YYYY-MM-DD")
+    return datetime(day.year, day.month, day.day)
+
+
+def stream_csv(headers, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow([format_value(v) for v in row])
+
+
+def stream_jsonl(headers, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(headers, (format_value(v) for v in row))), ensure_ascii=False) + "\n"
+
+
+def format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
@@ -1,4 +1,5 @@
 from django import forms
+from django.core.exceptions import ValidationError
 from django.forms import inlineformset_factory, BaseFormSet
 from django.utils import timezone
 
@@ -42,10 +43,32 @@ class AddStatsForm(forms.ModelForm):
         fields = ('player', 'goals', 'assists', 'intercepts',
                   'dribbles', 'tuckles', 'remark')
 
+    def is_new_in(self, game):
+        player = self.cleaned_data['player']
+        if Stats.objects.filter(game=game, player=player).exists():
+            self.add_error('player', "Stats for this player already exist in the game")
+            return False
+        return True
+
+
+class PlayerChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField that takes the player from ``players`` ({pk: Player}) when it is set."""
+
+    players = None
+
+    def to_python(self, value):
+        if self.players is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.players[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice',
+                                  params={'value': value})
+
 
 class StatsForm(forms.ModelForm):
 
-    player = forms.ModelChoiceField(required=False, label="player", queryset=Player.objects.all())
+    player = PlayerChoiceField(required=False, label="player", queryset=Player.objects.all())
     goals = forms.IntegerField(initial=0, min_value=0, required=False, widget=forms.NumberInput(attrs={'class': 'stats'}))
     assists = forms.IntegerField(initial=0, min_value=0, required=False, widget=forms.NumberInput(attrs={'class': 'stats'}))
     intercepts = forms.IntegerField(initial=0, min_value=0, required=False, widget=forms.NumberInput(attrs={'class': 'stats'}))
@@ -62,9 +85,31 @@ class StatsForm(forms.ModelForm):
         b = self.cleaned_data['player']
         return b is not None
 
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        # 選択肢から取った選手は保存済みなので、FK の存在確認 (1行ごとの SELECT) を省く
+        if self.fields['player'].players is not None:
+            exclude.add('player')
+        return exclude
+
 
 class CustomStatsFormSet(BaseFormSet):
 
+    player_choices = None
+    players = None
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        # 選手の選択肢はフォームごとに検索せず、最初のフォームで1回だけ評価して使い回す
+        if self.player_choices is None:
+            # list() だと __len__ で COUNT が余分に走る
+            self.player_choices = [choice for choice in form.fields['player'].choices]
+            # 送られた選手も選択肢の中から引き、フォームごとに get() しない
+            self.players = {value.value: value.instance for value, _ in self.player_choices if value}
+        form.fields['player'].choices = self.player_choices
+        form.fields['player'].players = self.players
+        return form
+
     def clean(self):
         if any(self.errors):
             return
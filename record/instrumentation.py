@@ -0,0 +1,153 @@
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+from .metrics import record_request
+from .nplusone import QueryTracker, nplusone_mode
+
+logger = logging.getLogger('record.requests')
+
+_metrics = ContextVar('record_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Counters of one request, reachable from anywhere through current()."""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook counting queries and their time."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def view_name(self):
+        """URL name of the view handling the request ('-' before it is resolved)."""
+        return getattr(getattr(self.request, 'resolver_match', None), 'view_name', None) or '-'
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 1),
+            'db_queries': self.db_queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'template_ms': round(self.template_time * 1000, 1),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+    def server_timing(self):
+        return ', '.join([
+            'total;dur=%.1f' % (self.total * 1000),
+            'db;dur=%.1f;desc="%d queries"' % (self.db_time * 1000, self.db_queries),
+            'tpl;dur=%.1f' % (self.template_time * 1000),
+            'cache;desc="%d hits %d misses"' % (self.cache_hits, self.cache_misses),
+        ])
+
+
+def current():
+    """Metrics of the request being handled, or None outside a request."""
+    return _metrics.get()
+
+
+def count_cache(hits=0, misses=0):
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class TimedTemplate:
+    """Wraps a backend template to add its render time to the request metrics."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _metrics.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        # テンプレートの中から描画されるテンプレートは二重に数えない
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if metrics.template_depth == 0:
+                metrics.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates report their render time."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class InstrumentationMiddleware:
+    """Measure every request: latency, DB queries and time, template time, cache hits.
+
+    The numbers are sent back in a Server-Timing header (unless
+    RECORD_SERVER_TIMING is False) and logged as one key=value line at INFO
+    on the 'record.requests' logger (set RECORD_REQUEST_LOG_LEVEL=INFO to see
+    them), and added to the aggregates served by record.metrics. With
+    RECORD_NPLUSONE set, repeated statement shapes are
+    reported as well (see record.nplusone). Put it first in MIDDLEWARE so
+    the total covers the other middleware too. For streaming responses only the work done
+    before the first byte is counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics(request)
+        tracker = QueryTracker() if nplusone_mode() else None
+        token = _metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(metrics.execute))
+                    if tracker is not None:
+                        stack.enter_context(conn.execute_wrapper(tracker))
+                response = self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        metrics.total = time.perf_counter() - metrics.started
+
+        if getattr(settings, 'RECORD_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing()
+
+        view = metrics.view_name()
+        values = metrics.as_dict()
+        logger.info(
+            'view=%s method=%s path=%s status=%d ' % (view, request.method, request.path, response.status_code) +
+            ' '.join('%s=%s' % kv for kv in values.items()),
+            extra={'view': view, 'status': response.status_code, 'metrics': values})
+        record_request(view, response.status_code, metrics)
+        if tracker is not None:
+            tracker.report('%s %s' % (view, request.get_full_path()))
+        return response
@@ -0,0 +1,117 @@
+import hashlib
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum, Window
+from django.db.models.functions import DenseRank, Rank
+
+from .cache import get_versions
+from .exports import parse_day
+from .instrumentation import count_cache
+from .nplusone import untracked
+from .models import PlayerCareerTotals, Stats, STATS_FIELDS
+
+DEFAULT_TOP = 10
+MAX_TOP = 50
+RANK_FUNCTIONS = {'rank': Rank, 'dense': DenseRank}
+LEADERBOARDS_KEY = 'record:leaderboards:%s'
+
+
+def parse_params(params):
+    """Turn request.GET into leaderboards() keyword arguments.
+
+    Raises ValueError for values that cannot be used.
+    """
+    top = params.get('top') or DEFAULT_TOP
+    if not str(top).isdigit():
+        raise ValueError("top must be a number")
+    method = params.get('rank') or 'rank'
+    if method not in RANK_FUNCTIONS:
+        raise ValueError("rank must be rank or dense")
+    rival = params.get('rival')
+    if rival and not rival.isdigit():
+        raise ValueError("rival must be an id")
+    fields = params.get('stat')
+    if fields and fields not in STATS_FIELDS:
+        raise ValueError("unknown stat: %s" % fields)
+    return {
+        'top': max(1, min(int(top), MAX_TOP)),
+        'method': method,
+        'start': parse_day(params.get('from')),
+        'end': parse_day(params.get('to')),
+        'rival_id': int(rival) if rival else None,
+        'fields': (fields,) if fields else STATS_FIELDS,
+    }
+
+
+def ranked_queryset(fields=STATS_FIELDS, method='rank', start=None, end=None, rival_id=None):
+    """One row per player with the stat totals and a rank per stat.
+
+    Without a scope the totals come from PlayerCareerTotals; with a date range
+    or rival they are summed from the matching Stats rows.
+    """
+    if start is None and end is None and rival_id is None:
+        qs = (PlayerCareerTotals.objects.filter(appearances__gt=0)
+              .values('player_id', 'player__name', 'player__sebango', 'appearances')
+              .annotate(**{name + '_total': F(name) for name in fields}))
+    else:
+        scope = Q()
+        if start is not None:
+            scope &= Q(game__game_date__gte=start)
+        if end is not None:
+            # 終了日はその日を含める
+            scope &= Q(game__game_date__lt=end + timedelta(days=1))
+        if rival_id is not None:
+            scope &= Q(game__rival_id=rival_id)
+        qs = (Stats.objects.filter(scope)
+              .values('player_id', 'player__name', 'player__sebango')
+              .annotate(appearances=Count('id'), **{name + '_total': Sum(name) for name in fields}))
+
+    rank = RANK_FUNCTIONS[method]
+    return qs.annotate(**{
+        'rank_' + name: Window(rank(), order_by=F(name + '_total').desc()) for name in fields
+    })
+
+
+def leaderboards(top=DEFAULT_TOP, fields=STATS_FIELDS, **scope):
+    """Return {stat: [row, ...]} with the top ``top`` players of each stat.
+
+    The window ranks are filtered in the database, so a single query returns
+    only the players that make at least one board.
+    """
+    qs = ranked_queryset(fields, **scope)
+    condition = Q()
+    for name in fields:
+        condition |= Q(**{'rank_%s__lte' % name: top})
+
+    boards = {name: [] for name in fields}
+    for row in qs.filter(condition):
+        for name in fields:
+            # 0 は順位を付けない
+            if row['rank_' + name] <= top and row[name + '_total']:
+                boards[name].append({
+                    'rank': row['rank_' + name],
+                    'player_id': row['player_id'],
+                    'name': row['player__name'],
+                    'sebango': row['player__sebango'],
+                    'appearances': row['appearances'],
+                    'value': row[name + '_total'],
+                })
+    for rows in boards.values():
+        rows.sort(key=lambda r: (r['rank'], r['sebango'], r['player_id']))
+    return boards
+
+
+def cached_leaderboards(**kwargs):
+    """leaderboards() cached until Stats, Game or Player rows change."""
+    versions = get_versions(('stats', 'game', 'player'))
+    raw = repr((sorted(versions.items()), sorted(kwargs.items())))
+    key = LEADERBOARDS_KEY % hashlib.md5(raw.encode('utf-8')).hexdigest()
+    with untracked():
+        boards = cache.get(key)
+    count_cache(hits=boards is not None, misses=boards is None)
+    if boards is None:
+        boards = leaderboards(**kwargs)
+        with untracked():
+            cache.set(key, boards, None)
+    return boards
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from record.benchmark import SIZES, Benchmark, compare
+
+
+class Command(BaseCommand):
+    help = ("Time every record view against growing synthetic datasets and write the results as JSON. "
+            "Runs in a throwaway test database, so existing data is never touched.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=','.join(SIZES),
+                            help="Comma separated dataset sizes (%s)." % ', '.join(SIZES))
+        parser.add_argument('--repeat', type=int, default=5, help="Timed requests per url.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--with-cache', action='store_true',
+                            help="Keep the page and row caches on.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="Previous results JSON to compare against.")
+        parser.add_argument('--threshold', type=float, default=1.25,
+                            help="Slowdown ratio that counts as a regression.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['sizes'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in SIZES]
+        if unknown:
+            raise CommandError("Unknown size: %s" % ', '.join(unknown))
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError("Cannot read %s: %s" % (options['compare'], e))
+
+        # 本番と同じく DEBUG なしで測る
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = Benchmark(sizes={name: SIZES[name] for name in names}, repeat=options['repeat'],
+                                use_cache=options['with_cache'], seed=options['seed'],
+                                stdout=self.stdout).run()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write("Wrote %s" % options['output'])
+
+        if baseline is not None:
+            lines, regressions = compare(baseline, results, options['threshold'])
+            for line in lines:
+                self.stdout.write(line)
+            if regressions:
+                self.stdout.write(self.style.WARNING("%d regression(s):" % len(regressions)))
+                for line in regressions:
+                    self.stdout.write(self.style.WARNING(line))
+                if options['fail_on_regression']:
+                    raise CommandError("%d regression(s) against %s" % (len(regressions), options['compare']))
+            else:
+                self.stdout.write(self.style.SUCCESS("No regressions."))
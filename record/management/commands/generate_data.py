@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from record.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = ("Add synthetic players, rivals, games and stats for development and benchmarks. "
+            "Games are appended after the latest existing game.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=30)
+        parser.add_argument('--rivals', type=int, default=20)
+        parser.add_argument('--games', type=int, default=200)
+        parser.add_argument('--stats-per-game', type=int, default=11,
+                            help="Players with a stats row in each game.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--start', help="Date of the first game (YYYY-MM-DD) when there are none yet.")
+
+    def handle(self, *args, **options):
+        start = None
+        if options['start']:
+            try:
+                start = datetime.strptime(options['start'], '%Y-%m-%d').replace(hour=10)
+            except ValueError:
+                raise CommandError("--start must be YYYY-MM-DD")
+        try:
+            counts = generate(players=options['players'], rivals=options['rivals'],
+                              games=options['games'], stats_per_game=options['stats_per_game'],
+                              seed=options['seed'], start=start, stdout=self.stdout)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            "Created %(players)d players, %(rivals)d rivals, %(games)d games and %(stats)d stats rows." % counts))
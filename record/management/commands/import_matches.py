@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date, parse_datetime
+
+from record.models import Game, Player, Rival, Stats, STATS_FIELDS
+from record.service import GameCreateService, StatsCreateService
+
+
+class Command(BaseCommand):
+    help = ("Import historical matches from CSV or JSON Lines. One row per stats line with "
+            "game_date, rival, field, point_gain, point_reduce, game_remark, player, goals, "
+            "assists, passes, intercepts, dribbles, tuckles and remark. Consecutive rows with "
+            "the same (game_date, rival) belong to one game; an empty player records a game "
+            "without stats.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help="Input format (default: from the file extension).")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Stats rows written per transaction.")
+        parser.add_argument('--create-missing', action='store_true',
+                            help="Create rivals and players that do not exist yet.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.json')) else 'csv')
+        self.batch_size = max(1, options['batch_size'])
+        self.create_missing = options['create_missing']
+        self.game_service = GameCreateService()
+        self.stats_service = StatsCreateService()
+
+        # 名前 -> id の対応表はメモリに持つ
+        self.rivals = dict(Rival.objects.values_list('team_name', 'id'))
+        self.players = dict(Player.objects.values_list('name', 'id'))
+
+        self.pending_games = []
+        self.pending_stats = []
+        self.current_key = None
+        self.current_game = None
+        self.current_players = set()
+        self.game_count = 0
+        self.stats_count = 0
+        self.started = time.time()
+
+        if options['path'] == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+            self.import_rows(self.read(stream, fmt))
+        else:
+            with open(options['path'], encoding='utf-8', newline='') as stream:
+                self.import_rows(self.read(stream, fmt))
+
+        self.flush()
+        elapsed = time.time() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            "Imported %d games and %d stats rows in %.1fs (%s rows/s)." % (
+                self.game_count, self.stats_count, elapsed, self.rate(elapsed))))
+
+    def read(self, stream, fmt):
+        if fmt == 'csv':
+            for lineno, row in enumerate(csv.DictReader(stream), start=2):
+                yield lineno, row
+        else:
+            for lineno, line in enumerate(stream, start=1):
+                if line.strip():
+                    try:
+                        yield lineno, json.loads(line)
+                    except ValueError as e:
+                        raise CommandError("line %d: %s" % (lineno, e))
+
+    def import_rows(self, rows):
+        for lineno, row in rows:
+            try:
+                self.import_row(row)
+            except (KeyError, ValueError) as e:
+                raise CommandError("line %d: %s" % (lineno, e))
+            if len(self.pending_stats) >= self.batch_size:
+                self.flush()
+
+    def import_row(self, row):
+        key = (self.parse_date(row['game_date']), row['rival'])
+        if key != self.current_key:
+            self.current_key = key
+            self.current_players = set()
+            self.current_game = Game(
+                rival_id=self.lookup(self.rivals, Rival, row['rival']),
+                rival_name=row['rival'],
+                field=row.get('field') or '',
+                game_date=key[0],
+                point_gain=self.number(row, 'point_gain'),
+                point_reduce=self.number(row, 'point_reduce'),
+                remark=row.get('game_remark') or '')
+            self.pending_games.append(self.current_game)
+
+        name = row.get('player')
+        if not name:
+            return
+        player_id = self.lookup(self.players, Player, name)
+        if player_id in self.current_players:
+            raise ValueError("duplicate stats for %s in the same game" % name)
+        self.current_players.add(player_id)
+
+        stats = Stats(player_id=player_id, remark=row.get('remark') or '')
+        for field in STATS_FIELDS:
+            setattr(stats, field, self.number(row, field))
+        stats.game = self.current_game
+        self.pending_stats.append(stats)
+
+    def flush(self):
+        if not self.pending_games and not self.pending_stats:
+            return
+        with transaction.atomic():
+            self.game_service.bulk_save(self.pending_games)
+            for stats in self.pending_stats:
+                # bulk_create 後に採番された試合の id を反映する
+                stats.game_id = stats.game.pk
+            self.stats_service.bulk_save(self.pending_stats)
+
+        self.game_count += len(self.pending_games)
+        self.stats_count += len(self.pending_stats)
+        self.pending_games = []
+        self.pending_stats = []
+        elapsed = time.time() - self.started
+        self.stdout.write("%d stats rows (%s rows/s)" % (self.stats_count, self.rate(elapsed)))
+
+    def lookup(self, table, model, name):
+        if name in table:
+            return table[name]
+        if not self.create_missing:
+            raise ValueError("unknown %s: %s (use --create-missing)" % (model._meta.model_name, name))
+        if model is Rival:
+            obj = Rival.objects.create(team_name=name, home='')
+        else:
+            obj = Player.objects.create(name=name, sebango=0)
+        table[name] = obj.pk
+        return obj.pk
+
+    @staticmethod
+    def parse_date(value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError("invalid game_date: %s" % value)
+            parsed = datetime(day.year, day.month, day.day)
+        return parsed
+
+    @staticmethod
+    def number(row, name):
+        value = row.get(name)
+        if value in (None, ''):
+            return 0
+        return int(value)
+
+    def rate(self, elapsed):
+        if elapsed <= 0:
+            return "-"
+        return "%.0f" % (self.stats_count / elapsed)
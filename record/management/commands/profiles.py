@@ -0,0 +1,53 @@
+import json
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from record.profiling import list_profiles, profile_dir, profile_paths
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+
+class Command(BaseCommand):
+    help = ("List the request profiles captured with ?_profile=1, "
+            "or summarize one of them when its id is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_id', nargs='?')
+        parser.add_argument('--sort', choices=SORT_KEYS, default='cumulative')
+        parser.add_argument('--limit', type=int, default=25, help="Functions to show.")
+
+    def handle(self, *args, **options):
+        if options['profile_id']:
+            self.summarize(options['profile_id'], options['sort'], options['limit'])
+            return
+
+        profiles = list_profiles()
+        if not profiles:
+            self.stdout.write("No profiles in %s." % profile_dir())
+            return
+        for meta in profiles:
+            self.stdout.write("%(id)s  %(created)s  %(status)d  %(total_ms)8.1f ms  %(method)s %(path)s" % meta)
+
+    def summarize(self, profile_id, sort, limit):
+        try:
+            paths = profile_paths(profile_id)
+            stats = pstats.Stats(paths['prof'], stream=self.stdout)
+        except (ValueError, OSError) as e:
+            raise CommandError(str(e))
+
+        # 重い折りたたみスタック (フレームグラフの太い枝)。数はサンプル数
+        with open(paths['json']) as f:
+            interval = json.load(f).get('sample_interval_ms')
+        with open(paths['collapsed']) as f:
+            stacks = [line.rsplit(' ', 1) for line in f.read().splitlines() if line]
+        stacks.sort(key=lambda stack: int(stack[1]), reverse=True)
+        if interval:
+            self.stdout.write("Heaviest stacks (samples, one every %g ms):" % interval)
+        else:
+            self.stdout.write("Heaviest stacks (samples):")
+        for stack, samples in stacks[:5]:
+            self.stdout.write("%10s  %s" % (samples, ' <- '.join(reversed(stack.split(';')[-3:]))))
+        self.stdout.write("Files: %s" % ', '.join(paths.values()))
+
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from record.models import PlayerCareerTotals, RivalRecord, PlayerSeasonTotals, RivalSeasonRecord, \
+    PlayerCumulativeTotals, RivalCumulativeRecord
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized aggregate tables from scratch and verify them."
+
+    aggregates = (
+        ("player career totals", PlayerCareerTotals),
+        ("rival records", RivalRecord),
+        ("player season totals", PlayerSeasonTotals),
+        ("rival season records", RivalSeasonRecord),
+        ("player cumulative totals", PlayerCumulativeTotals),
+        ("rival cumulative records", RivalCumulativeRecord),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only', action='store_true',
+            help="Only compare the stored aggregates with a fresh aggregate.")
+
+    def handle(self, *args, **options):
+        errors = []
+        for label, model in self.aggregates:
+            if not options['verify_only']:
+                model.rebuild()
+                self.stdout.write("Rebuilt %d %s." % (model.objects.count(), label))
+
+            broken = model.verify()
+            if broken:
+                errors.append("%s out of date for ids: %s" % (label, broken))
+            else:
+                self.stdout.write(self.style.SUCCESS("%s verified." % label.capitalize()))
+
+        if errors:
+            raise CommandError("\n".join(errors))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from record.slowqueries import reset_slow_queries, threshold_ms, worst_queries
+
+
+class Command(BaseCommand):
+    help = ("List the statement shapes that exceeded RECORD_SLOW_QUERY_MS, "
+            "the families costing the most time first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--order', choices=('total_ms', 'count', 'max_ms'), default='total_ms')
+        parser.add_argument('--plans', action='store_true', help="Show the last EXPLAIN of each statement.")
+        parser.add_argument('--reset', action='store_true', help="Clear the roll-up.")
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_slow_queries()
+            self.stdout.write(self.style.SUCCESS("Slow query log cleared."))
+            return
+
+        rows = worst_queries(options['limit'], options['order'])
+        if not rows:
+            self.stdout.write("No queries over %s ms recorded." % threshold_ms())
+            return
+        for row in rows:
+            self.stdout.write("%(count)6d x  total %(total_ms)10.1f ms  max %(max_ms)8.1f ms  %(last_view)s" % row)
+            self.stdout.write("    %s" % row['fingerprint'])
+            if options['plans'] and row['last_plan']:
+                for line in row['last_plan'].splitlines():
+                    self.stdout.write("      %s" % line)
@@ -0,0 +1,202 @@
+import atexit
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+FLUSH_INTERVAL = 1.0
+# リクエストの中で書き込むので、ロックを長く待たない
+FLUSH_TIMEOUT = 0.25
+
+logger = logging.getLogger('record.metrics')
+
+# family -> (type, help)
+FAMILIES = {
+    'record_requests_total': ('counter', "Requests by URL name and status class."),
+    'record_request_errors_total': ('counter', "Requests answered with a 5xx status."),
+    'record_request_duration_seconds': ('histogram', "Request latency, measured by InstrumentationMiddleware."),
+    'record_request_queries': ('histogram', "Database queries per request."),
+    'record_request_db_seconds_total': ('counter', "Time spent in database queries."),
+    'record_cache_hits_total': ('counter', "Page and aggregate cache hits."),
+    'record_cache_misses_total': ('counter', "Page and aggregate cache misses."),
+    'record_cache_hit_ratio': ('gauge', "Cache hits / (hits + misses) since the store was created."),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+)
+"""
+
+
+def store_path():
+    # 同じ dyno の gunicorn ワーカーで共有できるローカルファイル
+    return getattr(settings, 'RECORD_METRICS_DB', os.path.join(tempfile.gettempdir(), 'record_metrics.sqlite3'))
+
+
+def connect(path=None, timeout=5):
+    db = sqlite3.connect(path or store_path(), timeout=timeout)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=OFF')
+    db.execute(SCHEMA)
+    return db
+
+
+def label_value(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_value(value):
+    return '%d' % value if float(value).is_integer() else repr(float(value))
+
+
+class Buffer:
+    """Per-process counters, added to the shared SQLite store at most once per FLUSH_INTERVAL.
+
+    Every value is a sum, so the workers' flushes simply add up
+    (INSERT ... ON CONFLICT DO UPDATE SET value = value + excluded.value).
+    A flush that fails (store locked or not writable) is logged and its
+    values are kept for the next one; it never fails the request.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.pid = os.getpid()
+        self.last_flush = time.monotonic()
+
+    def add(self, name, labels, amount=1):
+        with self.lock:
+            # fork 後の子プロセスは親の未書き込み分を持ち越さない
+            if self.pid != os.getpid():
+                self.pending, self.pid = {}, os.getpid()
+            key = (name, labels)
+            self.pending[key] = self.pending.get(key, 0) + amount
+
+    def observe(self, name, labels, value, buckets):
+        # 0 のバケットも出さないと histogram_quantile() が正しく計算できない
+        for bound in buckets:
+            self.add(name + '_bucket', '%s,le="%s"' % (labels, format_value(bound)), int(value <= bound))
+        self.add(name + '_bucket', '%s,le="+Inf"' % labels)
+        self.add(name + '_sum', labels, value)
+        self.add(name + '_count', labels)
+
+    def flush(self, force=False):
+        interval = getattr(settings, 'RECORD_METRICS_FLUSH_INTERVAL', FLUSH_INTERVAL)
+        with self.lock:
+            if not self.pending or (not force and time.monotonic() - self.last_flush < interval):
+                return
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        try:
+            db = connect(timeout=FLUSH_TIMEOUT)
+            try:
+                with db:
+                    db.executemany(
+                        'INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) '
+                        'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                        [(name, labels, value) for (name, labels), value in pending.items()])
+            finally:
+                db.close()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning('metrics flush to %s failed: %s', store_path(), e)
+            # キーの数は決まっているので、戻しても増え続けない
+            with self.lock:
+                for key, value in pending.items():
+                    self.pending[key] = self.pending.get(key, 0) + value
+
+
+_buffer = Buffer()
+atexit.register(lambda: _buffer.flush(force=True))
+
+
+def record_request(view, status, metrics):
+    """Add one request measured by InstrumentationMiddleware to the aggregates."""
+    if not getattr(settings, 'RECORD_METRICS', True):
+        return
+    labels = 'view="%s"' % label_value(view)
+    _buffer.add('record_requests_total', '%s,status="%dxx"' % (labels, status // 100))
+    if status >= 500:
+        _buffer.add('record_request_errors_total', labels)
+    _buffer.observe('record_request_duration_seconds', labels, metrics.total, DURATION_BUCKETS)
+    _buffer.observe('record_request_queries', labels, metrics.db_queries, QUERY_BUCKETS)
+    _buffer.add('record_request_db_seconds_total', labels, metrics.db_time)
+    _buffer.add('record_cache_hits_total', labels, metrics.cache_hits)
+    _buffer.add('record_cache_misses_total', labels, metrics.cache_misses)
+    _buffer.flush()
+
+
+def family_of(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def sort_key(row):
+    name, labels, _ = row
+    # ヒストグラムのバケットは le の数値順に並べる
+    le = labels.rsplit('le="', 1)[1][:-1] if name.endswith('_bucket') else None
+    bound = float('inf') if le == '+Inf' else float(le) if le else 0.0
+    return (family_of(name), labels.rsplit(',le="', 1)[0], name, bound)
+
+
+def render(rows):
+    """Prometheus text exposition of the (name, labels, value) rows."""
+    rows = list(rows)
+    hits = {labels: value for name, labels, value in rows if name == 'record_cache_hits_total'}
+    misses = {labels: value for name, labels, value in rows if name == 'record_cache_misses_total'}
+    for labels in set(hits) | set(misses):
+        total = hits.get(labels, 0) + misses.get(labels, 0)
+        if total:
+            rows.append(('record_cache_hit_ratio', labels, hits.get(labels, 0) / total))
+
+    lines, family = [], None
+    for name, labels, value in sorted(rows, key=sort_key):
+        if family_of(name) != family:
+            family = family_of(name)
+            kind, text = FAMILIES.get(family, ('untyped', ''))
+            lines.append('# HELP %s %s' % (family, text))
+            lines.append('# TYPE %s %s' % (family, kind))
+        lines.append('%s{%s} %s' % (name, labels, format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def read_store():
+    db = connect()
+    try:
+        return db.execute('SELECT name, labels, value FROM samples').fetchall()
+    finally:
+        db.close()
+
+
+def authorized(request):
+    # トークンを設定したときは Bearer トークンかスタッフだけが見られる
+    token = getattr(settings, 'RECORD_METRICS_TOKEN', None)
+    if not token:
+        return True
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if header.startswith('Bearer ') and constant_time_compare(header[7:], token):
+        return True
+    return request.user.is_staff
+
+
+@require_GET
+def metrics_view(request):
+    if not authorized(request):
+        return HttpResponseForbidden()
+    _buffer.flush(force=True)
+    return HttpResponse(render(read_store()), content_type=CONTENT_TYPE)
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def build_career_totals(apps, schema_editor):
+    Player = apps.get_model('record', 'Player')
+    PlayerCareerTotals = apps.get_model('record', 'PlayerCareerTotals')
+    players = Player.objects.annotate(
+        appearances=Count('player'),
+        goals=Sum('player__goals'),
+        assists=Sum('player__assists'),
+        passes=Sum('player__passes'),
+        intercepts=Sum('player__intercepts'),
+        dribbles=Sum('player__dribbles'),
+        tuckles=Sum('player__tuckles'),
+    )
+    PlayerCareerTotals.objects.bulk_create([
+        PlayerCareerTotals(
+            player_id=p.pk,
+            appearances=p.appearances,
+            goals=p.goals or 0,
+            assists=p.assists or 0,
+            passes=p.passes or 0,
+            intercepts=p.intercepts or 0,
+            dribbles=p.dribbles or 0,
+            tuckles=p.tuckles or 0,
+        ) for p in players
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0011_auto_20180704_1354'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerCareerTotals',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appearances', models.IntegerField(default=0)),
+                ('goals', models.IntegerField(default=0)),
+                ('assists', models.IntegerField(default=0)),
+                ('passes', models.IntegerField(default=0)),
+                ('intercepts', models.IntegerField(default=0)),
+                ('dribbles', models.IntegerField(default=0)),
+                ('tuckles', models.IntegerField(default=0)),
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='career_totals', to='record.player')),
+            ],
+        ),
+        migrations.RunPython(build_career_totals, migrations.RunPython.noop),
+    ]
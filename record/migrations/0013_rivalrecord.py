@@ -0,0 +1,54 @@
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Q, Sum
+import django.db.models.deletion
+
+
+def build_rival_records(apps, schema_editor):
+    Rival = apps.get_model('record', 'Rival')
+    RivalRecord = apps.get_model('record', 'RivalRecord')
+    rivals = Rival.objects.annotate(
+        played=Count('rival'),
+        won=Count('rival', filter=Q(rival__point_gain__gt=F('rival__point_reduce'))),
+        lost=Count('rival', filter=Q(rival__point_gain__lt=F('rival__point_reduce'))),
+        drawn=Count('rival', filter=Q(rival__point_gain=F('rival__point_reduce'))),
+        goals_for=Sum('rival__point_gain'),
+        goals_against=Sum('rival__point_reduce'),
+        last_played=Max('rival__game_date'),
+    )
+    RivalRecord.objects.bulk_create([
+        RivalRecord(
+            rival_id=r.pk,
+            played=r.played,
+            won=r.won,
+            lost=r.lost,
+            drawn=r.drawn,
+            goals_for=r.goals_for or 0,
+            goals_against=r.goals_against or 0,
+            last_played=r.last_played,
+        ) for r in rivals
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0012_playercareertotals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RivalRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('played', models.IntegerField(default=0)),
+                ('won', models.IntegerField(default=0)),
+                ('lost', models.IntegerField(default=0)),
+                ('drawn', models.IntegerField(default=0)),
+                ('goals_for', models.IntegerField(default=0)),
+                ('goals_against', models.IntegerField(default=0)),
+                ('last_played', models.DateTimeField(blank=True, null=True)),
+                ('rival', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='head_to_head', to='record.rival')),
+            ],
+        ),
+        migrations.RunPython(build_rival_records, migrations.RunPython.noop),
+    ]
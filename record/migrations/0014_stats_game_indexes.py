@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_stats(apps, schema_editor):
+    """Stop before adding the constraint if a player has several Stats rows for one game.
+
+    Which row is right cannot be told here, so nothing is deleted: the
+    pairs are listed and have to be fixed by hand before migrating again.
+    """
+    Stats = apps.get_model('record', 'Stats')
+    duplicates = list(Stats.objects.values('game_id', 'player_id')
+                      .annotate(ids=Count('id')).filter(ids__gt=1)
+                      .order_by('game_id', 'player_id'))
+    if not duplicates:
+        return
+    lines = []
+    for d in duplicates:
+        ids = Stats.objects.filter(game_id=d['game_id'], player_id=d['player_id']) \
+            .order_by('id').values_list('id', flat=True)
+        lines.append('  game=%d player=%d stats ids=%s' % (d['game_id'], d['player_id'], ', '.join(map(str, ids))))
+    raise RuntimeError(
+        "record_stats has %d duplicate (game, player) pairs; delete the extra rows "
+        "and run migrate again:\n%s" % (len(duplicates), '\n'.join(lines)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0013_rivalrecord'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['rival', 'game_date'], name='record_game_rival_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stats',
+            index=models.Index(fields=['player', 'game'], name='record_stats_player_game_idx'),
+        ),
+        migrations.RunPython(check_duplicate_stats, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='stats',
+            constraint=models.UniqueConstraint(fields=('game', 'player'), name='record_stats_unique_game_player'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0014_stats_game_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Season',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+            ],
+            options={
+                'ordering': ['-start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RivalSeasonRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('played', models.IntegerField(default=0)),
+                ('won', models.IntegerField(default=0)),
+                ('lost', models.IntegerField(default=0)),
+                ('drawn', models.IntegerField(default=0)),
+                ('goals_for', models.IntegerField(default=0)),
+                ('goals_against', models.IntegerField(default=0)),
+                ('rival', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='season_records', to='record.rival')),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rival_records', to='record.season')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlayerSeasonTotals',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appearances', models.IntegerField(default=0)),
+                ('goals', models.IntegerField(default=0)),
+                ('assists', models.IntegerField(default=0)),
+                ('passes', models.IntegerField(default=0)),
+                ('intercepts', models.IntegerField(default=0)),
+                ('dribbles', models.IntegerField(default=0)),
+                ('tuckles', models.IntegerField(default=0)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='season_totals', to='record.player')),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='player_totals', to='record.season')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rivalseasonrecord',
+            constraint=models.UniqueConstraint(fields=('season', 'rival'), name='record_rival_season_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='playerseasontotals',
+            constraint=models.UniqueConstraint(fields=('season', 'player'), name='record_player_season_unique'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+STATS_FIELDS = ('goals', 'assists', 'passes', 'intercepts', 'dribbles', 'tuckles')
+
+
+def build_cumulative_totals(apps, schema_editor):
+    Stats = apps.get_model('record', 'Stats')
+    Game = apps.get_model('record', 'Game')
+    PlayerCumulativeTotals = apps.get_model('record', 'PlayerCumulativeTotals')
+    RivalCumulativeRecord = apps.get_model('record', 'RivalCumulativeRecord')
+
+    rows, current, totals = [], None, None
+    stats = Stats.objects.order_by('player_id', 'game__game_date', 'game_id').values_list(
+        'player_id', 'game_id', 'game__game_date', *STATS_FIELDS)
+    for player_id, game_id, game_date, *values in stats.iterator():
+        if player_id != current:
+            current, totals = player_id, [0] * (len(STATS_FIELDS) + 1)
+        totals = [t + v for t, v in zip(totals, [1] + values)]
+        rows.append(PlayerCumulativeTotals(
+            player_id=player_id, game_id=game_id, game_date=game_date,
+            **dict(zip(('appearances',) + STATS_FIELDS, totals))))
+    PlayerCumulativeTotals.objects.bulk_create(rows, batch_size=1000)
+
+    rows, current, totals = [], None, None
+    games = Game.objects.order_by('rival_id', 'game_date', 'id').values_list(
+        'rival_id', 'id', 'game_date', 'point_gain', 'point_reduce')
+    for rival_id, game_id, game_date, gain, reduce in games.iterator():
+        if rival_id != current:
+            current, totals = rival_id, [0] * 6
+        values = [1, int(gain > reduce), int(gain < reduce), int(gain == reduce), gain, reduce]
+        totals = [t + v for t, v in zip(totals, values)]
+        rows.append(RivalCumulativeRecord(
+            rival_id=rival_id, game_id=game_id, game_date=game_date,
+            **dict(zip(('played', 'won', 'lost', 'drawn', 'goals_for', 'goals_against'), totals))))
+    RivalCumulativeRecord.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0015_season'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RivalCumulativeRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_date', models.DateTimeField()),
+                ('played', models.IntegerField(default=0)),
+                ('won', models.IntegerField(default=0)),
+                ('lost', models.IntegerField(default=0)),
+                ('drawn', models.IntegerField(default=0)),
+                ('goals_for', models.IntegerField(default=0)),
+                ('goals_against', models.IntegerField(default=0)),
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rival_cumulative_record', to='record.game')),
+                ('rival', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cumulative_records', to='record.rival')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['rival', 'game_date', 'game'], name='record_rival_cum_seek_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerCumulativeTotals',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_date', models.DateTimeField()),
+                ('appearances', models.IntegerField(default=0)),
+                ('goals', models.IntegerField(default=0)),
+                ('assists', models.IntegerField(default=0)),
+                ('passes', models.IntegerField(default=0)),
+                ('intercepts', models.IntegerField(default=0)),
+                ('dribbles', models.IntegerField(default=0)),
+                ('tuckles', models.IntegerField(default=0)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='player_cumulative_totals', to='record.game')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cumulative_totals', to='record.player')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['player', 'game_date', 'game'], name='record_player_cum_seek_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='playercumulativetotals',
+            constraint=models.UniqueConstraint(fields=('player', 'game'), name='record_player_cum_unique'),
+        ),
+        migrations.RunPython(build_cumulative_totals, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,9 @@
-from django.db import models
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import dateformat
 
 
@@ -6,32 +11,86 @@ WIN = "WIN"
 LOSE = "LOSE"
 EVEN = "EVEN"
 
+STATS_FIELDS = ('goals', 'assists', 'passes', 'intercepts', 'dribbles', 'tuckles')
+GAME_TRACKED_FIELDS = ('rival_id', 'game_date', 'point_gain', 'point_reduce')
+
 # Create your models here.
 
 
+class RivalQuerySet(models.QuerySet):
+
+    def with_hoshitori(self):
+        # 勝敗数を1クエリで集計する (Rival.hoshitori が参照する)
+        return self.annotate(
+            won_count=Count('rival', filter=Q(rival__point_gain__gt=F('rival__point_reduce'))),
+            lose_count=Count('rival', filter=Q(rival__point_gain__lt=F('rival__point_reduce'))),
+            even_count=Count('rival', filter=Q(rival__point_gain=F('rival__point_reduce'))),
+        )
+
+    def with_head_to_head(self):
+        return self.with_hoshitori().annotate(
+            played_count=Count('rival'),
+            goals_for_total=Coalesce(Sum('rival__point_gain'), Value(0)),
+            goals_against_total=Coalesce(Sum('rival__point_reduce'), Value(0)),
+            last_played_at=Max('rival__game_date'),
+        )
+
+    def with_season_record(self, season):
+        # シーズン集計の行から勝敗数を読む (試合がない対戦相手は含まない)
+        return self.filter(season_records__season=season).annotate(
+            won_count=F('season_records__won'),
+            lose_count=F('season_records__lost'),
+            even_count=F('season_records__drawn'),
+        )
+
+
 class Rival(models.Model):
     team_name = models.CharField(max_length=200, unique=True)
     home = models.CharField(max_length=200)
     remark = models.TextField(blank=True)
 
+    objects = RivalQuerySet.as_manager()
+
     def __str__(self):
         return self.team_name
 
     def hoshitori(self):
+        if hasattr(self, 'won_count'):
+            return self.won_count, self.lose_count, self.even_count
+        record = self.get_head_to_head()
+        if record is not None:
+            return record.won, record.lost, record.drawn
+
         games = Game.objects.filter(rival=self)
         won = 0
         lose = 0
         even = 0
         for g in games:
-            if g.result() == WIN:
+            result = g.result()
+            if result == WIN:
                 won += 1
-            elif g.result() == LOSE:
+            elif result == LOSE:
                 lose += 1
-            elif g.result() == EVEN:
+            elif result == EVEN:
                 even += 1
 
+        self.won_count, self.lose_count, self.even_count = won, lose, even
         return won, lose, even
 
+    def get_head_to_head(self):
+        try:
+            return self.head_to_head
+        except RivalRecord.DoesNotExist:
+            return None
+
+    def game_summary(self):
+        record = self.get_head_to_head()
+        if record is None:
+            record = RivalRecord.from_annotated(Rival.objects.with_head_to_head().get(pk=self.pk))
+        return {'game_counts': record.played,
+                'points': record.goals_for,
+                'reduces': record.goals_against}
+
     def wins(self):
         return self.hoshitori()[0]
 
@@ -70,6 +129,30 @@ class Game(models.Model):
     point_reduce = models.IntegerField()
     remark = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['rival', 'game_date'], name='record_game_rival_date_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 更新・削除時に対戦成績の差分を出すため、読み込んだ値を保持する
+        if all(name in field_names for name in GAME_TRACKED_FIELDS):
+            instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+    def game_values(self):
+        return {name: getattr(self, name) for name in GAME_TRACKED_FIELDS}
+
     def __str__(self):
         s = dateformat.format(self.game_date, 'Y/n/d') + \
             " " + self.rival.team_name
@@ -100,11 +183,34 @@ class Game(models.Model):
         return game
 
 
+class PlayerQuerySet(models.QuerySet):
+
+    def with_career_totals(self):
+        # 通算成績を1クエリで集計する (Player.goals などが参照する)
+        return self.annotate(
+            games_total=Count('player'),
+            goals_total=Coalesce(Sum('player__goals'), Value(0)),
+            assists_total=Coalesce(Sum('player__assists'), Value(0)),
+            passes_total=Coalesce(Sum('player__passes'), Value(0)),
+            intercepts_total=Coalesce(Sum('player__intercepts'), Value(0)),
+            dribbles_total=Coalesce(Sum('player__dribbles'), Value(0)),
+            tuckles_total=Coalesce(Sum('player__tuckles'), Value(0)),
+        )
+
+    def with_season_totals(self, season):
+        # シーズン集計の行から成績を読む (出場がない選手は含まない)
+        params = {name + '_total': F('season_totals__' + name) for name in STATS_FIELDS}
+        return self.filter(season_totals__season=season).annotate(
+            games_total=F('season_totals__appearances'), **params)
+
+
 class Player(models.Model):
     name = models.CharField(max_length=200, unique=True)
     sebango = models.IntegerField()
     remark = models.TextField(blank=True)
 
+    objects = PlayerQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -115,41 +221,43 @@ class Player(models.Model):
             self.stats = Stats.objects.filter(player=self)
         return self.stats
 
+    def _career_total(self, name):
+        annotated = getattr(self, name + '_total', None)
+        if annotated is not None:
+            return annotated
+        try:
+            totals = self.career_totals
+        except PlayerCareerTotals.DoesNotExist:
+            totals = None
+        if totals is not None:
+            return totals.appearances if name == 'games' else getattr(totals, name)
+        if name == 'games':
+            return len(self.get_stats())
+        return sum(getattr(s, name) for s in self.get_stats())
+
     def goals(self):
-        goals = 0
-        for s in self.get_stats():
-            goals += s.goals
-        return goals
+        return self._career_total('goals')
 
     def assists(self):
-        assists = 0
-        for s in self.get_stats():
-            assists += s.assists
-        return assists
+        return self._career_total('assists')
 
     def games(self):
-        games = 0
-        for s in self.get_stats():
-            games += 1
-        return games
+        return self._career_total('games')
 
     def intercepts(self):
-        intercepts = 0
-        for s in self.get_stats():
-            intercepts += s.intercepts
-        return intercepts
+        return self._career_total('intercepts')
 
     def dribbles(self):
-        dribbles = 0
-        for s in self.get_stats():
-            dribbles += s.dribbles
-        return dribbles
+        return self._career_total('dribbles')
 
     def tuckles(self):
-        tuckles = 0
-        for s in self.get_stats():
-            tuckles += s.tuckles
-        return tuckles
+        return self._career_total('tuckles')
+
+    def career_summary(self):
+        summary = {'games': self.games()}
+        for name in STATS_FIELDS:
+            summary[name] = self._career_total(name)
+        return summary
 
 
 class Stats(models.Model):
@@ -163,6 +271,34 @@ class Stats(models.Model):
     tuckles = models.IntegerField(default=0)
     remark = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['player', 'game'], name='record_stats_player_game_idx'),
+        ]
+        # (game, player) の索引は一意制約が兼ねる
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'player'], name='record_stats_unique_game_player'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 更新・削除時に通算成績の差分を出すため、読み込んだ値を保持する
+        if all(name in field_names for name in STATS_FIELDS + ('game_id', 'player_id')):
+            instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+    def stats_values(self):
+        return {name: getattr(self, name) for name in STATS_FIELDS}
+
     def __str__(self):
         g = self.game
         p = self.player
@@ -180,3 +316,592 @@ class Stats(models.Model):
                     tuckles=params['tuckles'],
                     remark=params['remark'])
         return stats
+
+
+class PlayerCareerTotals(models.Model):
+    player = models.OneToOneField(Player, related_name="career_totals", on_delete=models.CASCADE)
+    appearances = models.IntegerField(default=0)
+    goals = models.IntegerField(default=0)
+    assists = models.IntegerField(default=0)
+    passes = models.IntegerField(default=0)
+    intercepts = models.IntegerField(default=0)
+    dribbles = models.IntegerField(default=0)
+    tuckles = models.IntegerField(default=0)
+
+    def __str__(self):
+        return ''.join(["CareerTotals (", str(self.player_id), " g:", str(self.goals), " a:", str(self.assists), ")"])
+
+    @classmethod
+    def apply(cls, player_id, values, appearances=0):
+        """Add ``values`` (a dict of stats deltas) to the player's row."""
+        params = {name: F(name) + values.get(name, 0) for name in STATS_FIELDS}
+        params['appearances'] = F('appearances') + appearances
+        updated = cls.objects.filter(player_id=player_id).update(**params)
+        if not updated and appearances >= 0:
+            # 行がない (初期化前の選手など) 場合は集計し直す
+            # 出場を減らす場合は選手ごと削除中のことがあるので何もしない
+            cls.rebuild([player_id])
+
+    @classmethod
+    def apply_many(cls, stats_list, sign=1):
+        """Add (sign=1) or remove (sign=-1) many Stats rows with one read and one write."""
+        deltas = {}
+        for stats in stats_list:
+            delta = deltas.setdefault(stats.player_id, dict.fromkeys(STATS_FIELDS + ('appearances',), 0))
+            delta['appearances'] += sign
+            for name in STATS_FIELDS:
+                delta[name] += sign * getattr(stats, name)
+        if not deltas:
+            return
+
+        with transaction.atomic():
+            rows = list(cls.objects.select_for_update().filter(player_id__in=deltas))
+            for row in rows:
+                for name, value in deltas.pop(row.player_id).items():
+                    setattr(row, name, getattr(row, name) + value)
+            cls.objects.bulk_update(rows, STATS_FIELDS + ('appearances',))
+        if deltas and sign > 0:
+            # 行がない選手は集計し直す
+            cls.rebuild(list(deltas))
+
+    @classmethod
+    def rebuild(cls, player_ids=None):
+        players = Player.objects.with_career_totals()
+        if player_ids is not None:
+            players = players.filter(pk__in=player_ids)
+        with transaction.atomic():
+            targets = cls.objects.all()
+            if player_ids is not None:
+                targets = targets.filter(player_id__in=player_ids)
+            targets.delete()
+            cls.objects.bulk_create([cls.from_annotated(p) for p in players])
+
+    @classmethod
+    def from_annotated(cls, player):
+        totals = cls(player_id=player.pk, appearances=player.games_total)
+        for name in STATS_FIELDS:
+            setattr(totals, name, getattr(player, name + '_total'))
+        return totals
+
+    @classmethod
+    def verify(cls):
+        """Return the ids of players whose row differs from a fresh aggregate."""
+        stored = {t.player_id: t for t in cls.objects.all()}
+        broken = []
+        for player in Player.objects.with_career_totals().order_by('id'):
+            expected = cls.from_annotated(player)
+            actual = stored.get(player.pk)
+            if actual is None or actual.as_dict() != expected.as_dict():
+                broken.append(player.pk)
+        return broken
+
+    @classmethod
+    def squad_averages(cls):
+        """Per-appearance averages over the whole squad, read from the totals rows."""
+        params = {name: Coalesce(Sum(name), Value(0)) for name in STATS_FIELDS}
+        totals = cls.objects.aggregate(appearances=Coalesce(Sum('appearances'), Value(0)), **params)
+        appearances = totals.pop('appearances')
+        if appearances == 0:
+            return dict(totals, games=0)
+        avgs = {name: value / appearances for name, value in totals.items()}
+        avgs['games'] = 1
+        return avgs
+
+    def as_dict(self):
+        dic = {name: getattr(self, name) for name in STATS_FIELDS}
+        dic['appearances'] = self.appearances
+        return dic
+
+
+class RivalRecord(models.Model):
+    rival = models.OneToOneField(Rival, related_name="head_to_head", on_delete=models.CASCADE)
+    played = models.IntegerField(default=0)
+    won = models.IntegerField(default=0)
+    lost = models.IntegerField(default=0)
+    drawn = models.IntegerField(default=0)
+    goals_for = models.IntegerField(default=0)
+    goals_against = models.IntegerField(default=0)
+    last_played = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return ''.join(["RivalRecord (", str(self.rival_id), " ", str(self.won), "-", str(self.lost), "-", str(self.drawn), ")"])
+
+    @classmethod
+    def apply(cls, values, sign=1):
+        """Add (sign=1) or remove (sign=-1) one game given as ``Game.game_values()``."""
+        gain, reduce = values['point_gain'], values['point_reduce']
+        params = {
+            'played': F('played') + sign,
+            'won': F('won') + (sign if gain > reduce else 0),
+            'lost': F('lost') + (sign if gain < reduce else 0),
+            'drawn': F('drawn') + (sign if gain == reduce else 0),
+            'goals_for': F('goals_for') + sign * gain,
+            'goals_against': F('goals_against') + sign * reduce,
+        }
+        if sign > 0:
+            params['last_played'] = Greatest(Coalesce('last_played', Value(values['game_date'])), Value(values['game_date']))
+        else:
+            latest = Game.objects.filter(rival_id=OuterRef('rival_id')).order_by('-game_date')
+            params['last_played'] = Subquery(latest.values('game_date')[:1])
+        updated = cls.objects.filter(rival_id=values['rival_id']).update(**params)
+        if not updated and sign > 0:
+            # 行がない (初期化前の対戦相手など) 場合は集計し直す
+            # 試合を減らす場合は対戦相手ごと削除中のことがあるので何もしない
+            cls.rebuild([values['rival_id']])
+
+    @classmethod
+    def apply_many(cls, games):
+        """Add many new games with one read and one write."""
+        deltas = {}
+        for game in games:
+            delta = deltas.setdefault(game.rival_id, dict.fromkeys(
+                ('played', 'won', 'lost', 'drawn', 'goals_for', 'goals_against'), 0))
+            delta['played'] += 1
+            result = game.result()
+            delta['won' if result == WIN else 'lost' if result == LOSE else 'drawn'] += 1
+            delta['goals_for'] += game.point_gain
+            delta['goals_against'] += game.point_reduce
+            last = delta.get('last_played')
+            delta['last_played'] = game.game_date if last is None else max(last, game.game_date)
+        if not deltas:
+            return
+
+        with transaction.atomic():
+            rows = list(cls.objects.select_for_update().filter(rival_id__in=deltas))
+            for row in rows:
+                delta = deltas.pop(row.rival_id)
+                last = delta.pop('last_played')
+                for name, value in delta.items():
+                    setattr(row, name, getattr(row, name) + value)
+                row.last_played = last if row.last_played is None else max(row.last_played, last)
+            cls.objects.bulk_update(rows, ('played', 'won', 'lost', 'drawn',
+                                           'goals_for', 'goals_against', 'last_played'))
+        if deltas:
+            # 行がない対戦相手は集計し直す
+            cls.rebuild(list(deltas))
+
+    @classmethod
+    def rebuild(cls, rival_ids=None):
+        rivals = Rival.objects.with_head_to_head()
+        if rival_ids is not None:
+            rivals = rivals.filter(pk__in=rival_ids)
+        with transaction.atomic():
+            targets = cls.objects.all()
+            if rival_ids is not None:
+                targets = targets.filter(rival_id__in=rival_ids)
+            targets.delete()
+            cls.objects.bulk_create([cls.from_annotated(r) for r in rivals])
+
+    @classmethod
+    def from_annotated(cls, rival):
+        return cls(rival_id=rival.pk,
+                   played=rival.played_count,
+                   won=rival.won_count,
+                   lost=rival.lose_count,
+                   drawn=rival.even_count,
+                   goals_for=rival.goals_for_total,
+                   goals_against=rival.goals_against_total,
+                   last_played=rival.last_played_at)
+
+    @classmethod
+    def verify(cls):
+        """Return the ids of rivals whose row differs from a fresh aggregate."""
+        stored = {r.rival_id: r for r in cls.objects.all()}
+        broken = []
+        for rival in Rival.objects.with_head_to_head().order_by('id'):
+            expected = cls.from_annotated(rival)
+            actual = stored.get(rival.pk)
+            if actual is None or actual.as_dict() != expected.as_dict():
+                broken.append(rival.pk)
+        return broken
+
+    def as_dict(self):
+        return {'played': self.played,
+                'won': self.won,
+                'lost': self.lost,
+                'drawn': self.drawn,
+                'goals_for': self.goals_for,
+                'goals_against': self.goals_against,
+                'last_played': self.last_played}
+
+
+class Season(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+    start = models.DateField()
+    end = models.DateField()
+
+    class Meta:
+        ordering = ['-start']
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if self.start and self.end:
+            if self.start > self.end:
+                raise ValidationError("シーズンの開始日が終了日より後になっています")
+            overlaps = Season.objects.filter(start__lte=self.end, end__gte=self.start).exclude(pk=self.pk)
+            if overlaps.exists():
+                raise ValidationError("他のシーズンと期間が重なっています")
+
+    def date_range(self):
+        # 終了日はその日を含める
+        return (datetime(self.start.year, self.start.month, self.start.day),
+                datetime(self.end.year, self.end.month, self.end.day) + timedelta(days=1))
+
+    def game_filter(self, prefix=''):
+        start, end = self.date_range()
+        return Q(**{prefix + 'game_date__gte': start, prefix + 'game_date__lt': end})
+
+    @classmethod
+    def covering(cls, dates):
+        condition = Q()
+        for date in set(d.date() if isinstance(d, datetime) else d for d in dates):
+            condition |= Q(start__lte=date, end__gte=date)
+        if not condition:
+            return cls.objects.none()
+        return cls.objects.filter(condition)
+
+    @classmethod
+    def refresh(cls, dates, player_ids=(), rival_ids=()):
+        """Rebuild the rollup rows of the given players and rivals in every season
+        that contains one of ``dates``."""
+        if not player_ids and not rival_ids:
+            return
+        for season in cls.covering(dates):
+            if player_ids:
+                PlayerSeasonTotals.rebuild(season, player_ids)
+            if rival_ids:
+                RivalSeasonRecord.rebuild(season, rival_ids)
+
+    def rebuild_rollups(self):
+        PlayerSeasonTotals.rebuild(self)
+        RivalSeasonRecord.rebuild(self)
+
+
+class PlayerSeasonTotals(models.Model):
+    season = models.ForeignKey(Season, related_name="player_totals", on_delete=models.CASCADE)
+    player = models.ForeignKey(Player, related_name="season_totals", on_delete=models.CASCADE)
+    appearances = models.IntegerField(default=0)
+    goals = models.IntegerField(default=0)
+    assists = models.IntegerField(default=0)
+    passes = models.IntegerField(default=0)
+    intercepts = models.IntegerField(default=0)
+    dribbles = models.IntegerField(default=0)
+    tuckles = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['season', 'player'], name='record_player_season_unique'),
+        ]
+
+    def __str__(self):
+        return ''.join(["SeasonTotals (", str(self.season_id), " ", str(self.player_id), " g:", str(self.goals), ")"])
+
+    @classmethod
+    def aggregate(cls, season, player_ids=None):
+        stats = Stats.objects.filter(season.game_filter('game__'))
+        if player_ids is not None:
+            stats = stats.filter(player_id__in=player_ids)
+        params = {name + '_total': Sum(name) for name in STATS_FIELDS}
+        rows = stats.values('player_id').annotate(appearances=Count('id'), **params).order_by('player_id')
+        return [cls(season_id=season.pk, player_id=row['player_id'], appearances=row['appearances'],
+                    **{name: row[name + '_total'] for name in STATS_FIELDS}) for row in rows]
+
+    @classmethod
+    def rebuild(cls, season=None, player_ids=None):
+        if season is None:
+            for season in Season.objects.all():
+                cls.rebuild(season)
+            return
+        with transaction.atomic():
+            targets = cls.objects.filter(season=season)
+            if player_ids is not None:
+                targets = targets.filter(player_id__in=player_ids)
+            targets.delete()
+            cls.objects.bulk_create(cls.aggregate(season, player_ids))
+
+    @classmethod
+    def verify(cls):
+        """Return the (season id, player id) pairs that differ from a fresh aggregate."""
+        return _verify_rollups(cls, 'player_id')
+
+    def as_dict(self):
+        dic = {name: getattr(self, name) for name in STATS_FIELDS}
+        dic['appearances'] = self.appearances
+        return dic
+
+
+class RivalSeasonRecord(models.Model):
+    season = models.ForeignKey(Season, related_name="rival_records", on_delete=models.CASCADE)
+    rival = models.ForeignKey(Rival, related_name="season_records", on_delete=models.CASCADE)
+    played = models.IntegerField(default=0)
+    won = models.IntegerField(default=0)
+    lost = models.IntegerField(default=0)
+    drawn = models.IntegerField(default=0)
+    goals_for = models.IntegerField(default=0)
+    goals_against = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['season', 'rival'], name='record_rival_season_unique'),
+        ]
+
+    def __str__(self):
+        return ''.join(["SeasonRecord (", str(self.season_id), " ", str(self.rival_id), " ", str(self.won), "-", str(self.lost), "-", str(self.drawn), ")"])
+
+    @classmethod
+    def aggregate(cls, season, rival_ids=None):
+        games = Game.objects.filter(season.game_filter())
+        if rival_ids is not None:
+            games = games.filter(rival_id__in=rival_ids)
+        rows = games.values('rival_id').annotate(
+            played_count=Count('id'),
+            won_count=Count('id', filter=Q(point_gain__gt=F('point_reduce'))),
+            lose_count=Count('id', filter=Q(point_gain__lt=F('point_reduce'))),
+            even_count=Count('id', filter=Q(point_gain=F('point_reduce'))),
+            goals_for_total=Sum('point_gain'),
+            goals_against_total=Sum('point_reduce'),
+        ).order_by('rival_id')
+        return [cls(season_id=season.pk, rival_id=row['rival_id'],
+                    played=row['played_count'], won=row['won_count'], lost=row['lose_count'],
+                    drawn=row['even_count'], goals_for=row['goals_for_total'],
+                    goals_against=row['goals_against_total']) for row in rows]
+
+    @classmethod
+    def rebuild(cls, season=None, rival_ids=None):
+        if season is None:
+            for season in Season.objects.all():
+                cls.rebuild(season)
+            return
+        with transaction.atomic():
+            targets = cls.objects.filter(season=season)
+            if rival_ids is not None:
+                targets = targets.filter(rival_id__in=rival_ids)
+            targets.delete()
+            cls.objects.bulk_create(cls.aggregate(season, rival_ids))
+
+    @classmethod
+    def verify(cls):
+        """Return the (season id, rival id) pairs that differ from a fresh aggregate."""
+        return _verify_rollups(cls, 'rival_id')
+
+    def as_dict(self):
+        return {'played': self.played,
+                'won': self.won,
+                'lost': self.lost,
+                'drawn': self.drawn,
+                'goals_for': self.goals_for,
+                'goals_against': self.goals_against}
+
+
+class PlayerCumulativeTotals(models.Model):
+    """Running career totals of a player after each appearance, in game_date order.
+
+    The totals up to any moment are the last row before it, so an "as of"
+    question is one seek on (player, game_date, game) instead of an aggregate.
+    """
+    player = models.ForeignKey(Player, related_name="cumulative_totals", on_delete=models.CASCADE)
+    game = models.ForeignKey(Game, related_name="player_cumulative_totals", on_delete=models.CASCADE)
+    game_date = models.DateTimeField()
+    appearances = models.IntegerField(default=0)
+    goals = models.IntegerField(default=0)
+    assists = models.IntegerField(default=0)
+    passes = models.IntegerField(default=0)
+    intercepts = models.IntegerField(default=0)
+    dribbles = models.IntegerField(default=0)
+    tuckles = models.IntegerField(default=0)
+
+    owner_key = 'player_id'
+    columns = ('appearances',) + STATS_FIELDS
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['player', 'game_date', 'game'], name='record_player_cum_seek_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['player', 'game'], name='record_player_cum_unique'),
+        ]
+
+    def __str__(self):
+        return ''.join(["CumulativeTotals (", str(self.player_id), " ", str(self.game_date), " g:", str(self.goals), ")"])
+
+    @classmethod
+    def source(cls, ids, since=None):
+        """Appearances to accumulate as (owner id, game id, game date, increments) rows."""
+        stats = Stats.objects.filter(player_id__in=ids) if ids is not None else Stats.objects.all()
+        if since is not None:
+            stats = stats.filter(game__game_date__gte=since)
+        rows = stats.order_by('player_id', 'game__game_date', 'game_id').values_list(
+            'player_id', 'game_id', 'game__game_date', *STATS_FIELDS)
+        for row in rows.iterator():
+            yield row[0], row[1], row[2], (1,) + row[3:]
+
+    @classmethod
+    def rebuild(cls, player_ids=None, since=None):
+        _rebuild_prefix(cls, player_ids, since)
+
+    @classmethod
+    def until(cls, player_id, end):
+        """Totals from games strictly before ``end`` (zeros when there are none)."""
+        return _seek(cls, player_id, end)
+
+    @classmethod
+    def as_of(cls, player_id, day):
+        """Totals including every game played on or before ``day``."""
+        return cls.until(player_id, _day_end(day))
+
+    @classmethod
+    def between(cls, player_id, start, end):
+        """{column: value} for games in [start, end), from two seeks."""
+        return _between(cls, player_id, start, end)
+
+    @classmethod
+    def verify(cls):
+        """Return the ids of players whose rows differ from a fresh accumulation."""
+        return _verify_prefix(cls)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.columns}
+
+
+class RivalCumulativeRecord(models.Model):
+    """Running head-to-head record against a rival after each game, in game_date order."""
+    rival = models.ForeignKey(Rival, related_name="cumulative_records", on_delete=models.CASCADE)
+    game = models.OneToOneField(Game, related_name="rival_cumulative_record", on_delete=models.CASCADE)
+    game_date = models.DateTimeField()
+    played = models.IntegerField(default=0)
+    won = models.IntegerField(default=0)
+    lost = models.IntegerField(default=0)
+    drawn = models.IntegerField(default=0)
+    goals_for = models.IntegerField(default=0)
+    goals_against = models.IntegerField(default=0)
+
+    owner_key = 'rival_id'
+    columns = ('played', 'won', 'lost', 'drawn', 'goals_for', 'goals_against')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['rival', 'game_date', 'game'], name='record_rival_cum_seek_idx'),
+        ]
+
+    def __str__(self):
+        return ''.join(["CumulativeRecord (", str(self.rival_id), " ", str(self.game_date), " ", str(self.won), "-", str(self.lost), "-", str(self.drawn), ")"])
+
+    @classmethod
+    def source(cls, ids, since=None):
+        games = Game.objects.filter(rival_id__in=ids) if ids is not None else Game.objects.all()
+        if since is not None:
+            games = games.filter(game_date__gte=since)
+        rows = games.order_by('rival_id', 'game_date', 'id').values_list(
+            'rival_id', 'id', 'game_date', 'point_gain', 'point_reduce')
+        for rival_id, game_id, game_date, gain, reduce in rows.iterator():
+            yield rival_id, game_id, game_date, (
+                1, int(gain > reduce), int(gain < reduce), int(gain == reduce), gain, reduce)
+
+    @classmethod
+    def rebuild(cls, rival_ids=None, since=None):
+        _rebuild_prefix(cls, rival_ids, since)
+
+    @classmethod
+    def until(cls, rival_id, end):
+        return _seek(cls, rival_id, end)
+
+    @classmethod
+    def as_of(cls, rival_id, day):
+        return cls.until(rival_id, _day_end(day))
+
+    @classmethod
+    def between(cls, rival_id, start, end):
+        return _between(cls, rival_id, start, end)
+
+    @classmethod
+    def verify(cls):
+        return _verify_prefix(cls)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.columns}
+
+
+def _day_end(day):
+    return datetime(day.year, day.month, day.day) + timedelta(days=1)
+
+
+def _seek(model, owner_id, end):
+    row = (model.objects.filter(**{model.owner_key: owner_id, 'game_date__lt': end})
+           .order_by('-game_date', '-game_id').first())
+    return row or model(**{model.owner_key: owner_id})
+
+
+def _bases(model, ids, end):
+    """{owner id: totals tuple} of the last prefix row before ``end`` of each owner, in one query."""
+    rows = model.objects.filter(game_date__lt=end)
+    if ids is not None:
+        rows = rows.filter(**{model.owner_key + '__in': ids})
+    latest = (model.objects.filter(**{model.owner_key: OuterRef(model.owner_key), 'game_date__lt': end})
+              .order_by('-game_date', '-game_id').values('pk')[:1])
+    rows = rows.filter(pk=Subquery(latest)).values_list(model.owner_key, *model.columns)
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def _between(model, owner_id, start, end):
+    totals = _seek(model, owner_id, end).as_dict()
+    if start is not None:
+        before = _seek(model, owner_id, start).as_dict()
+        totals = {name: totals[name] - before[name] for name in model.columns}
+    return totals
+
+
+def _accumulate(model, rows, bases):
+    """Turn ordered source rows into prefix rows, starting from ``bases`` {owner id: tuple}."""
+    current_id, totals = None, None
+    for owner_id, game_id, game_date, increments in rows:
+        if owner_id != current_id:
+            current_id = owner_id
+            totals = bases.get(owner_id, (0,) * len(model.columns))
+        totals = tuple(t + i for t, i in zip(totals, increments))
+        yield model(game_id=game_id, game_date=game_date,
+                    **dict(zip(model.columns, totals), **{model.owner_key: owner_id}))
+
+
+def _rebuild_prefix(model, ids, since):
+    """Recompute the prefix rows of ``ids`` (all when None) from ``since`` onwards.
+
+    Rows before ``since`` are kept and the new rows continue from the last of
+    them, so adding the latest game only writes one row.
+    """
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return
+    with transaction.atomic():
+        targets = model.objects.all()
+        if ids is not None:
+            targets = targets.filter(**{model.owner_key + '__in': ids})
+        if since is not None:
+            targets = targets.filter(game_date__gte=since)
+        targets.delete()
+
+        bases = _bases(model, ids, since) if since is not None else {}
+        model.objects.bulk_create(_accumulate(model, model.source(ids, since), bases), batch_size=1000)
+
+
+def _verify_prefix(model):
+    stored = {}
+    for row in model.objects.order_by(model.owner_key, 'game_date', 'game_id'):
+        stored.setdefault(getattr(row, model.owner_key), []).append((row.game_id, row.as_dict()))
+    expected = {}
+    for row in _accumulate(model, model.source(None), {}):
+        expected.setdefault(getattr(row, model.owner_key), []).append((row.game_id, row.as_dict()))
+    return sorted(pk for pk in set(stored) | set(expected) if stored.get(pk) != expected.get(pk))
+
+
+def _verify_rollups(model, key):
+    broken = []
+    for season in Season.objects.order_by('start'):
+        stored = {getattr(r, key): r.as_dict() for r in model.objects.filter(season=season)}
+        expected = {getattr(r, key): r.as_dict() for r in model.aggregate(season)}
+        for pk in sorted(set(stored) | set(expected)):
+            if stored.get(pk) != expected.get(pk):
+                broken.append((season.pk, pk))
+    return broken
@@ -0,0 +1,149 @@
+import logging
+import os
+import re
+import sys
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+logger = logging.getLogger('record.nplusone')
+
+DEFAULT_THRESHOLD = 3
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES_RE = re.compile(r'\bVALUES\s*\([^()]*\)(?:\s*,\s*\([^()]*\))*', re.IGNORECASE)
+_SAVEPOINT_RE = re.compile(r'\b(SAVEPOINT\s+)"[^"]*"', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+_TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# execute wrapper のモジュールは呼び出し元として出さない
+_WRAPPER_FILES = ('nplusone.py', 'instrumentation.py', 'slowqueries.py')
+
+_untracked = ContextVar('record_nplusone_untracked', default=False)
+
+
+class NPlusOneError(Exception):
+    """The same statement shape ran more often than RECORD_NPLUSONE_THRESHOLD."""
+
+
+def fingerprint(sql):
+    """Shape of a statement: literals, IN lists, VALUES rows and savepoint names collapsed.
+
+    ``WHERE id IN (%s, %s)`` and ``WHERE id IN (%s)`` give the same
+    fingerprint, so queries that differ only in their parameters are counted
+    together.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql).replace('%s', '?')
+    sql = _IN_RE.sub('IN (...)', sql)
+    sql = _VALUES_RE.sub('VALUES (...)', sql)
+    sql = _SAVEPOINT_RE.sub(r'\1?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def query_origin(frame=None):
+    """Where a query was triggered: the template line being rendered, else our own code.
+
+    Returns e.g. "record/rival_detail.html:54" or "models.py:61 (hoshitori)".
+    """
+    frame = frame or sys._getframe(1)
+    code_line = None
+    while frame is not None:
+        code = frame.f_code
+        if code is Node.render_annotated.__code__:
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                return '%s:%d' % (origin.template_name or origin.name, token.lineno)
+        if code_line is None and code.co_filename.startswith(_APP_DIR) \
+                and os.path.basename(code.co_filename) not in _WRAPPER_FILES:
+            code_line = '%s:%d (%s)' % (os.path.relpath(code.co_filename, _APP_DIR), frame.f_lineno, code.co_name)
+        frame = frame.f_back
+    return code_line or 'unknown'
+
+
+class QueryTracker:
+    """connection.execute_wrapper() hook counting statements per fingerprint.
+
+    Savepoints, statements on the tables in RECORD_NPLUSONE_IGNORE and those
+    run inside untracked() are not counted.
+
+    The origin of a statement is looked up once, when it first goes over the
+    threshold, so tracking costs a regex pass per query.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold if threshold is not None else \
+            getattr(settings, 'RECORD_NPLUSONE_THRESHOLD', DEFAULT_THRESHOLD)
+        self.ignore = ['"%s"' % table for table in getattr(settings, 'RECORD_NPLUSONE_IGNORE', ())]
+        self.counts = {}
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # SAVEPOINT などは中の文が別に数えられる
+        if _untracked.get() or sql.startswith(_TRANSACTION_STATEMENTS) or \
+                any(table in sql for table in self.ignore):
+            return execute(sql, params, many, context)
+        key = fingerprint(sql)
+        count = self.counts[key] = self.counts.get(key, 0) + 1
+        if count == self.threshold + 1:
+            self.origins[key] = query_origin()
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        """[(fingerprint, count, origin), ...] of the statements over the threshold."""
+        return sorted(((key, count, self.origins.get(key, 'unknown'))
+                       for key, count in self.counts.items() if count > self.threshold),
+                      key=lambda row: -row[1])
+
+    def report(self, label, mode=None):
+        """Log the repeated statements, or raise NPlusOneError when ``mode`` is 'raise'."""
+        repeated = self.repeated()
+        if not repeated:
+            return
+        lines = ['%s: %dx at %s: %s' % (label, count, origin, key) for key, count, origin in repeated]
+        if (mode or nplusone_mode()) == 'raise':
+            raise NPlusOneError('\n'.join(lines))
+        for line in lines:
+            logger.warning(line)
+
+
+@contextmanager
+def untracked():
+    """Leave the statements of a block out of the N+1 count.
+
+    For work whose query count is fixed by design rather than by the data,
+    such as the version and page keys of record.cache (a few queries per
+    model name, never per row). Also usable as a decorator.
+    """
+    token = _untracked.set(True)
+    try:
+        yield
+    finally:
+        _untracked.reset(token)
+
+
+def nplusone_mode():
+    """None (off), 'log' or 'raise', from RECORD_NPLUSONE."""
+    return getattr(settings, 'RECORD_NPLUSONE', None) or None
+
+
+@contextmanager
+def detect_nplusone(label='block', threshold=None, mode='raise'):
+    """Track the queries of a block and report the repeated ones on exit.
+
+        with detect_nplusone('player list'):
+            render_rows()
+    """
+    tracker = QueryTracker(threshold)
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(tracker))
+        yield tracker
+    tracker.report(label, mode)
@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, page_size, next_query=None, previous_query=None):
+        self.object_list = object_list
+        self.page_size = page_size
+        self.next_query = next_query
+        self.previous_query = previous_query
+
+    @property
+    def has_next(self):
+        return self.next_query is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_query is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginationMixin:
+    """Cursor pagination for ListView.
+
+    Pages are sought with ``?after=<cursor>`` / ``?before=<cursor>`` on
+    ``keyset_fields`` instead of OFFSET, so a deep page costs the same as the
+    first one. Every field must share one direction (all ``-field`` or none).
+    """
+    keyset_fields = ('id',)
+
+    def get_keyset_fields(self):
+        return self.keyset_fields
+
+    def get_page_size(self):
+        default = getattr(settings, 'RECORD_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        maximum = getattr(settings, 'RECORD_MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+        try:
+            size = int(self.request.GET.get('size', default))
+        except ValueError:
+            size = default
+        return max(1, min(size, maximum))
+
+    def get_context_data(self, **kwargs):
+        page = self.paginate_keyset(self.object_list)
+        kwargs['page'] = page
+        return super().get_context_data(object_list=page.object_list, **kwargs)
+
+    def paginate_keyset(self, queryset):
+        fields = self.get_keyset_fields()
+        descending = fields[0].startswith('-')
+        names = [f.lstrip('-') for f in fields]
+        size = self.get_page_size()
+
+        after = self.parse_cursor(queryset, names, self.request.GET.get('after'))
+        before = self.parse_cursor(queryset, names, self.request.GET.get('before'))
+
+        if before is not None:
+            # 前のページは逆順で取って並べ直す
+            qs = queryset.filter(self.seek(names, before, not descending))
+            qs = qs.order_by(*self.reverse(fields))
+            rows = list(qs[:size + 1])
+            has_previous = len(rows) > size
+            rows = rows[:size][::-1]
+            has_next = True
+        else:
+            qs = queryset
+            if after is not None:
+                qs = qs.filter(self.seek(names, after, descending))
+            rows = list(qs.order_by(*fields)[:size + 1])
+            has_next = len(rows) > size
+            rows = rows[:size]
+            has_previous = after is not None and bool(rows) and queryset.filter(
+                self.seek(names, self.cursor_values(rows[0], names), not descending)).exists()
+
+        next_query = previous_query = None
+        if rows and has_next:
+            next_query = self.page_query('after', self.cursor(rows[-1], names))
+        if rows and has_previous:
+            previous_query = self.page_query('before', self.cursor(rows[0], names))
+        return KeysetPage(rows, size, next_query, previous_query)
+
+    @staticmethod
+    def seek(names, values, descending):
+        # (a, b) > (x, y) を a > x OR (a = x AND b > y) に展開する
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        for i, name in enumerate(names):
+            term = Q(**{'%s__%s' % (name, lookup): values[i]})
+            for prev_name, prev_value in zip(names[:i], values[:i]):
+                term &= Q(**{prev_name: prev_value})
+            condition |= term
+        return condition
+
+    @staticmethod
+    def reverse(fields):
+        return [f[1:] if f.startswith('-') else '-' + f for f in fields]
+
+    @staticmethod
+    def cursor_values(obj, names):
+        return [getattr(obj, name) for name in names]
+
+    def cursor(self, obj, names):
+        return ','.join(str(v) for v in self.cursor_values(obj, names))
+
+    @staticmethod
+    def parse_cursor(queryset, names, raw):
+        if not raw:
+            return None
+        parts = raw.split(',')
+        if len(parts) != len(names):
+            return None
+        try:
+            return [queryset.model._meta.get_field('id' if name == 'pk' else name).to_python(part)
+                    for name, part in zip(names, parts)]
+        except ValidationError:
+            return None
+
+    def page_query(self, direction, cursor):
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[direction] = cursor
+        return query.urlencode()
@@ -0,0 +1,183 @@
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'HTTP_X_RECORD_PROFILE'
+PROFILE_ID_HEADER = 'X-Record-Profile-Id'
+PROFILE_ID_RE = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+# 折りたたみスタックのサンプリング間隔 (秒)
+SAMPLE_INTERVAL = 0.001
+
+# setswitchinterval はプロセス全体の設定なので、同時に測っているリクエストの数で管理する
+_switch_lock = threading.Lock()
+_switch_users = 0
+_switch_saved = None
+
+
+def profile_dir():
+    return getattr(settings, 'RECORD_PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def wants_profile(request):
+    """Profile only when a staff user asks for it with ?_profile=1 or X-Record-Profile: 1."""
+    if not getattr(settings, 'RECORD_PROFILING', True):
+        return False
+    asked = request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+    if asked in (None, '', '0'):
+        return False
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+def frame_label(code):
+    # cProfile の表示 (pstats) と同じ "file.py:行(関数)" 形式
+    return '%s:%d(%s)' % (os.path.basename(code.co_filename), code.co_firstlineno, code.co_name)
+
+
+class StackSampler:
+    """Sample the stack of one thread from a background thread.
+
+    cProfile only keeps caller -> callee edges, which cannot be turned back
+    into whole stacks once the code recurses (template rendering always
+    does), so the flamegraph comes from samples taken next to the profile.
+    Frames above ``stop_code`` (the WSGI server, the middleware that started
+    profiling) are left out.
+    """
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL, stop_code=None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stop_code = stop_code
+        self.counts = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        global _switch_users, _switch_saved
+        # GIL の切り替え間隔より細かくは取れないので、測る間だけ短くする
+        with _switch_lock:
+            if _switch_users == 0:
+                _switch_saved = sys.getswitchinterval()
+            _switch_users += 1
+            sys.setswitchinterval(min(sys.getswitchinterval(), self.interval / 2))
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _switch_users
+        self._stop.set()
+        self._thread.join()
+        # 最後のサンプラーが止まったときだけ元に戻す
+        with _switch_lock:
+            _switch_users -= 1
+            if _switch_users == 0:
+                sys.setswitchinterval(_switch_saved)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code is not self.stop_code:
+                if frame.f_code is StackSampler.__exit__.__code__:
+                    # 止める途中のサンプルは捨てる
+                    stack = []
+                    break
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                key = tuple(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def collapsed(self):
+        """Collapsed stack lines ("a;b;c <samples>") for flamegraph.pl / speedscope."""
+        return ['%s %d' % (';'.join(stack), count) for stack, count in sorted(self.counts.items())]
+
+
+def new_profile_id():
+    return '%s-%s' % (datetime.now().strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:8])
+
+
+def save_profile(profile, stacks, meta, directory=None):
+    """Write <id>.prof, <id>.collapsed and <id>.json and return the id."""
+    directory = directory or profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    profile_id = new_profile_id()
+    base = os.path.join(directory, profile_id)
+    profile.dump_stats(base + '.prof')
+    with open(base + '.collapsed', 'w') as f:
+        f.write(''.join(line + '\n' for line in stacks))
+    with open(base + '.json', 'w') as f:
+        json.dump(dict(meta, id=profile_id), f, indent=2)
+    return profile_id
+
+
+def list_profiles(directory=None):
+    """Metadata of the captured profiles, newest first."""
+    directory = directory or profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if name.endswith('.json') and PROFILE_ID_RE.match(name[:-5]):
+            with open(os.path.join(directory, name)) as f:
+                profiles.append(json.load(f))
+    return sorted(profiles, key=lambda meta: meta['id'], reverse=True)
+
+
+def profile_paths(profile_id, directory=None):
+    """Return {'prof': path, 'collapsed': path, 'json': path}; ValueError for a bad id."""
+    if not PROFILE_ID_RE.match(profile_id):
+        raise ValueError("invalid profile id: %s" % profile_id)
+    base = os.path.join(directory or profile_dir(), profile_id)
+    return {ext: '%s.%s' % (base, ext) for ext in ('prof', 'collapsed', 'json')}
+
+
+class ProfilingMiddleware:
+    """Run the rest of the request under cProfile when a staff user asks for it.
+
+    Must come after AuthenticationMiddleware. The profile and the collapsed
+    stacks (sampled every RECORD_PROFILE_INTERVAL seconds) are written to
+    RECORD_PROFILE_DIR and the id is returned in the X-Record-Profile-Id
+    header; see the ``profiles`` management command. For streaming responses
+    only the work before the first byte is profiled.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+
+        started = datetime.now()
+        profile = cProfile.Profile()
+        interval = getattr(settings, 'RECORD_PROFILE_INTERVAL', SAMPLE_INTERVAL)
+        with StackSampler(interval=interval, stop_code=self.__call__.__code__) as sampler:
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+
+        total = sum(row[2] for row in pstats.Stats(profile).stats.values())
+        meta = {
+            'created': started.isoformat(timespec='seconds'),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            'user': request.user.get_username(),
+            'total_ms': round(total * 1000, 1),
+            'sample_interval_ms': interval * 1000,
+        }
+        response[PROFILE_ID_HEADER] = save_profile(profile, sampler.collapsed(), meta)
+        return response
@@ -0,0 +1,64 @@
+from django.db.models import Count, F, Sum, Window
+from django.db.models.expressions import RowRange
+from django.db.models.functions import RowNumber
+
+from .models import Stats
+
+FORM_WINDOWS = (5, 10)
+FORM_FIELDS = ('goals', 'assists')
+
+
+def form_names(windows=FORM_WINDOWS, fields=FORM_FIELDS):
+    """Annotation names added by with_rolling_form(), e.g. 'goals_last5'."""
+    names = []
+    for n in windows:
+        names.append('appearances_last%d' % n)
+        names.extend('%s_last%d' % (name, n) for name in fields)
+    return names
+
+
+def with_rolling_form(stats, windows=FORM_WINDOWS, fields=FORM_FIELDS):
+    """Annotate each Stats row with the totals of the player's last N appearances.
+
+    The sums are window functions over a ROWS frame ordered by game date, so
+    every window of every row comes out of the same query.
+    """
+    partition = [F('player_id')]
+    order = [F('game__game_date').asc(), F('game_id').asc()]
+    params = {}
+    for n in windows:
+        frame = RowRange(start=-(n - 1), end=0)
+        params['appearances_last%d' % n] = Window(Count('id'), partition_by=partition, order_by=order, frame=frame)
+        for name in fields:
+            params['%s_last%d' % (name, n)] = Window(Sum(name), partition_by=partition, order_by=order, frame=frame)
+    return stats.annotate(**params)
+
+
+def form_of(row, windows=FORM_WINDOWS, fields=FORM_FIELDS):
+    """{'last5': {'appearances': .., 'goals': .., 'assists': ..}, ...} from an annotated row."""
+    get = row.get if isinstance(row, dict) else lambda name: getattr(row, name, None)
+    form = {}
+    for n in windows:
+        values = {'appearances': get('appearances_last%d' % n) or 0}
+        for name in fields:
+            values[name] = get('%s_last%d' % (name, n)) or 0
+        form['last%d' % n] = values
+    return form
+
+
+def latest_form(statss, windows=FORM_WINDOWS, fields=FORM_FIELDS):
+    """Form after the most recent appearance among already annotated rows."""
+    latest = max(statss, key=lambda s: (s.game.game_date, s.game_id), default=None)
+    return form_of(latest or {}, windows, fields)
+
+
+def current_form(player_ids=None, windows=FORM_WINDOWS, fields=FORM_FIELDS):
+    """Return {player_id: form} for the whole squad (or ``player_ids``) in one query."""
+    stats = Stats.objects.all()
+    if player_ids is not None:
+        stats = stats.filter(player_id__in=player_ids)
+    stats = with_rolling_form(stats, windows, fields).annotate(recency=Window(
+        RowNumber(), partition_by=[F('player_id')],
+        order_by=[F('game__game_date').desc(), F('game_id').desc()]))
+    rows = stats.filter(recency=1).values('player_id', *form_names(windows, fields))
+    return {row['player_id']: form_of(row, windows, fields) for row in rows}
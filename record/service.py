@@ -1,4 +1,7 @@
+from django.db import transaction
+
 from .models import Stats, Game
+from .signals import stats_bulk_created, games_bulk_created
 
 
 class StatsCreateService:
@@ -10,6 +13,12 @@ class StatsCreateService:
             stats.save()
         return stats
 
+    def bulk_save(self, stats_list):
+        with transaction.atomic():
+            stats_list = Stats.objects.bulk_create(stats_list)
+            stats_bulk_created.send(sender=Stats, stats_list=stats_list)
+        return stats_list
+
     def statsform_to_dict(self, game, form):
         dic = {}
         dic['game'] = game
@@ -32,6 +41,23 @@ class GameCreateService:
             game.save()
         return game
 
+    def bulk_save(self, games):
+        with transaction.atomic():
+            games = Game.objects.bulk_create(games)
+            games_bulk_created.send(sender=Game, games=games)
+        return games
+
+    def create_game_with_stats(self, game_form, stats_forms):
+        """Save the game and all valid stats rows of the formset in one transaction."""
+        stats_service = StatsCreateService()
+        with transaction.atomic():
+            game = self.create_game(game_form, commit=True)
+            stats_list = [stats_service.create_stats(game, form)
+                          for form in stats_forms
+                          if form.is_valid() and form.is_valid_stats()]
+            stats_list = stats_service.bulk_save(stats_list)
+        return game, stats_list
+
     def gameform_to_dict(self, form):
         dic = {}
         dic['rival'] = form.cleaned_data['rival']
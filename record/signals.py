@@ -0,0 +1,176 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
+
+from .cache import bump_version
+from .models import Game, Player, Rival, Stats, PlayerCareerTotals, RivalRecord, Season, \
+    PlayerCumulativeTotals, RivalCumulativeRecord, STATS_FIELDS, GAME_TRACKED_FIELDS
+
+# bulk_create は post_save を送らないので、一括登録した側がこれを送る
+# (sender=Stats, stats_list=[...])
+stats_bulk_created = Signal()
+# (sender=Game, games=[...])
+games_bulk_created = Signal()
+
+
+# シーズン集計と累計表も変更前の値を使うので、集計の receiver より先に登録する
+@receiver(post_save, sender=Stats)
+@receiver(post_delete, sender=Stats)
+def refresh_dated_totals(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_loaded_values', None) or {}
+    game_ids = {instance.game_id, old.get('game_id', instance.game_id)}
+    player_ids = {instance.player_id, old.get('player_id', instance.player_id)}
+    if len(game_ids) == 1 and Stats.game.is_cached(instance):
+        dates = [instance.game.game_date]
+    else:
+        dates = list(game_dates(game_ids))
+    Season.refresh(dates, player_ids=player_ids)
+    PlayerCumulativeTotals.rebuild(player_ids, since=min(dates, default=None))
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def refresh_dated_records(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_loaded_values', None) or {}
+    old_date = old.get('game_date', instance.game_date)
+    dates = {instance.game_date, old_date}
+    rival_ids = {instance.rival_id, old.get('rival_id', instance.rival_id)}
+    player_ids = ()
+    if kwargs.get('signal') is post_save and not created and old_date != instance.game_date:
+        # 日付が変わるとシーズンをまたいで選手の集計も移り、累計の順番も変わる
+        player_ids = set(Stats.objects.filter(game_id=instance.pk).values_list('player_id', flat=True))
+    Season.refresh(dates, player_ids=player_ids, rival_ids=rival_ids)
+    RivalCumulativeRecord.rebuild(rival_ids, since=min(dates))
+    PlayerCumulativeTotals.rebuild(player_ids, since=min(dates))
+
+
+@receiver(stats_bulk_created, sender=Stats)
+def refresh_dated_totals_on_bulk_create(sender, stats_list, **kwargs):
+    dates = list(game_dates({s.game_id for s in stats_list}))
+    player_ids = {s.player_id for s in stats_list}
+    Season.refresh(dates, player_ids=player_ids)
+    PlayerCumulativeTotals.rebuild(player_ids, since=min(dates, default=None))
+
+
+@receiver(games_bulk_created, sender=Game)
+def refresh_dated_records_on_bulk_create(sender, games, **kwargs):
+    dates = {g.game_date for g in games}
+    rival_ids = {g.rival_id for g in games}
+    Season.refresh(dates, rival_ids=rival_ids)
+    RivalCumulativeRecord.rebuild(rival_ids, since=min(dates, default=None))
+
+
+@receiver(post_save, sender=Season)
+def rebuild_season_rollups(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.rebuild_rollups()
+
+
+@receiver(post_save, sender=Player)
+def create_career_totals(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        PlayerCareerTotals.objects.get_or_create(player_id=instance.pk)
+
+
+@receiver(post_save, sender=Rival)
+def create_rival_record(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        RivalRecord.objects.get_or_create(rival_id=instance.pk)
+
+
+@receiver(post_save, sender=Stats)
+def update_career_totals_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new = instance.stats_values()
+    old = getattr(instance, '_loaded_values', None)
+
+    if created:
+        PlayerCareerTotals.apply(instance.player_id, new, appearances=1)
+    elif old is None:
+        # 変更前の値が分からない (only() で読んだ等) ので集計し直す
+        PlayerCareerTotals.rebuild([instance.player_id])
+    elif old['player_id'] != instance.player_id:
+        PlayerCareerTotals.apply(old['player_id'], negate(old), appearances=-1)
+        PlayerCareerTotals.apply(instance.player_id, new, appearances=1)
+    else:
+        delta = {name: new[name] - old[name] for name in STATS_FIELDS}
+        if any(delta.values()):
+            PlayerCareerTotals.apply(instance.player_id, delta)
+
+    instance._loaded_values = dict(new, player_id=instance.player_id, game_id=instance.game_id)
+
+
+@receiver(post_delete, sender=Stats)
+def update_career_totals_on_delete(sender, instance, **kwargs):
+    old = getattr(instance, '_loaded_values', None)
+    if old is None:
+        old = dict(instance.stats_values(), player_id=instance.player_id)
+    PlayerCareerTotals.apply(old['player_id'], negate(old), appearances=-1)
+
+
+@receiver(post_save, sender=Game)
+def update_rival_record_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new = instance.game_values()
+    old = getattr(instance, '_loaded_values', None)
+    if old is not None:
+        old = {name: old[name] for name in GAME_TRACKED_FIELDS}
+
+    if created:
+        RivalRecord.apply(new)
+    elif old is None:
+        # 変更前の値が分からない (only() で読んだ等) ので集計し直す
+        RivalRecord.rebuild([instance.rival_id])
+    elif old != new:
+        RivalRecord.apply(old, sign=-1)
+        RivalRecord.apply(new)
+
+    instance._loaded_values = new
+
+
+@receiver(games_bulk_created, sender=Game)
+def update_rival_record_on_bulk_create(sender, games, **kwargs):
+    RivalRecord.apply_many(games)
+
+
+@receiver(post_delete, sender=Game)
+def update_rival_record_on_delete(sender, instance, **kwargs):
+    old = getattr(instance, '_loaded_values', None)
+    if old is None:
+        old = instance.game_values()
+    RivalRecord.apply({name: old[name] for name in GAME_TRACKED_FIELDS}, sign=-1)
+
+
+@receiver(stats_bulk_created, sender=Stats)
+def update_career_totals_on_bulk_create(sender, stats_list, **kwargs):
+    PlayerCareerTotals.apply_many(stats_list)
+
+
+@receiver(post_save, sender=Stats)
+@receiver(post_delete, sender=Stats)
+@receiver(stats_bulk_created, sender=Stats)
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+@receiver(games_bulk_created, sender=Game)
+@receiver(post_save, sender=Player)
+@receiver(post_delete, sender=Player)
+@receiver(post_save, sender=Rival)
+@receiver(post_delete, sender=Rival)
+@receiver(post_save, sender=Season)
+@receiver(post_delete, sender=Season)
+def bump_model_version(sender, **kwargs):
+    # モデルごとの世代番号 ('stats', 'game', 'player', 'rival')
+    bump_version(sender._meta.model_name)
+
+
+def game_dates(game_ids):
+    return Game.objects.filter(pk__in=game_ids).values_list('game_date', flat=True)
+
+
+def negate(values):
+    return {name: -values[name] for name in STATS_FIELDS}
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .instrumentation import current
+from .metrics import connect
+from .nplusone import fingerprint
+
+logger = logging.getLogger('record.slowqueries')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slow_queries (
+    fingerprint TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    total_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    last_view TEXT NOT NULL,
+    last_sql TEXT NOT NULL,
+    last_plan TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+)
+"""
+
+# 遅い SQL の後に書き込むので、集計ファイルのロックを長く待たない
+STORE_TIMEOUT = 0.25
+
+_state = threading.local()
+
+
+def threshold_ms():
+    """RECORD_SLOW_QUERY_MS, or None when the log is off."""
+    return getattr(settings, 'RECORD_SLOW_QUERY_MS', None)
+
+
+def explain(connection, sql, params):
+    """EXPLAIN (QUERY PLAN) of a SELECT, run on a bare cursor so it is not logged or counted."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return ''
+    try:
+        cursor = connection.create_cursor()
+        try:
+            cursor.execute('%s %s' % (connection.ops.explain_query_prefix(), sql), params)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception as e:
+        return 'EXPLAIN failed: %s' % e
+    # SQLite は (id, parent, notused, detail)、PostgreSQL は1列
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def connect_store(timeout=5):
+    db = connect(timeout=timeout)
+    db.execute(SCHEMA)
+    return db
+
+
+def record_slow_query(fp, sql, duration_ms, view, plan):
+    """Add one slow statement to the per-fingerprint roll-up."""
+    db = connect_store(timeout=STORE_TIMEOUT)
+    try:
+        with db:
+            db.execute(
+                'INSERT INTO slow_queries VALUES (?, 1, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (fingerprint) DO UPDATE SET count = count + 1, total_ms = total_ms + excluded.total_ms, '
+                'max_ms = MAX(max_ms, excluded.max_ms), last_view = excluded.last_view, '
+                'last_sql = excluded.last_sql, last_plan = excluded.last_plan, last_seen = excluded.last_seen',
+                (fp, duration_ms, duration_ms, view, sql, plan, datetime.now().isoformat(timespec='seconds')))
+    finally:
+        db.close()
+
+
+def worst_queries(limit=20, order='total_ms'):
+    """Roll-up rows as dicts, the query families costing the most time first."""
+    if order not in ('total_ms', 'count', 'max_ms'):
+        raise ValueError("order must be total_ms, count or max_ms")
+    db = connect_store()
+    db.row_factory = lambda cursor, row: {col[0]: value for col, value in zip(cursor.description, row)}
+    try:
+        return db.execute('SELECT * FROM slow_queries ORDER BY %s DESC LIMIT ?' % order, (limit,)).fetchall()
+    finally:
+        db.close()
+
+
+def reset_slow_queries():
+    db = connect_store()
+    try:
+        with db:
+            db.execute('DELETE FROM slow_queries')
+    finally:
+        db.close()
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    """Execute wrapper logging statements slower than RECORD_SLOW_QUERY_MS.
+
+    The log never changes the outcome of the statement: a failed EXPLAIN or
+    roll-up write is only logged, and statements that raised are logged
+    without a plan.
+    """
+    limit = threshold_ms()
+    if limit is None or getattr(_state, 'active', False):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    failed = True
+    try:
+        result = execute(sql, params, many, context)
+        failed = False
+        return result
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms >= limit:
+            log_slow_query(sql, params, many, context, duration_ms, failed)
+
+
+def log_slow_query(sql, params, many, context, duration_ms, failed):
+    # EXPLAIN や集計の書き込みで自分自身が呼ばれないようにする
+    _state.active = True
+    try:
+        metrics = current()
+        view = metrics.view_name() if metrics is not None else '-'
+        # 失敗した文の EXPLAIN は同じ理由で失敗するか、壊れたトランザクションの中で走る
+        plan = '' if many or failed else explain(context['connection'], sql, params)
+        fp = fingerprint(sql)
+        logger.warning('slow query %.1f ms view=%s fingerprint=%s\n%s', duration_ms, view, fp, plan,
+                       extra={'duration_ms': duration_ms, 'view': view, 'fingerprint': fp,
+                              'sql': sql, 'plan': plan})
+        record_slow_query(fp, sql, duration_ms, view, plan)
+    except Exception:
+        logger.warning('could not record slow query', exc_info=True)
+    finally:
+        _state.active = False
+
+
+@receiver(connection_created)
+def install_slow_query_wrapper(sender, connection, **kwargs):
+    # 接続ごとに1回だけ付ける (リクエストの外の管理コマンドなども対象)。
+    # execute_wrapper() の with は抜けるときに末尾を pop するので、その中で接続が
+    # 作られても取り違えないよう先頭に入れる
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_wrapper)
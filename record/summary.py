@@ -0,0 +1,49 @@
+from itertools import chain
+
+import numpy as np
+
+PERCENTILES = (25, 75, 90)
+
+
+def load_columns(queryset, fields):
+    """Fetch ``fields`` of ``queryset`` as an (n, len(fields)) float array."""
+    rows = queryset.values_list(*fields)
+    flat = np.fromiter(chain.from_iterable(rows.iterator()), dtype=np.float64)
+    return flat.reshape(-1, len(fields))
+
+
+def summarize(queryset, fields, percentiles=PERCENTILES):
+    """Summarize the numeric ``fields`` of ``queryset`` in one vectorized pass.
+
+    Returns a dict with ``count`` and, per statistic (``total``, ``mean``,
+    ``median``, ``std`` and ``p<N>`` for each percentile), a dict keyed by field.
+    """
+    data = load_columns(queryset, fields)
+    return summarize_array(data, fields, percentiles)
+
+
+def summarize_array(data, fields, percentiles=PERCENTILES):
+    count = data.shape[0]
+    summary = {'count': count}
+    if count == 0:
+        zeros = dict.fromkeys(fields, 0)
+        for name in ('total', 'mean', 'median', 'std'):
+            summary[name] = dict(zeros)
+        for p in percentiles:
+            summary['p%d' % p] = dict(zeros)
+        return summary
+
+    summary['total'] = _by_field(fields, data.sum(axis=0), as_int=True)
+    summary['mean'] = _by_field(fields, data.mean(axis=0))
+    summary['std'] = _by_field(fields, data.std(axis=0))
+    qs = np.percentile(data, (50,) + tuple(percentiles), axis=0)
+    summary['median'] = _by_field(fields, qs[0])
+    for p, values in zip(percentiles, qs[1:]):
+        summary['p%d' % p] = _by_field(fields, values)
+    return summary
+
+
+def _by_field(fields, values, as_int=False):
+    if as_int:
+        return {name: int(v) for name, v in zip(fields, values)}
+    return {name: round(float(v), 2) for name, v in zip(fields, values)}
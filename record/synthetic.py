@@ -0,0 +1,87 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+from django.db import transaction
+
+from .models import Game, Player, Rival, Stats
+from .service import GameCreateService, StatsCreateService
+
+BATCH_SIZE = 500
+FIELDS = ("Home Ground", "City Stadium", "Riverside Park", "North Field", "Academy Pitch")
+
+
+def poisson(rng, lam):
+    # 標準ライブラリだけで済ませる (Knuth の方法、平均は小さい値しか使わない)
+    limit, k, p = math.exp(-lam), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def generate(players=0, rivals=0, games=0, stats_per_game=11, seed=0, start=None, stdout=None):
+    """Add synthetic players, rivals and games (with stats) to the database.
+
+    Players and rivals are created one by one so their aggregate rows exist;
+    games and stats go through the services' bulk_save in batches, which keeps
+    every materialized table up to date. New games continue weekly-ish after
+    the latest existing game (or from ``start``). The same seed and counts
+    always produce the same data. Returns the number of rows added per model.
+    """
+    rng = random.Random(seed)
+    with transaction.atomic():
+        offset = Player.objects.count()
+        for i in range(players):
+            Player.objects.create(name="Synthetic Player %05d" % (offset + i), sebango=(offset + i) % 99 + 1)
+        offset = Rival.objects.count()
+        for i in range(rivals):
+            Rival.objects.create(team_name="Synthetic FC %05d" % (offset + i), home=rng.choice(FIELDS))
+
+    player_ids = list(Player.objects.order_by('id').values_list('id', flat=True))
+    rival_names = dict(Rival.objects.values_list('id', 'team_name'))
+    rival_ids = sorted(rival_names)
+    if games and (not player_ids or not rival_ids):
+        raise ValueError("games need at least one player and one rival")
+
+    # 選手ごとの得点力 (偏りがないと順位表が平らになる)
+    attack = {pk: rng.paretovariate(2.0) for pk in player_ids}
+    last = Game.objects.order_by('-game_date').values_list('game_date', flat=True).first()
+    day = last + timedelta(days=7) if last else (start or datetime(2015, 4, 5, 10, 0))
+
+    game_service = GameCreateService()
+    stats_service = StatsCreateService()
+    created_stats = 0
+    for batch_start in range(0, games, BATCH_SIZE):
+        batch, lineups = [], []
+        for i in range(batch_start, min(games, batch_start + BATCH_SIZE)):
+            rival_id = rng.choice(rival_ids)
+            batch.append(Game(rival_id=rival_id, rival_name=rival_names[rival_id], field=rng.choice(FIELDS),
+                              game_date=day, point_gain=poisson(rng, 1.6),
+                              point_reduce=poisson(rng, 1.3), remark=''))
+            lineups.append(rng.sample(player_ids, min(stats_per_game, len(player_ids))))
+            day += timedelta(days=rng.choice((3, 4, 7, 7, 7, 14)))
+
+        with transaction.atomic():
+            game_service.bulk_save(batch)
+            stats_list = []
+            for game, lineup in zip(batch, lineups):
+                weights = [attack[pk] for pk in lineup]
+                goals = dict.fromkeys(lineup, 0)
+                assists = dict.fromkeys(lineup, 0)
+                for _ in range(game.point_gain):
+                    goals[rng.choices(lineup, weights)[0]] += 1
+                    if rng.random() < 0.7:
+                        assists[rng.choices(lineup, weights)[0]] += 1
+                for pk in lineup:
+                    stats_list.append(Stats(
+                        game_id=game.pk, player_id=pk, goals=goals[pk], assists=assists[pk],
+                        passes=max(0, int(rng.gauss(22, 8))), intercepts=poisson(rng, 1.5),
+                        dribbles=poisson(rng, 1.2 * attack[pk]), tuckles=poisson(rng, 2.0), remark=''))
+            stats_service.bulk_save(stats_list)
+        created_stats += len(stats_list)
+        if stdout is not None:
+            stdout.write("%d / %d games" % (min(games, batch_start + BATCH_SIZE), games))
+
+    return {'players': players, 'rivals': rivals, 'games': games, 'stats': created_stats}
@@ -0,0 +1,110 @@
+from django.test import TestCase
+from django.utils.http import http_date
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+
+from .api import DEPENDENCIES
+from .cache import get_versions
+from .models import Game, Rival, Stats, Player, WIN, LOSE
+
+# -----------------------------------------------
+# TEST API
+# -----------------------------------------------
+
+
+class ApiViewTest(TestCase):
+
+    def setUp(self):
+        self.r1 = Rival.objects.create(team_name="rival1", home="home1")
+        self.r2 = Rival.objects.create(team_name="rival2", home="home2")
+        self.p = Player.objects.create(name="player", sebango=10)
+        self.g1 = Game.objects.create(rival=self.r1, field="f", point_gain=2, point_reduce=1, game_date=parse_datetime("2018-06-01 10:00:00"))
+        self.g2 = Game.objects.create(rival=self.r2, field="f", point_gain=0, point_reduce=1, game_date=parse_datetime("2018-07-01 10:00:00"))
+        Stats.objects.create(game=self.g1, player=self.p, goals=2)
+        Stats.objects.create(game=self.g2, player=self.p, goals=1)
+
+    def get_json(self, name, *args, **params):
+        res = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(res.status_code, 200)
+        return res.json()
+
+    def test_game_list(self):
+        data = self.get_json("api_game_list")
+        self.assertEqual([g['id'] for g in data['results']], [self.g1.pk, self.g2.pk])
+        self.assertEqual(data['results'][0]['rival_name'], "rival1")
+        self.assertEqual(data['results'][0]['result'], WIN)
+        self.assertEqual(data['results'][1]['result'], LOSE)
+        self.assertIsNone(data['next_after'])
+
+    def test_game_list_keyset(self):
+        data = self.get_json("api_game_list", limit=1)
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['next_after'], self.g1.pk)
+        data = self.get_json("api_game_list", limit=1, after=data['next_after'])
+        self.assertEqual([g['id'] for g in data['results']], [self.g2.pk])
+        self.assertIsNone(data['next_after'])
+
+    def test_game_list_rival_filter(self):
+        data = self.get_json("api_game_list", rival=self.r2.pk)
+        self.assertEqual([g['id'] for g in data['results']], [self.g2.pk])
+
+    def test_game_detail(self):
+        data = self.get_json("api_game_detail", self.g1.pk)
+        self.assertEqual(data['point_gain'], 2)
+        self.assertEqual([s['player__name'] for s in data['stats']], ["player"])
+        self.assertEqual(data['stats'][0]['goals'], 2)
+
+    def test_player_list_uses_career_totals(self):
+        data = self.get_json("api_player_list")
+        totals = data['results'][0]['career_totals']
+        self.assertEqual(totals['appearances'], 2)
+        self.assertEqual(totals['goals'], 3)
+
+    def test_player_detail(self):
+        data = self.get_json("api_player_detail", self.p.pk)
+        self.assertEqual(data['name'], "player")
+        self.assertEqual([s['game__rival__team_name'] for s in data['stats']], ["rival1", "rival2"])
+
+    def test_rival_list_uses_head_to_head(self):
+        data = self.get_json("api_rival_list")
+        self.assertEqual(data['results'][0]['record']['won'], 1)
+        self.assertEqual(data['results'][1]['record']['lost'], 1)
+
+    def test_rival_detail(self):
+        data = self.get_json("api_rival_detail", self.r1.pk)
+        self.assertEqual(data['record']['goals_for'], 2)
+        self.assertEqual([g['id'] for g in data['games']], [self.g1.pk])
+
+    def test_not_found(self):
+        res = self.client.get(reverse("api_game_detail", args=(0,)))
+        self.assertEqual(res.status_code, 404)
+
+    def test_post_not_allowed(self):
+        res = self.client.post(reverse("api_game_list"))
+        self.assertEqual(res.status_code, 405)
+
+    def test_not_modified(self):
+        url = reverse("api_player_detail", args=(self.p.pk,))
+        res = self.client.get(url)
+        # 世代番号 (ミリ秒) のうち一番新しいものが更新時刻になる
+        newest = max(get_versions(DEPENDENCIES['player']).values()) // 1000
+        self.assertEqual(res['Last-Modified'], http_date(newest))
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, 304)
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(newest))
+        self.assertEqual(res.status_code, 304)
+
+    def test_etag_changes_on_write(self):
+        url = reverse("api_player_detail", args=(self.p.pk,))
+        etag = self.client.get(url)['ETag']
+        Stats.objects.filter(game=self.g2).get().delete()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json()['stats']), 1)
+
+    def test_etag_ignores_unrelated_writes(self):
+        url = reverse("api_rival_list")
+        etag = self.client.get(url)['ETag']
+        Player.objects.create(name="other", sebango=11)
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
@@ -0,0 +1,86 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from .benchmark import URL_ARGS, Benchmark, compare
+from .models import (Game, Player, PlayerCareerTotals, PlayerCumulativeTotals, Rival, RivalCumulativeRecord,
+                     RivalRecord, Stats)
+from .synthetic import generate
+from .urls import urlpatterns
+
+# -----------------------------------------------
+# TEST SYNTHETIC DATA / BENCHMARK
+# -----------------------------------------------
+
+
+class GenerateDataTest(TestCase):
+
+    def test_counts_and_aggregates(self):
+        counts = generate(players=8, rivals=3, games=12, stats_per_game=5, seed=1)
+        self.assertEqual(counts, {'players': 8, 'rivals': 3, 'games': 12, 'stats': 60})
+        self.assertEqual(Game.objects.count(), 12)
+        self.assertEqual(Stats.objects.count(), 60)
+        # 集計テーブルも一緒に作られている
+        self.assertEqual(PlayerCareerTotals.verify(), [])
+        self.assertEqual(RivalRecord.verify(), [])
+        self.assertEqual(PlayerCumulativeTotals.verify(), [])
+        self.assertEqual(RivalCumulativeRecord.verify(), [])
+
+    def test_appends_after_latest_game(self):
+        generate(players=5, rivals=2, games=3, stats_per_game=3)
+        last = Game.objects.order_by('-game_date').first().game_date
+        generate(games=2, stats_per_game=3)
+        self.assertEqual(Game.objects.filter(game_date__gt=last).count(), 2)
+        self.assertEqual(Player.objects.count(), 5)
+
+    def test_same_seed_same_data(self):
+        generate(players=4, rivals=2, games=5, stats_per_game=4, seed=7)
+        first = list(Stats.objects.order_by('id').values_list('goals', 'assists', 'passes'))
+        Game.objects.all().delete()
+        Player.objects.all().delete()
+        Rival.objects.all().delete()
+        generate(players=4, rivals=2, games=5, stats_per_game=4, seed=7)
+        self.assertEqual(list(Stats.objects.order_by('id').values_list('goals', 'assists', 'passes')), first)
+
+    def test_games_without_players(self):
+        with self.assertRaises(ValueError):
+            generate(games=1)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_data', '--players=3', '--rivals=1', '--games=2', '--stats-per-game=2', stdout=out)
+        self.assertIn("Created 3 players, 1 rivals, 2 games and 4 stats rows.", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('generate_data', '--start=yesterday', stdout=StringIO())
+
+
+class BenchmarkTest(TestCase):
+
+    def test_every_url_is_measured(self):
+        names = {p.name for p in urlpatterns if p.name}
+        self.assertEqual(set(URL_ARGS), names)
+
+        results = Benchmark(sizes={'tiny': {'players': 4, 'rivals': 2, 'games': 3, 'stats_per_game': 3}},
+                            repeat=1).run()
+        tiny = results['sizes']['tiny']
+        self.assertEqual(tiny['dataset'], {'players': 4, 'rivals': 2, 'games': 3, 'stats': 9})
+        self.assertEqual(set(tiny['urls']), names)
+        for name, row in tiny['urls'].items():
+            self.assertEqual(row['status'], 200, name)
+            self.assertGreater(row['wall_ms'], 0)
+            if name != 'metrics':
+                self.assertGreater(row['queries'], 0, name)
+            self.assertGreater(row['peak_kib'], 0)
+
+    def test_compare(self):
+        def result(ms, queries):
+            return {'sizes': {'small': {'urls': {'game_list': {'wall_ms': ms, 'queries': queries}}}}}
+
+        lines, regressions = compare(result(10.0, 3), result(11.0, 3))
+        self.assertEqual((len(lines), regressions), (1, []))
+        self.assertEqual(len(compare(result(10.0, 3), result(20.0, 3))[1]), 1)
+        self.assertEqual(len(compare(result(10.0, 3), result(10.0, 4))[1]), 1)
+        # 前回にないサイズは比較しない
+        self.assertEqual(compare({'sizes': {}}, result(20.0, 3)), ([], []))
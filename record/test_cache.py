@@ -0,0 +1,137 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import get_version, get_versions, bump_version, VERSION_KEY
+from .models import Game, Rival, Stats, Player
+from .views import get_squad_averages
+
+# -----------------------------------------------
+# TEST CACHE
+# -----------------------------------------------
+
+
+class VersionTest(TestCase):
+
+    def test_get_version_is_stable(self):
+        self.assertEqual(get_version("test"), get_version("test"))
+
+    def test_bump_version(self):
+        v = get_version("test")
+        bump_version("test")
+        self.assertGreater(get_version("test"), v)
+
+    def test_bump_version_twice(self):
+        bump_version("test")
+        v = get_version("test")
+        bump_version("test")
+        self.assertGreater(get_version("test"), v)
+
+    def test_evicted_version_is_not_reused(self):
+        bump_version("test")
+        v = get_version("test")
+        cache.delete(VERSION_KEY % "test")
+        self.assertGreaterEqual(get_version("test"), v)
+
+    def test_get_versions_cold(self):
+        # 読み込み2回と、無い名前ごとの add だけで済む
+        names = ["test%d" % i for i in range(5)]
+        with CaptureQueriesContext(connection) as ctx:
+            versions = get_versions(names)
+        self.assertEqual(set(versions), set(names))
+        self.assertEqual(sum('IN (' in q['sql'] for q in ctx.captured_queries), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_versions(names), versions)
+
+
+class SquadAveragesTest(TestCase):
+
+    def setUp(self):
+        r = Rival.objects.create(team_name="test_team", home="test_home")
+        self.g = Game.objects.create(rival=r, point_gain=1, point_reduce=0, game_date=timezone.now())
+        self.p1 = Player.objects.create(name="test1", sebango=10)
+        self.p2 = Player.objects.create(name="test2", sebango=11)
+        Stats.objects.create(game=self.g, player=self.p1, goals=1, assists=2)
+        self.s = Stats.objects.create(game=self.g, player=self.p2, goals=3, assists=0)
+
+    def test_no_stats(self):
+        Stats.objects.all().delete()
+        avgs = get_squad_averages()
+        self.assertEqual(avgs['games'], 0)
+        self.assertEqual(avgs['goals'], 0)
+
+    def test_averages(self):
+        avgs = get_squad_averages()
+        self.assertEqual(avgs['games'], 1)
+        self.assertEqual(avgs['goals'], 2)
+        self.assertEqual(avgs['assists'], 1)
+
+    def test_cached_until_stats_change(self):
+        get_squad_averages()
+        with self.assertNumQueries(2):
+            self.assertEqual(get_squad_averages()['goals'], 2)
+
+        self.s.goals = 5
+        self.s.save()
+        self.assertEqual(get_squad_averages()['goals'], 3)
+
+
+class PageCacheTest(TestCase):
+
+    def setUp(self):
+        self.r = Rival.objects.create(team_name="test_team", home="test_home")
+        self.g = Game.objects.create(rival=self.r, point_gain=1, point_reduce=0, game_date=timezone.now())
+        self.p = Player.objects.create(name="test1", sebango=10)
+        self.s = Stats.objects.create(game=self.g, player=self.p, goals=1, assists=2)
+
+    def test_served_from_cache(self):
+        url = reverse("player_list")
+        self.client.get(url)
+        # セッションなし: 世代番号とページのキャッシュ読み込みだけ
+        with self.assertNumQueries(2):
+            res = self.client.get(url)
+        self.assertContains(res, "test1")
+
+    def test_write_invalidates_page(self):
+        url = reverse("player_detail", args=(self.p.pk,))
+        self.client.get(url)
+        self.s.goals = 7
+        self.s.save()
+        self.assertContains(self.client.get(url), '<td class="text-center">7</td>')
+
+    def test_write_invalidates_list(self):
+        url = reverse("player_list")
+        self.client.get(url)
+        self.s.goals = 4
+        self.s.save()
+        self.assertContains(self.client.get(url), "<td>4</td>")
+        url = reverse("rival_list")
+        self.client.get(url)
+        Game.objects.create(rival=self.r, point_gain=0, point_reduce=3, game_date=timezone.now())
+        self.assertContains(self.client.get(url), "1勝 1敗 0分")
+
+    def test_unrelated_write_keeps_page(self):
+        url = reverse("player_list")
+        self.client.get(url)
+        Rival.objects.create(team_name="other", home="home")
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+    def test_keyed_by_user(self):
+        url = reverse("record_index")
+        self.assertNotContains(self.client.get(url), "tmp")
+        User.objects.create_user('tmp', 'a@b.com', 'tmp')
+        self.client.login(username='tmp', password='tmp')
+        self.assertContains(self.client.get(url), "tmp")
+
+    @override_settings(RECORD_PAGE_CACHE=False)
+    def test_disabled(self):
+        url = reverse("player_list")
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
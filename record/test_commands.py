@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from .models import Game, Rival, Stats, Player, PlayerCareerTotals, RivalRecord
+
+# -----------------------------------------------
+# TEST COMMANDS
+# -----------------------------------------------
+
+
+class ImportMatchesCommandTest(TestCase):
+
+    header = "game_date,rival,field,point_gain,point_reduce,game_remark,player,goals,assists,passes,intercepts,dribbles,tuckles,remark\n"
+
+    def setUp(self):
+        self.r = Rival.objects.create(team_name="test_rival", home="test_home")
+        self.p1 = Player.objects.create(name="p1", sebango=1)
+        self.p2 = Player.objects.create(name="p2", sebango=2)
+
+    def write(self, content, suffix):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_matches', path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        path = self.write(self.header +
+                          "2018-06-01,test_rival,f,2,1,,p1,1,0,0,0,0,0,\n"
+                          "2018-06-01,test_rival,f,2,1,,p2,1,1,0,0,0,0,\n"
+                          "2018-06-08 10:00:00,test_rival,f,0,0,,p1,0,0,0,0,0,0,\n"
+                          "2018-06-15,test_rival,f,0,3,,,,,,,,,\n", ".csv")
+        out = self.run_import(path, "--batch-size", "2")
+        self.assertIn("rows/s", out)
+        self.assertEqual(Game.objects.count(), 3)
+        self.assertEqual(Stats.objects.count(), 3)
+
+        totals = PlayerCareerTotals.objects.get(player=self.p1)
+        self.assertEqual((totals.appearances, totals.goals), (2, 1))
+        record = RivalRecord.objects.get(rival=self.r)
+        self.assertEqual((record.played, record.won, record.lost, record.drawn), (3, 1, 1, 1))
+        self.assertEqual(record.last_played.day, 15)
+        self.assertEqual(PlayerCareerTotals.verify(), [])
+        self.assertEqual(RivalRecord.verify(), [])
+
+    def test_import_jsonl_create_missing(self):
+        rows = [
+            {"game_date": "2018-06-01", "rival": "new_rival", "point_gain": 1, "point_reduce": 0, "player": "new_player", "goals": 1},
+        ]
+        path = self.write("\n".join(json.dumps(r) for r in rows) + "\n", ".jsonl")
+        self.run_import(path, "--create-missing")
+        s = Stats.objects.get()
+        self.assertEqual(s.player.name, "new_player")
+        self.assertEqual(s.game.rival.team_name, "new_rival")
+        self.assertEqual(s.game.rival_name, "new_rival")
+
+    def test_unknown_name(self):
+        path = self.write(self.header + "2018-06-01,unknown,f,2,1,,p1,1,0,0,0,0,0,\n", ".csv")
+        with self.assertRaisesMessage(CommandError, "line 2"):
+            self.run_import(path)
+        self.assertEqual(Game.objects.count(), 0)
+
+    def test_duplicate_player(self):
+        path = self.write(self.header +
+                          "2018-06-01,test_rival,f,2,1,,p1,1,0,0,0,0,0,\n"
+                          "2018-06-01,test_rival,f,2,1,,p1,1,0,0,0,0,0,\n", ".csv")
+        with self.assertRaisesMessage(CommandError, "duplicate"):
+            self.run_import(path)
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+
+from .models import Game, Rival, Stats, Player
+
+# -----------------------------------------------
+# TEST EXPORTS
+# -----------------------------------------------
+
+
+class ExportViewTest(TestCase):
+
+    def setUp(self):
+        self.r1 = Rival.objects.create(team_name="rival1", home="home1")
+        self.r2 = Rival.objects.create(team_name="rival2", home="home2")
+        self.p = Player.objects.create(name="player", sebango=10)
+        self.g1 = Game.objects.create(rival=self.r1, field="f", point_gain=2, point_reduce=1, game_date=parse_datetime("2018-06-01 10:00:00"))
+        self.g2 = Game.objects.create(rival=self.r2, field="f", point_gain=0, point_reduce=1, game_date=parse_datetime("2018-07-01 10:00:00"))
+        Stats.objects.create(game=self.g1, player=self.p, goals=2)
+        Stats.objects.create(game=self.g2, player=self.p, goals=0)
+
+    def get(self, name, fmt, **params):
+        res = self.client.get(reverse("export", args=(name, fmt)), params)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.streaming)
+        return b''.join(res.streaming_content).decode('utf-8')
+
+    def test_games_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.get("games", "csv"))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['rival'], "rival1")
+        self.assertEqual(rows[0]['game_date'], "2018-06-01 10:00:00")
+
+    def test_stats_jsonl(self):
+        lines = self.get("stats", "jsonl").splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['player'], "player")
+        self.assertEqual(rows[0]['rival'], "rival1")
+        self.assertEqual(rows[0]['goals'], 2)
+
+    def test_rivals_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.get("rivals", "csv"))))
+        self.assertEqual(rows[0]['won'], "1")
+        self.assertEqual(rows[1]['lost'], "1")
+
+    def test_date_filter(self):
+        rows = list(csv.DictReader(io.StringIO(self.get("stats", "csv", **{"from": "2018-06-15"}))))
+        self.assertEqual([r['rival'] for r in rows], ["rival2"])
+        rows = list(csv.DictReader(io.StringIO(self.get("games", "csv", to="2018-06-01"))))
+        self.assertEqual([r['rival'] for r in rows], ["rival1"])
+
+    def test_rival_filter(self):
+        rows = list(csv.DictReader(io.StringIO(self.get("stats", "csv", rival=self.r2.pk))))
+        self.assertEqual([r['rival'] for r in rows], ["rival2"])
+
+    def test_bad_params(self):
+        res = self.client.get(reverse("export", args=("games", "csv")), {"from": "yesterday"})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.get(reverse("export", args=("players", "csv")))
+        self.assertEqual(res.status_code, 404)
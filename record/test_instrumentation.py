@@ -0,0 +1,73 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .instrumentation import count_cache, current
+from .models import Game, Rival, Stats, Player
+
+# -----------------------------------------------
+# TEST INSTRUMENTATION
+# -----------------------------------------------
+
+
+def timing(response):
+    """{'db': {'dur': '1.2', 'desc': '"3 queries"'}, ...} from the Server-Timing header."""
+    metrics = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, *params = entry.split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+
+class InstrumentationMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.r = Rival.objects.create(team_name="test_team", home="test_home")
+        self.g = Game.objects.create(rival=self.r, point_gain=1, point_reduce=0, game_date=timezone.now())
+        self.p = Player.objects.create(name="test1", sebango=10)
+        Stats.objects.create(game=self.g, player=self.p, goals=1, assists=2)
+
+    @override_settings(RECORD_PAGE_CACHE=False)
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(reverse("player_detail", args=(self.p.pk,)))
+        metrics = timing(res)
+        self.assertEqual(set(metrics), {'total', 'db', 'tpl', 'cache'})
+        self.assertEqual(metrics['db']['desc'], '"%d queries"' % len(ctx))
+        self.assertGreater(float(metrics['tpl']['dur']), 0)
+        self.assertGreaterEqual(float(metrics['total']['dur']), float(metrics['db']['dur']))
+
+    def test_cache_hits(self):
+        url = reverse("player_list")
+        self.assertIn('"0 hits', timing(self.client.get(url))['cache']['desc'])
+        self.assertIn('"1 hits 0 misses"', timing(self.client.get(url))['cache']['desc'])
+
+    def test_no_template(self):
+        res = self.client.get(reverse("api_rival_list"))
+        self.assertEqual(timing(res)['tpl']['dur'], '0.0')
+
+    def test_log_line(self):
+        with self.assertLogs('record.requests', 'INFO') as logs:
+            self.client.get(reverse("rival_detail", args=(self.r.pk,)))
+        record = logs.records[-1]
+        self.assertRegex(record.getMessage(),
+                         r'^view=rival_detail method=GET path=/rivals/\d+ status=200 total_ms=[\d.]+ '
+                         r'db_queries=\d+ db_ms=[\d.]+ template_ms=[\d.]+ cache_hits=\d+ cache_misses=\d+$')
+        self.assertEqual(record.view, 'rival_detail')
+        self.assertEqual(set(record.metrics), {'total_ms', 'db_queries', 'db_ms', 'template_ms',
+                                               'cache_hits', 'cache_misses'})
+
+    def test_unresolved(self):
+        with self.assertLogs('record.requests', 'INFO') as logs:
+            self.client.get('/no-such-page/')
+        self.assertTrue(logs.records[-1].getMessage().startswith('view=- '))
+
+    @override_settings(RECORD_SERVER_TIMING=False)
+    def test_header_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse("player_list")))
+
+    def test_outside_request(self):
+        self.assertIsNone(current())
+        count_cache(hits=1)
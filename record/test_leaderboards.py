@@ -0,0 +1,113 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+
+from .leaderboards import leaderboards, cached_leaderboards, parse_params
+from .models import Game, Rival, Stats, Player
+
+# -----------------------------------------------
+# TEST LEADERBOARDS
+# -----------------------------------------------
+
+
+class LeaderboardsTest(TestCase):
+
+    def setUp(self):
+        self.r1 = Rival.objects.create(team_name="rival1", home="home")
+        self.r2 = Rival.objects.create(team_name="rival2", home="home")
+        self.g1 = Game.objects.create(rival=self.r1, point_gain=3, point_reduce=0, game_date=parse_datetime("2018-06-01 10:00:00"))
+        self.g2 = Game.objects.create(rival=self.r2, point_gain=1, point_reduce=0, game_date=parse_datetime("2018-07-01 10:00:00"))
+        self.p1 = Player.objects.create(name="p1", sebango=1)
+        self.p2 = Player.objects.create(name="p2", sebango=2)
+        self.p3 = Player.objects.create(name="p3", sebango=3)
+        self.stats(self.g1, self.p1, goals=2, assists=1)
+        self.stats(self.g1, self.p2, goals=1, assists=1)
+        self.stats(self.g2, self.p2, goals=1, assists=0)
+        self.stats(self.g2, self.p3, goals=0, assists=3)
+
+    def stats(self, game, player, **values):
+        fields = dict(passes=0, intercepts=0, dribbles=0, tuckles=0)
+        fields.update(values)
+        return Stats.objects.create(game=game, player=player, **fields)
+
+    def names(self, rows):
+        return [(r['rank'], r['name'], r['value']) for r in rows]
+
+    def test_rank_ties(self):
+        boards = leaderboards()
+        self.assertEqual(self.names(boards['goals']), [(1, "p1", 2), (1, "p2", 2)])
+        self.assertEqual(self.names(boards['assists']), [(1, "p3", 3), (2, "p1", 1), (2, "p2", 1)])
+
+    def test_zero_is_not_ranked(self):
+        self.assertEqual(leaderboards()['passes'], [])
+
+    def test_top(self):
+        self.assertEqual(self.names(leaderboards(top=1)['assists']), [(1, "p3", 3)])
+
+    def test_rank_and_dense_rank(self):
+        Player.objects.create(name="p4", sebango=4)
+        self.stats(self.g2, Player.objects.get(name="p4"), goals=1)
+        self.assertEqual([r['rank'] for r in leaderboards(top=3)['goals']], [1, 1, 3])
+        self.assertEqual([r['rank'] for r in leaderboards(top=3, method='dense')['goals']], [1, 1, 2])
+
+    def test_one_query(self):
+        with self.assertNumQueries(1):
+            leaderboards()
+        with self.assertNumQueries(1):
+            leaderboards(rival_id=self.r1.pk)
+
+    def test_rival_scope(self):
+        boards = leaderboards(rival_id=self.r1.pk)
+        self.assertEqual(self.names(boards['goals']), [(1, "p1", 2), (2, "p2", 1)])
+        self.assertEqual(boards['goals'][1]['appearances'], 1)
+
+    def test_date_scope(self):
+        params = parse_params({'from': '2018-06-15'})
+        boards = leaderboards(**params)
+        self.assertEqual(self.names(boards['assists']), [(1, "p3", 3)])
+        params = parse_params({'to': '2018-06-01'})
+        self.assertEqual(self.names(leaderboards(**params)['goals']), [(1, "p1", 2), (2, "p2", 1)])
+
+    def test_single_stat(self):
+        self.assertEqual(list(leaderboards(**parse_params({'stat': 'assists'}))), ['assists'])
+
+    def test_bad_params(self):
+        for params in ({'top': 'x'}, {'rank': 'row'}, {'rival': 'a'}, {'stat': 'fouls'}, {'from': '2018'}):
+            with self.subTest(params=params):
+                with self.assertRaises(ValueError):
+                    parse_params(params)
+
+    def test_cached_until_stats_change(self):
+        cached_leaderboards(**parse_params({}))
+        with self.assertNumQueries(2):
+            cached_leaderboards(**parse_params({}))
+        self.stats(self.g2, self.p1, goals=5)
+        self.assertEqual(cached_leaderboards(**parse_params({}))['goals'][0]['value'], 7)
+
+
+class LeaderboardsViewTest(TestCase):
+
+    def setUp(self):
+        r = Rival.objects.create(team_name="rival1", home="home")
+        g = Game.objects.create(rival=r, point_gain=3, point_reduce=0, game_date=parse_datetime("2018-06-01 10:00:00"))
+        self.p = Player.objects.create(name="scorer", sebango=9)
+        Stats.objects.create(game=g, player=self.p, goals=3, assists=0, passes=0, intercepts=0, dribbles=0, tuckles=0)
+
+    def test_page(self):
+        res = self.client.get(reverse("leaderboards"))
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, "scorer")
+        self.assertTemplateUsed(res, "record/leaderboards.html")
+
+    def test_page_bad_request(self):
+        res = self.client.get(reverse("leaderboards"), {'rank': 'row'})
+        self.assertEqual(res.status_code, 400)
+
+    def test_api(self):
+        res = self.client.get(reverse("api_leaderboards"), {'top': 1})
+        self.assertEqual(res.status_code, 200)
+        data = res.json()
+        self.assertEqual(data['top'], 1)
+        self.assertEqual(data['boards']['goals'][0]['name'], "scorer")
+        res = self.client.get(reverse("api_leaderboards"), {'top': 1}, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, 304)
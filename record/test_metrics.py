@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+from multiprocessing import get_context
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import metrics
+from .instrumentation import RequestMetrics
+from .models import Player
+
+# -----------------------------------------------
+# TEST METRICS
+# -----------------------------------------------
+
+
+def worker(path, n):
+    # gunicorn のワーカーの代わりに別プロセスから書き込む
+    with override_settings(RECORD_METRICS_DB=path):
+        buffer = metrics.Buffer()
+        for _ in range(n):
+            buffer.add('record_requests_total', 'view="player_list",status="2xx"')
+        buffer.flush(force=True)
+
+
+def samples(text):
+    """{'name{labels}': value} of the exposition, without comments."""
+    lines = [line for line in text.splitlines() if line and not line.startswith('#')]
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1]) for line in lines}
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'metrics.sqlite3')
+        override = override_settings(RECORD_METRICS=True, RECORD_METRICS_DB=self.path,
+                                     RECORD_METRICS_FLUSH_INTERVAL=0, RECORD_PAGE_CACHE=False,
+                                     RECORD_METRICS_TOKEN=None)
+        override.enable()
+        self.addCleanup(override.disable)
+        # 前のテストで書き込まれなかった分を持ち越さない
+        with metrics._buffer.lock:
+            metrics._buffer.pending = {}
+        self.p = Player.objects.create(name="test1", sebango=10)
+
+    def scrape(self, **extra):
+        res = self.client.get(reverse("metrics"), **extra)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], metrics.CONTENT_TYPE)
+        return res.content.decode()
+
+    def test_request_metrics(self):
+        self.client.get(reverse("player_list"))
+        self.client.get(reverse("player_list"))
+        self.client.get(reverse("player_detail", args=(self.p.pk,)))
+        text = self.scrape()
+        values = samples(text)
+        self.assertEqual(values['record_requests_total{view="player_list",status="2xx"}'], 2)
+        self.assertEqual(values['record_request_duration_seconds_count{view="player_list"}'], 2)
+        self.assertEqual(values['record_request_duration_seconds_bucket{view="player_list",le="+Inf"}'], 2)
+        self.assertGreater(values['record_request_duration_seconds_sum{view="player_list"}'], 0)
+        self.assertEqual(values['record_request_queries_count{view="player_detail"}'], 1)
+        self.assertIn('# TYPE record_request_duration_seconds histogram', text)
+        self.assertIn('# TYPE record_requests_total counter', text)
+
+        # バケットは累積で le の順に並ぶ
+        buckets = [line for line in text.splitlines()
+                   if line.startswith('record_request_queries_bucket{view="player_list"')]
+        self.assertEqual(len(buckets), len(metrics.QUERY_BUCKETS) + 1)
+        self.assertTrue(buckets[-1].startswith('record_request_queries_bucket{view="player_list",le="+Inf"}'))
+        counts = [float(line.rsplit(' ', 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))
+
+    def test_cache_ratio(self):
+        # 行キャッシュの読み込みは数えず、ページキャッシュだけを見る
+        with override_settings(RECORD_PAGE_CACHE=True):
+            self.client.get(reverse("player_list"))
+            self.client.get(reverse("player_list"))
+        values = samples(self.scrape())
+        self.assertEqual(values['record_cache_hits_total{view="player_list"}'], 1)
+        self.assertEqual(values['record_cache_misses_total{view="player_list"}'], 1)
+        self.assertEqual(values['record_cache_hit_ratio{view="player_list"}'], 0.5)
+
+    def test_errors(self):
+        m = RequestMetrics()
+        m.total, m.db_queries = 0.2, 4
+        metrics.record_request('game_list', 500, m)
+        metrics.record_request('game_list', 404, m)
+        values = samples(self.scrape())
+        self.assertEqual(values['record_request_errors_total{view="game_list"}'], 1)
+        self.assertEqual(values['record_requests_total{view="game_list",status="5xx"}'], 1)
+        self.assertEqual(values['record_requests_total{view="game_list",status="4xx"}'], 1)
+        self.assertEqual(values['record_request_duration_seconds_bucket{view="game_list",le="0.1"}'], 0)
+        self.assertEqual(values['record_request_duration_seconds_bucket{view="game_list",le="0.25"}'], 2)
+        self.assertEqual(values['record_request_queries_bucket{view="game_list",le="5"}'], 2)
+
+    def test_processes_add_up(self):
+        ctx = get_context('fork')
+        procs = [ctx.Process(target=worker, args=(self.path, n)) for n in (3, 4)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        values = samples(metrics.render(metrics.read_store()))
+        self.assertEqual(values['record_requests_total{view="player_list",status="2xx"}'], 7)
+
+    def test_store_error_does_not_fail_request(self):
+        broken = os.path.join(self.dir, 'missing', 'metrics.sqlite3')
+        with override_settings(RECORD_METRICS_DB=broken):
+            with self.assertLogs('record.metrics', 'WARNING'):
+                res = self.client.get(reverse("player_list"))
+        self.assertEqual(res.status_code, 200)
+        # 書けなかった分は次の書き込みで入る
+        values = samples(self.scrape())
+        self.assertEqual(values['record_requests_total{view="player_list",status="2xx"}'], 1)
+
+    def test_label_escaping(self):
+        self.assertEqual(metrics.label_value('a"b\\c\n'), 'a\\"b\\\\c\\n')
+
+    def test_token(self):
+        with override_settings(RECORD_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+            self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+            staff = User.objects.create_user('staff', 'a@b.com', 'staff', is_staff=True)
+            self.client.force_login(staff)
+            self.scrape()
+
+    def test_disabled(self):
+        with override_settings(RECORD_METRICS=False):
+            self.client.get(reverse("player_list"))
+        self.assertNotIn('view="player_list"', self.scrape())
+        # キャッシュを使わないページは比率を出さない
+        self.client.get(reverse("api_rival_list"))
+        self.assertNotIn('record_cache_hit_ratio{view="api_rival_list"}', self.scrape())
@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import engines
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from .instrumentation import InstrumentationMiddleware
+from .models import Game, Rival, Stats, Player
+from .nplusone import NPlusOneError, detect_nplusone, fingerprint, untracked
+
+# -----------------------------------------------
+# TEST N+1 DETECTOR
+# -----------------------------------------------
+
+
+class FingerprintTest(TestCase):
+
+    def test_parameters_collapsed(self):
+        self.assertEqual(fingerprint('SELECT "a"."id" FROM "a" WHERE "a"."id" = %s LIMIT 21'),
+                         'SELECT "a"."id" FROM "a" WHERE "a"."id" = ? LIMIT ?')
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+                         fingerprint('SELECT * FROM t WHERE id IN (%s)'))
+        self.assertEqual(fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+                         'INSERT INTO t (a, b) VALUES (...)')
+        self.assertEqual(fingerprint("SELECT *\n  FROM t WHERE name = 'O''Neil' AND n = 1.5"),
+                         'SELECT * FROM t WHERE name = ? AND n = ?')
+        self.assertEqual(fingerprint('RELEASE SAVEPOINT "s1396_x8"'), 'RELEASE SAVEPOINT ?')
+
+    def test_identifiers_kept(self):
+        self.assertNotEqual(fingerprint('SELECT * FROM t1 WHERE T2.id = %s'),
+                            fingerprint('SELECT * FROM t1 WHERE T3.id = %s'))
+
+
+class DetectorTest(TestCase):
+
+    def setUp(self):
+        self.r = Rival.objects.create(team_name="test_team", home="test_home")
+        self.g = Game.objects.create(rival=self.r, point_gain=1, point_reduce=0, game_date=timezone.now())
+        for i in range(5):
+            p = Player.objects.create(name="p%d" % i, sebango=i + 1)
+            Stats.objects.create(game=self.g, player=p, goals=i)
+
+    def test_enabled_in_tests(self):
+        self.assertEqual(settings.RECORD_NPLUSONE, 'raise')
+
+    def test_raises_with_origin(self):
+        with self.assertRaises(NPlusOneError) as cm:
+            with detect_nplusone('loop'):
+                for stats in Stats.objects.all():
+                    stats.player.name
+        message = str(cm.exception)
+        self.assertIn('loop: 5x at test_nplusone.py:', message)
+        self.assertIn('FROM "record_player"', message)
+
+    def test_under_threshold(self):
+        with detect_nplusone('loop', threshold=5) as tracker:
+            for stats in Stats.objects.all():
+                stats.player.name
+        self.assertEqual(tracker.repeated(), [])
+        with detect_nplusone('loop'):
+            for stats in Stats.objects.select_related('player'):
+                stats.player.name
+
+    def test_template_origin(self):
+        template = engines['django'].from_string("{% for s in statss %}\n{{ s.player.name }}\n{% endfor %}")
+        with self.assertRaises(NPlusOneError) as cm:
+            with detect_nplusone('template'):
+                template.render({'statss': Stats.objects.all()})
+        self.assertIn(' at <unknown source>:2: ', str(cm.exception))
+
+    def test_ignored_tables(self):
+        with override_settings(RECORD_NPLUSONE_IGNORE=('record_player',)):
+            with detect_nplusone('loop'):
+                for stats in Stats.objects.all():
+                    stats.player.name
+
+    def test_untracked(self):
+        with detect_nplusone('loop'):
+            with untracked():
+                for stats in Stats.objects.all():
+                    stats.player.name
+
+    def test_cache_table_is_tracked(self):
+        # DB キャッシュを行ごとに読むと N+1 になる (世代番号とページのキーだけが対象外)
+        self.assertNotIn('record_cache', getattr(settings, 'RECORD_NPLUSONE_IGNORE', ()))
+        with self.assertRaises(NPlusOneError):
+            with detect_nplusone('rows'):
+                for stats in Stats.objects.select_related('player'):
+                    cache.get('row:%d' % stats.player_id)
+
+    def test_middleware(self):
+        def view(request):
+            return HttpResponse(', '.join(s.player.name for s in Stats.objects.all()))
+
+        request = RequestFactory().get('/players/')
+        with self.assertRaises(NPlusOneError):
+            InstrumentationMiddleware(view)(request)
+        with override_settings(RECORD_NPLUSONE='log'):
+            with self.assertLogs('record.nplusone', 'WARNING') as logs:
+                self.assertEqual(InstrumentationMiddleware(view)(request).status_code, 200)
+            self.assertIn('- /players/: 5x at test_nplusone.py:', logs.output[0])
+        with override_settings(RECORD_NPLUSONE=None):
+            self.assertEqual(InstrumentationMiddleware(view)(request).status_code, 200)
@@ -0,0 +1,126 @@
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .models import Player
+from .profiling import PROFILE_ID_HEADER, StackSampler, list_profiles, profile_paths
+
+# -----------------------------------------------
+# TEST PROFILING
+# -----------------------------------------------
+
+
+def busy(seconds):
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+def outer():
+    busy(0.05)
+
+
+class StackSamplerTest(TestCase):
+
+    def test_samples(self):
+        with StackSampler(interval=0.001, stop_code=self.test_samples.__code__) as sampler:
+            outer()
+        lines = sampler.collapsed()
+        label = 'test_profiling.py:%d(%s)'
+        prefix = ';'.join([label % (outer.__code__.co_firstlineno, 'outer'),
+                           label % (busy.__code__.co_firstlineno, 'busy')])
+        # 呼び出し元 (このテスト) より上のフレームは含まない
+        self.assertTrue(lines)
+        self.assertTrue(all(line.startswith(prefix) for line in lines), lines)
+        self.assertGreater(sum(int(line.rsplit(' ', 1)[1]) for line in lines), 5)
+
+    def test_overlapping_samplers_restore_switch_interval(self):
+        before = sys.getswitchinterval()
+        first = StackSampler(interval=0.001).__enter__()
+        second = StackSampler(interval=0.001).__enter__()
+        # 先に始めた方が先に終わっても、もう一方が止まるまでは短いまま
+        first.__exit__(None, None, None)
+        self.assertEqual(sys.getswitchinterval(), 0.0005)
+        second.__exit__(None, None, None)
+        self.assertEqual(sys.getswitchinterval(), before)
+
+
+class ProfilingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        override = override_settings(RECORD_PROFILE_DIR=self.dir, RECORD_PAGE_CACHE=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        Player.objects.create(name="test1", sebango=10)
+        self.staff = User.objects.create_user('staff', 'a@b.com', 'staff', is_staff=True)
+
+    def test_staff_query_param(self):
+        self.client.force_login(self.staff)
+        res = self.client.get(reverse("player_list"), {'_profile': '1'})
+        self.assertEqual(res.status_code, 200)
+        profile_id = res[PROFILE_ID_HEADER]
+        paths = profile_paths(profile_id)
+        for path in paths.values():
+            self.assertTrue(os.path.exists(path), path)
+        # サンプルは間隔次第なので、決まった結果になる cProfile の方で見る
+        functions = pstats.Stats(paths['prof']).stats
+        self.assertTrue(any(filename.endswith(os.path.join('record', 'views.py')) and name == 'get_context_data'
+                            for filename, line, name in functions), list(functions)[:20])
+
+        meta, = list_profiles()
+        self.assertEqual((meta['id'], meta['view'], meta['status'], meta['user']),
+                         (profile_id, 'player_list', 200, 'staff'))
+
+    def test_header(self):
+        self.client.force_login(self.staff)
+        res = self.client.get(reverse("rival_list"), HTTP_X_RECORD_PROFILE='1')
+        self.assertIn(PROFILE_ID_HEADER, res)
+
+    def test_not_staff(self):
+        User.objects.create_user('tmp', 'a@b.com', 'tmp')
+        self.client.login(username='tmp', password='tmp')
+        self.assertNotIn(PROFILE_ID_HEADER, self.client.get(reverse("player_list"), {'_profile': '1'}))
+        self.client.logout()
+        self.assertNotIn(PROFILE_ID_HEADER, self.client.get(reverse("player_list"), {'_profile': '1'}))
+        self.assertEqual(list_profiles(), [])
+
+    def test_not_asked(self):
+        self.client.force_login(self.staff)
+        self.assertNotIn(PROFILE_ID_HEADER, self.client.get(reverse("player_list")))
+        self.assertNotIn(PROFILE_ID_HEADER, self.client.get(reverse("player_list"), {'_profile': '0'}))
+        with override_settings(RECORD_PROFILING=False):
+            self.assertNotIn(PROFILE_ID_HEADER, self.client.get(reverse("player_list"), {'_profile': '1'}))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('profiles', stdout=out)
+        self.assertIn("No profiles", out.getvalue())
+
+        self.client.force_login(self.staff)
+        profile_id = self.client.get(reverse("player_list"), {'_profile': '1'})[PROFILE_ID_HEADER]
+        out = StringIO()
+        call_command('profiles', stdout=out)
+        self.assertIn(profile_id, out.getvalue())
+        self.assertIn("GET /players/?_profile=1", out.getvalue())
+
+        out = StringIO()
+        call_command('profiles', profile_id, '--limit=5', '--sort=tottime', stdout=out)
+        self.assertIn("Heaviest stacks (samples, one every 1 ms)", out.getvalue())
+        self.assertIn("function calls", out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('profiles', '../../etc/passwd', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('profiles', '20000101-000000-00000000', stdout=StringIO())
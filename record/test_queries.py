@@ -0,0 +1,113 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Game, Rival, Stats, Player
+
+# -----------------------------------------------
+# TEST QUERY COUNTS
+# -----------------------------------------------
+
+
+@override_settings(RECORD_PAGE_CACHE=False)
+class QueryCountTest(TestCase):
+    """Every page in record/urls.py must cost a fixed number of queries.
+
+    Each url is requested against a small dataset and again after the data
+    has grown; the query count must match the pinned number both times.
+    The page cache is off so the counts are those of an actual render.
+    """
+
+    # url name -> (needs pk of / reverse args, queries)
+    # ログイン済みなので、テンプレートを描画するページはセッションとユーザーの取得で2クエリ含む
+    # シーズンを選べるページはシーズン一覧の1クエリを含む
+    urls = {
+        'record_index': (None, 2),
+        'game_list': (None, 4),
+        'game_detail': ('game', 5),
+        'game_new': (None, 4),
+        'game_new_player': ('form_id', 2),
+        'game_new_rival': (None, 2),
+        'game_update': ('game', 4),
+        'game_add_stats': ('game', 4),
+        'rival_list': (None, 4),
+        'rival_detail': ('rival', 5),
+        'rival_new': (None, 2),
+        'rival_update': ('rival', 3),
+        'player_list': (None, 4),
+        'player_detail': ('player', 8),
+        'player_new': (None, 2),
+        'player_update': ('player', 3),
+        'stats_update': ('stats', 5),
+        'leaderboards': (None, 5),
+        'export': (('stats', 'csv'), 1),
+        'api_game_list': (None, 2),
+        'api_game_detail': ('game', 3),
+        'api_player_list': (None, 3),
+        'api_player_detail': ('player', 3),
+        'api_rival_list': (None, 2),
+        'api_rival_detail': ('rival', 3),
+        'api_leaderboards': (None, 3),
+        # 集計はローカルの SQLite ファイルから読むので DB へのクエリはない
+        'metrics': (None, 0),
+    }
+
+    def setUp(self):
+        User.objects.create_user('tmp', 'a@b.com', 'tmp')
+        self.client.login(username='tmp', password='tmp')
+        self.rival = Rival.objects.create(team_name="rival", home="home")
+        self.players = []
+        self.grow(1)
+
+    def grow(self, n):
+        start = len(self.players)
+        for i in range(start, start + n):
+            self.players.append(Player.objects.create(name="player%d" % i, sebango=i))
+        for i in range(n):
+            rival = Rival.objects.create(team_name="rival_%d_%d" % (start, i), home="home")
+            for r in (self.rival, rival):
+                game = Game.objects.create(rival=r, point_gain=i, point_reduce=1, game_date=timezone.now())
+                for p in self.players:
+                    Stats.objects.create(game=game, player=p, goals=1, assists=1)
+
+    def url(self, name, target):
+        if target is None:
+            return reverse(name)
+        if isinstance(target, tuple):
+            return reverse(name, args=target)
+        obj = {
+            'game': Game.objects.filter(rival=self.rival).first(),
+            'rival': self.rival,
+            'player': self.players[0],
+            'stats': Stats.objects.filter(player=self.players[0]).first(),
+        }.get(target)
+        return reverse(name, args=(obj.pk if obj else 1,))
+
+    def count_queries(self, name, target):
+        url = self.url(name, target)
+        # キャッシュの書き込みを数えないよう一度表示しておく
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+            if res.streaming:
+                b''.join(res.streaming_content)
+        self.assertEqual(res.status_code, 200, name)
+        return len(ctx)
+
+    def test_fixed_query_counts(self):
+        for name, (target, expected) in self.urls.items():
+            with self.subTest(url=name, size="small"):
+                self.assertEqual(self.count_queries(name, target), expected)
+
+        self.grow(5)
+
+        for name, (target, expected) in self.urls.items():
+            with self.subTest(url=name, size="large"):
+                self.assertEqual(self.count_queries(name, target), expected)
+
+    def test_every_url_is_covered(self):
+        from .urls import urlpatterns
+        self.assertEqual(set(p.name for p in urlpatterns), set(self.urls))
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+
+from .models import Game, Rival, Stats, Player
+from .rolling import with_rolling_form, current_form, form_of
+
+# -----------------------------------------------
+# TEST ROLLING FORM
+# -----------------------------------------------
+
+
+class RollingFormTest(TestCase):
+
+    def setUp(self):
+        self.r = Rival.objects.create(team_name="rival", home="home")
+        self.p1 = Player.objects.create(name="p1", sebango=1)
+        self.p2 = Player.objects.create(name="p2", sebango=2)
+        start = parse_datetime("2018-04-01 10:00:00")
+        # 登録順と試合日の順をわざと逆にする
+        self.goals = [1, 0, 2, 0, 3, 1, 0, 0, 2, 1, 4, 0]
+        self.games = []
+        for i in reversed(range(len(self.goals))):
+            g = Game.objects.create(rival=self.r, point_gain=1, point_reduce=0, game_date=start + timedelta(days=7 * i))
+            Stats.objects.create(game=g, player=self.p1, goals=self.goals[i], assists=i % 2)
+            self.games.insert(0, g)
+        Stats.objects.create(game=self.games[0], player=self.p2, goals=5, assists=1)
+
+    def test_rolling_sums(self):
+        rows = list(with_rolling_form(Stats.objects.filter(player=self.p1))
+                    .order_by('game__game_date').values('goals_last5', 'goals_last10', 'appearances_last5'))
+        for i, row in enumerate(rows):
+            self.assertEqual(row['goals_last5'], sum(self.goals[max(0, i - 4):i + 1]))
+            self.assertEqual(row['goals_last10'], sum(self.goals[max(0, i - 9):i + 1]))
+            self.assertEqual(row['appearances_last5'], min(i + 1, 5))
+
+    def test_partitioned_by_player(self):
+        row = with_rolling_form(Stats.objects.all()).get(player=self.p2)
+        self.assertEqual((row.goals_last5, row.appearances_last10), (5, 1))
+
+    def test_current_form_one_query(self):
+        with self.assertNumQueries(1):
+            forms = current_form()
+        self.assertEqual(forms[self.p1.pk]['last5'],
+                         {'appearances': 5, 'goals': sum(self.goals[-5:]), 'assists': 3})
+        self.assertEqual(forms[self.p1.pk]['last10']['goals'], sum(self.goals[-10:]))
+        self.assertEqual(forms[self.p2.pk]['last10'], {'appearances': 1, 'goals': 5, 'assists': 1})
+
+    def test_current_form_follows_game_date(self):
+        g = Game.objects.get(pk=self.games[0].pk)
+        g.game_date = self.games[-1].game_date + timedelta(days=7)
+        g.save()
+        # 最初の試合が最新になる
+        self.assertEqual(current_form([self.p1.pk])[self.p1.pk]['last5']['goals'],
+                         sum(self.goals[-4:]) + self.goals[0])
+
+    def test_no_stats(self):
+        self.assertEqual(form_of({})['last5'], {'appearances': 0, 'goals': 0, 'assists': 0})
+
+    def test_player_page(self):
+        res = self.client.get(reverse("player_detail", args=(self.p1.pk,)))
+        self.assertEqual(res.context['form']['last5']['goals'], sum(self.goals[-5:]))
+
+    def test_api(self):
+        data = self.client.get(reverse("api_player_list")).json()
+        self.assertEqual(data['results'][0]['form']['last10']['goals'], sum(self.goals[-10:]))
+        data = self.client.get(reverse("api_player_detail", args=(self.p1.pk,))).json()
+        self.assertEqual(data['form']['last5']['goals'], sum(self.goals[-5:]))
+        self.assertEqual(data['stats'][4]['goals_last5'], sum(self.goals[:5]))
@@ -1,8 +1,12 @@
+from unittest import mock
+
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from .models import Game, Rival, Player
-from .forms import GameForm, StatsForm
+from .models import Game, Rival, Player, Stats, PlayerCareerTotals
+from .forms import GameForm, StatsForm, StatsFormSet
 from .service import StatsCreateService, GameCreateService
 # -----------------------------------------------
 # TEST SERVICE
@@ -126,3 +130,60 @@ class GameCreateServiceTest(TestCase):
         self.assertIsNotNone(game.id)
         self.assertEqual(game.rival_name, self.r.team_name) #test_rival
         self.assertEqual(game.field, "test_field")
+
+
+class GameWithStatsCreateServiceTest(TestCase):
+
+    def setUp(self):
+        self.r = Rival.objects.create(team_name="test_rival", home="test_home")
+        self.players = [Player.objects.create(name="test_player%d" % i, sebango=i) for i in range(5)]
+        self.g = GameCreateService()
+
+    def forms(self):
+        params = {
+            "rival": self.r.id,
+            "field": "test_field",
+            "game_date": timezone.now(),
+            "point_gain": 3,
+            "point_reduce": 1,
+            "form-TOTAL_FORMS": 5,
+            "form-INITIAL_FORMS": 0,
+            "form-MAX_NUM_FORM": '',
+        }
+        for i, p in enumerate(self.players):
+            params["form-%d-player" % i] = p.id
+            params["form-%d-goals" % i] = i
+            for name in ("assists", "intercepts", "dribbles", "tuckles"):
+                params["form-%d-%s" % (i, name)] = 0
+        gameform = GameForm(params)
+        statsforms = StatsFormSet(params)
+        self.assertTrue(gameform.is_valid())
+        self.assertTrue(statsforms.is_valid())
+        return gameform, statsforms
+
+    def test_create_game_with_stats(self):
+        gameform, statsforms = self.forms()
+        game, stats_list = self.g.create_game_with_stats(gameform, statsforms)
+        self.assertIsNotNone(game.id)
+        self.assertEqual(len(stats_list), 5)
+        self.assertEqual(Stats.objects.filter(game=game).count(), 5)
+        totals = PlayerCareerTotals.objects.get(player=self.players[3])
+        self.assertEqual(totals.appearances, 1)
+        self.assertEqual(totals.goals, 3)
+
+    def test_create_game_with_stats_statements(self):
+        gameform, statsforms = self.forms()
+        with CaptureQueriesContext(connection) as ctx:
+            self.g.create_game_with_stats(gameform, statsforms)
+        sqls = [q['sql'] for q in ctx]
+        self.assertEqual(len([q for q in sqls if q.startswith('INSERT INTO "record_stats"')]), 1)
+        self.assertEqual(len([q for q in sqls if q.startswith('UPDATE "record_playercareertotals"')]), 1)
+
+    def test_create_game_with_stats_rollback(self):
+        gameform, statsforms = self.forms()
+        with mock.patch.object(Stats.objects, 'bulk_create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.g.create_game_with_stats(gameform, statsforms)
+        self.assertEqual(Game.objects.count(), 0)
+        self.assertEqual(Stats.objects.count(), 0)
+        self.assertEqual(self.r.head_to_head.played, 0)
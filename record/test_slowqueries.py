@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .instrumentation import InstrumentationMiddleware
+from .models import Player
+from .slowqueries import slow_query_wrapper, worst_queries
+
+# -----------------------------------------------
+# TEST SLOW QUERY LOG
+# -----------------------------------------------
+
+
+class SlowQueryTest(TestCase):
+
+    def setUp(self):
+        self.p = Player.objects.create(name="test1", sebango=10)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        override = override_settings(RECORD_METRICS_DB=os.path.join(self.dir, 'metrics.sqlite3'),
+                                     RECORD_SLOW_QUERY_MS=0, RECORD_PAGE_CACHE=False)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_installed_on_connection(self):
+        self.assertIn(slow_query_wrapper, connection.execute_wrappers)
+
+    def test_connection_opened_inside_request(self):
+        # CONN_MAX_AGE=0 では接続はミドルウェアの execute_wrapper() の中で作られる
+        def view(request):
+            connection_created.send(sender=connection.__class__, connection=connection)
+            Player.objects.count()
+            return HttpResponse()
+
+        connection.execute_wrappers.remove(slow_query_wrapper)
+        for _ in range(3):
+            with self.assertLogs('record.slowqueries', 'WARNING'):
+                InstrumentationMiddleware(view)(RequestFactory().get('/players/'))
+            self.assertEqual(connection.execute_wrappers, [slow_query_wrapper])
+
+    def test_logged_with_plan(self):
+        with self.assertLogs('record.slowqueries', 'WARNING') as logs:
+            Player.objects.filter(name="test1").count()
+        record = logs.records[-1]
+        self.assertEqual(record.view, '-')
+        self.assertEqual(record.fingerprint,
+                         'SELECT COUNT(*) AS "__count" FROM "record_player" WHERE "record_player"."name" = ?')
+        self.assertRegex(record.plan, r'^(SCAN|SEARCH) record_player')
+        self.assertIn('fingerprint=SELECT COUNT(*)', record.getMessage())
+
+    def test_explain_not_counted(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with self.assertLogs('record.slowqueries', 'WARNING'):
+                Player.objects.get(pk=self.p.pk)
+        self.assertEqual(len(ctx), 1)
+
+    def test_writes_not_explained(self):
+        with self.assertLogs('record.slowqueries', 'WARNING') as logs:
+            Player.objects.filter(pk=self.p.pk).update(sebango=11)
+        self.assertEqual(logs.records[-1].plan, '')
+
+    def test_store_error_does_not_fail_query(self):
+        broken = os.path.join(self.dir, 'missing', 'metrics.sqlite3')
+        with override_settings(RECORD_METRICS_DB=broken):
+            with self.assertLogs('record.slowqueries', 'WARNING') as logs:
+                self.assertEqual(Player.objects.filter(name="test1").count(), 1)
+        self.assertEqual(logs.records[-1].getMessage(), 'could not record slow query')
+
+    def test_failed_query_not_explained(self):
+        with self.assertLogs('record.slowqueries', 'WARNING') as logs:
+            with self.assertRaises(DatabaseError):
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT * FROM record_missing_table')
+        self.assertEqual(logs.records[-1].plan, '')
+        self.assertEqual(worst_queries()[0]['fingerprint'], 'SELECT * FROM record_missing_table')
+
+    def test_view_and_rollup(self):
+        with self.assertLogs('record.slowqueries', 'WARNING') as logs:
+            self.client.get(reverse("player_detail", args=(self.p.pk,)))
+            self.client.get(reverse("player_detail", args=(self.p.pk,)))
+        self.assertIn('player_detail', {record.view for record in logs.records})
+
+        rows = worst_queries(limit=100)
+        self.assertEqual([row['total_ms'] for row in rows], sorted((row['total_ms'] for row in rows), reverse=True))
+        by_count = worst_queries(limit=100, order='count')
+        self.assertGreaterEqual(by_count[0]['count'], 2)
+
+    def test_disabled(self):
+        with override_settings(RECORD_SLOW_QUERY_MS=None):
+            with self.assertNoLogs('record.slowqueries', 'WARNING'):
+                Player.objects.count()
+        self.assertEqual(worst_queries(), [])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('slowqueries', stdout=out)
+        self.assertIn("No queries over 0 ms", out.getvalue())
+        with self.assertLogs('record.slowqueries', 'WARNING'):
+            Player.objects.filter(name="test1").count()
+        out = StringIO()
+        call_command('slowqueries', '--plans', stdout=out)
+        self.assertIn('FROM "record_player" WHERE "record_player"."name" = ?', out.getvalue())
+        self.assertRegex(out.getvalue(), r'\n      (SCAN|SEARCH) record_player')
+        call_command('slowqueries', '--reset', stdout=StringIO())
+        self.assertEqual(worst_queries(), [])
+
@@ -0,0 +1,40 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import Game, Rival, Stats, Player, STATS_FIELDS
+from .summary import summarize
+
+# -----------------------------------------------
+# TEST SUMMARY
+# -----------------------------------------------
+
+
+class SummarizeTest(TestCase):
+
+    def setUp(self):
+        r = Rival.objects.create(team_name="test_team", home="test_home")
+        self.p = Player.objects.create(name="test", sebango=10)
+        for goals in (0, 1, 2, 5):
+            g = Game.objects.create(rival=r, point_gain=goals, point_reduce=1, game_date=timezone.now())
+            Stats.objects.create(game=g, player=self.p, goals=goals, assists=1)
+
+    def test_summarize(self):
+        s = summarize(Stats.objects.filter(player=self.p), STATS_FIELDS)
+        self.assertEqual(s['count'], 4)
+        self.assertEqual(s['total']['goals'], 8)
+        self.assertEqual(s['total']['assists'], 4)
+        self.assertEqual(s['mean']['goals'], 2)
+        self.assertEqual(s['median']['goals'], 1.5)
+        self.assertEqual(s['std']['assists'], 0)
+        self.assertEqual(s['p75']['goals'], 2.75)
+
+    def test_summarize_empty(self):
+        s = summarize(Stats.objects.none(), STATS_FIELDS)
+        self.assertEqual(s['count'], 0)
+        self.assertEqual(s['total']['goals'], 0)
+        self.assertEqual(s['median']['goals'], 0)
+
+    def test_summarize_one_query(self):
+        with self.assertNumQueries(1):
+            s = summarize(Game.objects.all(), ('point_gain', 'point_reduce'))
+        self.assertEqual(s['total'], {'point_gain': 8, 'point_reduce': 4})
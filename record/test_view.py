@@ -1,9 +1,14 @@
-from django.test import TestCase
+from datetime import date
+
+from django.test import TestCase, override_settings
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from .models import Game, Rival, Stats, Player
+from .models import Game, Rival, Stats, Player, PlayerCareerTotals, RivalRecord, Season
 
 # -----------------------------------------------
 # TEST VIEWS
@@ -38,6 +43,60 @@ class GameIndexViewTest(TestCase):
         res = self.client.get(reverse("game_list"))
         self.assertEqual(len(res.context['games']), 1)
 
+    def ids(self, res):
+        return [g.id for g in res.context['games']]
+
+    def test_keyset_pagination(self):
+        games = [Game.objects.create(rival=self.r, point_gain=1, point_reduce=0, game_date=timezone.now()) for i in range(5)]
+        ids = [g.id for g in reversed(games)]
+        url = reverse("game_list")
+
+        res = self.client.get(url, {"size": 2})
+        self.assertEqual(self.ids(res), ids[0:2])
+        self.assertFalse(res.context['page'].has_previous)
+
+        res = self.client.get(url + "?" + res.context['page'].next_query)
+        self.assertEqual(self.ids(res), ids[2:4])
+
+        res = self.client.get(url + "?" + res.context['page'].next_query)
+        self.assertEqual(self.ids(res), ids[4:])
+        self.assertFalse(res.context['page'].has_next)
+
+        res = self.client.get(url + "?" + res.context['page'].previous_query)
+        self.assertEqual(self.ids(res), ids[2:4])
+
+        res = self.client.get(url + "?" + res.context['page'].previous_query)
+        self.assertEqual(self.ids(res), ids[0:2])
+        self.assertFalse(res.context['page'].has_previous)
+
+    def test_keyset_pagination_by_date(self):
+        old = Game.objects.create(rival=self.r, point_gain=1, point_reduce=0, game_date=parse_datetime("2018-06-01 10:00:00"))
+        new = Game.objects.create(rival=self.r, point_gain=1, point_reduce=0, game_date=parse_datetime("2018-05-01 10:00:00"))
+        url = reverse("game_list")
+
+        res = self.client.get(url, {"size": 1, "order": "date"})
+        self.assertEqual(self.ids(res), [old.id])
+        res = self.client.get(url + "?" + res.context['page'].next_query)
+        self.assertEqual(self.ids(res), [new.id])
+
+    @override_settings(RECORD_PAGE_CACHE=False)
+    def test_deep_page_query_count(self):
+        for i in range(10):
+            self.create_game()
+        url = reverse("game_list")
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(url, {"size": 2})
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(url, {"size": 2, "after": self.g.id - 6})
+        # 2ページ目以降は前ページの有無を調べる1クエリだけ増える
+        self.assertEqual(len(deep), len(first) + 1)
+        self.assertFalse(any("OFFSET" in q['sql'] for q in deep))
+
+    def test_invalid_cursor(self):
+        self.create_game()
+        res = self.client.get(reverse("game_list"), {"after": "x", "size": "y"})
+        self.assertEqual(self.ids(res), [self.g.id])
+
 
 class GameDetailViewTest(TestCase):
 
@@ -51,6 +110,8 @@ class GameDetailViewTest(TestCase):
         url = reverse("game_detail", args=(self.g.pk,))
         res = self.client.get(url)
         self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.context['summary']['goals'], 1)
+        self.assertEqual(res.context['distribution']['mean']['goals'], 1)
 
     def test_404(self):
         url = reverse("game_detail", args=(99,))
@@ -118,6 +179,39 @@ class GameCreateViewTest(TestCase):
         self.assertEqual(len(Game.objects.all()), 1)
         self.assertEqual(len(Stats.objects.all()), 1)
 
+    def squad_data(self, players):
+        data = {
+            "rival": self.r.id,
+            "field": "test_field",
+            "game_date": timezone.now(),
+            "point_gain": 3,
+            "point_reduce": 1,
+            "form-TOTAL_FORMS": len(players),
+            "form-INITIAL_FORMS": 0,
+            "form-MAX_NUM_FORM": '',
+        }
+        for i, player in enumerate(players):
+            data.update({"form-%d-player" % i: player.id, "form-%d-goals" % i: i % 3,
+                         "form-%d-assists" % i: 0, "form-%d-intercepts" % i: 0,
+                         "form-%d-dribbles" % i: 0, "form-%d-tuckles" % i: 0, "form-%d-remark" % i: ''})
+        return data
+
+    def test_post_full_squad(self):
+        # 11人分を登録しても、人数によらないクエリ数で済む (N+1 があればテスト設定では例外になる)
+        self.login()
+        players = [self.p] + [Player.objects.create(name="squad%d" % i, sebango=20 + i) for i in range(10)]
+        url = reverse("game_new")
+        with CaptureQueriesContext(connection) as small:
+            res = self.client.post(url, self.squad_data(players[:2]))
+        self.assertEqual(res.url, reverse("game_list"))
+        with CaptureQueriesContext(connection) as full:
+            res = self.client.post(url, self.squad_data(players))
+        self.assertEqual(res.url, reverse("game_list"))
+        self.assertEqual(len(full), len(small))
+        self.assertEqual(Stats.objects.count(), 13)
+        game = Game.objects.latest('id')
+        self.assertEqual(game.player_cumulative_totals.count(), 11)
+
     def test_post_invalid_stats(self):
         self.login()
 
@@ -163,6 +257,17 @@ class RivalIndexViewTest(TestCase):
         res = self.client.get(reverse("rival_list"))
         self.assertEqual(len(res.context['rivals']), 1)
 
+    @override_settings(RECORD_PAGE_CACHE=False)
+    def test_query_count_with_many_games(self):
+        for i in range(3):
+            r = Rival.objects.create(team_name="test_team%d" % i, home="test_home")
+            for j in range(i + 1):
+                Game.objects.create(rival=r, point_gain=j, point_reduce=1, game_date=timezone.now())
+        # シーズンの選択肢と一覧の2クエリ
+        with self.assertNumQueries(2):
+            res = self.client.get(reverse("rival_list"))
+        self.assertContains(res, "1勝 1敗 1分 33%")
+
 
 class RivalDetailViewTest(TestCase):
 
@@ -303,6 +408,19 @@ class PlayerIndexViewTest(TestCase):
         res = self.client.get(reverse("player_list"))
         self.assertEqual(len(res.context['players']), 1)
 
+    @override_settings(RECORD_PAGE_CACHE=False)
+    def test_query_count_with_many_stats(self):
+        r = Rival.objects.create(team_name="test", home="test_home")
+        games = [Game.objects.create(rival=r, point_gain=1, point_reduce=0, game_date=timezone.now()) for i in range(3)]
+        for i in range(3):
+            p = Player.objects.create(name="test_name%d" % i, sebango=i)
+            for g in games:
+                Stats.objects.create(game=g, player=p, goals=1, assists=2)
+        # シーズンの選択肢と一覧の2クエリ
+        with self.assertNumQueries(2):
+            res = self.client.get(reverse("player_list"))
+        self.assertEqual(res.context['players'][0].goals(), 3)
+
 
 class PlayerDetailViewTest(TestCase):
 
@@ -323,6 +441,102 @@ class PlayerDetailViewTest(TestCase):
         self.assertEqual(res.status_code, 404)
 
 
+class SeasonSelectViewTest(TestCase):
+
+    def setUp(self):
+        self.season = Season.objects.create(name="2018", start=date(2018, 1, 1), end=date(2018, 12, 31))
+        self.r1 = Rival.objects.create(team_name="rival1", home="home")
+        self.r2 = Rival.objects.create(team_name="rival2", home="home")
+        self.p1 = Player.objects.create(name="player1", sebango=1)
+        self.p2 = Player.objects.create(name="player2", sebango=2)
+        self.g1 = Game.objects.create(rival=self.r1, point_gain=2, point_reduce=0, game_date=parse_datetime("2018-05-01 10:00:00"))
+        self.g2 = Game.objects.create(rival=self.r2, point_gain=0, point_reduce=1, game_date=parse_datetime("2019-05-01 10:00:00"))
+        Stats.objects.create(game=self.g1, player=self.p1, goals=2, assists=0, passes=0, intercepts=0, dribbles=0, tuckles=0)
+        Stats.objects.create(game=self.g2, player=self.p1, goals=1, assists=0, passes=0, intercepts=0, dribbles=0, tuckles=0)
+        Stats.objects.create(game=self.g2, player=self.p2, goals=1, assists=0, passes=0, intercepts=0, dribbles=0, tuckles=0)
+        self.params = {'season': self.season.pk}
+
+    def test_game_list(self):
+        res = self.client.get(reverse("game_list"), self.params)
+        self.assertEqual([g.pk for g in res.context['games']], [self.g1.pk])
+        self.assertContains(res, "All seasons")
+
+    def test_player_list(self):
+        res = self.client.get(reverse("player_list"), self.params)
+        players = res.context['players']
+        self.assertEqual([p.pk for p in players], [self.p1.pk])
+        self.assertEqual((players[0].games(), players[0].goals()), (1, 2))
+
+    def test_player_list_reads_rollups(self):
+        url = reverse("player_list")
+        with override_settings(RECORD_PAGE_CACHE=False):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(url, self.params)
+        self.assertFalse(any('"record_stats"' in q['sql'] for q in ctx))
+
+    def test_rival_list(self):
+        res = self.client.get(reverse("rival_list"), self.params)
+        self.assertEqual([r.pk for r in res.context['rivals']], [self.r1.pk])
+        self.assertContains(res, "1勝 0敗 0分")
+
+    def test_player_detail(self):
+        res = self.client.get(reverse("player_detail", args=(self.p1.pk,)), self.params)
+        self.assertEqual(res.context['summary']['goals'], 2)
+        self.assertEqual(len(res.context['statss']), 1)
+        res = self.client.get(reverse("player_detail", args=(self.p2.pk,)), self.params)
+        self.assertEqual(res.context['summary']['games'], 0)
+
+    def test_rival_detail(self):
+        res = self.client.get(reverse("rival_detail", args=(self.r2.pk,)), self.params)
+        self.assertEqual(res.context['summary'], {'game_counts': 0, 'points': 0, 'reduces': 0})
+        self.assertEqual(list(res.context['games']), [])
+
+    def test_unknown_season(self):
+        res = self.client.get(reverse("player_list"), {'season': 99})
+        self.assertEqual(res.status_code, 404)
+
+
+class AsOfViewTest(TestCase):
+
+    def setUp(self):
+        self.r = Rival.objects.create(team_name="rival", home="home")
+        self.p = Player.objects.create(name="player", sebango=1)
+        for day, gain, goals in ((1, 2, 2), (8, 0, 1), (15, 1, 1)):
+            g = Game.objects.create(rival=self.r, point_gain=gain, point_reduce=1,
+                                    game_date=parse_datetime("2019-03-%02d 10:00:00" % day))
+            Stats.objects.create(game=g, player=self.p, goals=goals, assists=0, passes=0, intercepts=0, dribbles=0, tuckles=0)
+
+    def test_player_detail(self):
+        res = self.client.get(reverse("player_detail", args=(self.p.pk,)), {'as_of': '2019-03-08'})
+        self.assertEqual((res.context['summary']['games'], res.context['summary']['goals']), (2, 3))
+        self.assertEqual(len(res.context['statss']), 2)
+
+    def test_player_detail_in_season(self):
+        season = Season.objects.create(name="2019", start=date(2019, 3, 5), end=date(2019, 12, 31))
+        res = self.client.get(reverse("player_detail", args=(self.p.pk,)),
+                              {'as_of': '2019-03-08', 'season': season.pk})
+        self.assertEqual((res.context['summary']['games'], res.context['summary']['goals']), (1, 1))
+
+    def test_as_of_before_season(self):
+        season = Season.objects.create(name="2019", start=date(2019, 3, 10), end=date(2019, 12, 31))
+        params = {'as_of': '2019-03-05', 'season': season.pk}
+        res = self.client.get(reverse("player_detail", args=(self.p.pk,)), params)
+        self.assertEqual((res.context['summary']['games'], res.context['summary']['goals']), (0, 0))
+        self.assertEqual(len(res.context['statss']), 0)
+        res = self.client.get(reverse("rival_detail", args=(self.r.pk,)), params)
+        self.assertEqual(res.context['summary'], {'game_counts': 0, 'points': 0, 'reduces': 0})
+        self.assertContains(res, "0勝 0敗 0分")
+
+    def test_rival_detail(self):
+        res = self.client.get(reverse("rival_detail", args=(self.r.pk,)), {'as_of': '2019-03-08'})
+        self.assertEqual(res.context['summary'], {'game_counts': 2, 'points': 2, 'reduces': 2})
+        self.assertContains(res, "1勝 1敗 0分")
+
+    def test_bad_date(self):
+        res = self.client.get(reverse("rival_detail", args=(self.r.pk,)), {'as_of': '2019-3'})
+        self.assertEqual(res.status_code, 400)
+
+
 class PlayerCreateViewTest(TestCase):
 
     def setUp(self):
@@ -478,6 +692,20 @@ class StatsCreateViewTest(TestCase):
         self.assertEqual(res.url, reverse("game_detail", args=(self.g.pk,)))
         self.assertEqual(len(Stats.objects.filter(game=self.g)), 1)
 
+    def test_post_duplicate_player(self):
+        self.login()
+        Stats.objects.create(game=self.g, player=self.p, goals=1)
+
+        stats_data = {
+            "player": self.p.pk,
+            "goals": 2,
+        }
+        url = reverse("game_add_stats", args=(self.g.pk,))
+        res = self.client.post(url, stats_data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.context['form'].errors['player'])
+        self.assertEqual(len(Stats.objects.filter(game=self.g)), 1)
+
 
 class StatsUpdateViewTest(TestCase):
 
@@ -536,6 +764,8 @@ class StatsUpdateViewTest(TestCase):
         targ = Stats.objects.get(pk=self.s.pk)
         self.assertEqual(targ.goals, 1)
         self.assertEqual(res.url, reverse("game_detail", args=(targ.game.pk,)))
+        self.assertEqual(PlayerCareerTotals.objects.get(player=self.p).goals, 1)
+        self.assertEqual(PlayerCareerTotals.objects.get(player=self.p).tuckles, 0)
 
 
 class GameUpdateViewTest(TestCase):
@@ -595,6 +825,23 @@ class GameUpdateViewTest(TestCase):
         self.assertEqual(targ.remark, "updated")
         self.assertEqual(res.url, reverse("game_detail", args=(targ.pk,)))
 
+    def test_post_change_rival(self):
+        self.login()
+        r2 = Rival.objects.create(team_name="other", home="other_home")
+
+        game_data = {
+            "rival": r2.pk,
+            "game_date": timezone.now(),
+            "point_gain": 1,
+            "field": "test_field",
+            "point_reduce": 0,
+        }
+        url = reverse("game_update", args=(self.g.pk,))
+        self.client.post(url, game_data)
+
+        self.assertEqual(RivalRecord.objects.get(rival=self.r).played, 0)
+        self.assertEqual(RivalRecord.objects.get(rival=r2).won, 1)
+
 
 class PopupPlayerCreateViewTest(TestCase):
 
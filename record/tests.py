@@ -1,8 +1,16 @@
+from datetime import date
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
-from .models import Game, Rival, Stats, Player
+from .models import Game, Rival, Stats, Player, PlayerCareerTotals, RivalRecord, \
+    Season, PlayerSeasonTotals, RivalSeasonRecord, PlayerCumulativeTotals, RivalCumulativeRecord
 
 
 # Create your tests here.
@@ -56,6 +64,15 @@ class RivalModelTests(TestCase):
         s = self.r.summary()
         self.assertEqual(s, "1勝 1敗 1分 33%")
 
+    def test_with_hoshitori(self):
+        Rival.objects.create(team_name="test2", home="home2")
+        rivals = list(Rival.objects.with_hoshitori().order_by('id'))
+        with self.assertNumQueries(0):
+            self.assertEqual(rivals[0].hoshitori(), (1, 1, 1))
+            self.assertEqual(rivals[0].summary(), "1勝 1敗 1分 33%")
+            self.assertEqual(rivals[1].hoshitori(), (0, 0, 0))
+            self.assertEqual(rivals[1].rate(), 0)
+
 
 class GameModelTests(TestCase):
     def setUp(self):
@@ -123,6 +140,19 @@ class PlayerModelTest(TestCase):
         self.assertEqual(self.p.dribbles(), 9)
         self.assertEqual(self.p.tuckles(), 11)
 
+    def test_with_career_totals(self):
+        Player.objects.create(name="test2", sebango=1)
+        players = list(Player.objects.with_career_totals().order_by('id'))
+        with self.assertNumQueries(0):
+            self.assertEqual(players[0].goals(), 3)
+            self.assertEqual(players[0].assists(), 5)
+            self.assertEqual(players[0].games(), 2)
+            self.assertEqual(players[0].intercepts(), 7)
+            self.assertEqual(players[0].dribbles(), 9)
+            self.assertEqual(players[0].tuckles(), 11)
+            self.assertEqual(players[1].goals(), 0)
+            self.assertEqual(players[1].games(), 0)
+
     def test_get_stats(self):
         statss = self.p.get_stats()
         self.assertEqual(len(statss), 2)
@@ -150,6 +180,11 @@ class StatsModelTest(TestCase):
         s = Stats.objects.create(game=self.g, player=self.p, goals=1, assists=0)
         self.assertIsNotNone(str(s))
 
+    def test_unique_game_player(self):
+        Stats.objects.create(game=self.g, player=self.p, goals=1, assists=0)
+        with self.assertRaises(IntegrityError):
+            Stats.objects.create(game=self.g, player=self.p, goals=2, assists=0)
+
     def test_create_method(self):
         params = {
             "game": self.g,
@@ -170,3 +205,360 @@ class StatsModelTest(TestCase):
         self.assertEqual(s.dribbles, 4)
         self.assertEqual(s.tuckles, 5)
         self.assertEqual(s.remark, "test_remark")
+
+
+class PlayerCareerTotalsModelTest(TestCase):
+
+    def setUp(self):
+        r = Rival.objects.create(team_name="test_team", home="test_home")
+        self.g1 = Game.objects.create(rival=r, point_gain=1, point_reduce=0, game_date=timezone.now())
+        self.g2 = Game.objects.create(rival=r, point_gain=1, point_reduce=0, game_date=timezone.now())
+        self.p1 = Player.objects.create(name="test1", sebango=10)
+        self.p2 = Player.objects.create(name="test2", sebango=11)
+        self.s = Stats.objects.create(game=self.g1, player=self.p1, goals=1, assists=2, passes=3)
+        Stats.objects.create(game=self.g2, player=self.p1, goals=2, assists=1)
+
+    def totals(self, player):
+        return PlayerCareerTotals.objects.get(player=player)
+
+    def test_created_with_player(self):
+        t = self.totals(self.p2)
+        self.assertEqual(t.appearances, 0)
+        self.assertEqual(t.goals, 0)
+
+    def test_create(self):
+        t = self.totals(self.p1)
+        self.assertEqual(t.appearances, 2)
+        self.assertEqual(t.goals, 3)
+        self.assertEqual(t.assists, 3)
+        self.assertEqual(t.passes, 3)
+
+    def test_update(self):
+        s = Stats.objects.get(pk=self.s.pk)
+        s.goals = 5
+        s.save()
+        t = self.totals(self.p1)
+        self.assertEqual(t.appearances, 2)
+        self.assertEqual(t.goals, 7)
+
+    def test_update_twice(self):
+        s = Stats.objects.get(pk=self.s.pk)
+        s.goals = 5
+        s.save()
+        s.goals = 4
+        s.save()
+        self.assertEqual(self.totals(self.p1).goals, 6)
+
+    def test_change_player(self):
+        s = Stats.objects.get(pk=self.s.pk)
+        s.player = self.p2
+        s.save()
+        t1 = self.totals(self.p1)
+        t2 = self.totals(self.p2)
+        self.assertEqual((t1.appearances, t1.goals, t1.passes), (1, 2, 0))
+        self.assertEqual((t2.appearances, t2.goals, t2.passes), (1, 1, 3))
+
+    def test_delete(self):
+        Stats.objects.get(pk=self.s.pk).delete()
+        t = self.totals(self.p1)
+        self.assertEqual(t.appearances, 1)
+        self.assertEqual(t.goals, 2)
+
+    def test_delete_game(self):
+        self.g1.delete()
+        self.g2.delete()
+        t = self.totals(self.p1)
+        self.assertEqual(t.appearances, 0)
+        self.assertEqual(t.goals, 0)
+
+    def test_missing_row(self):
+        PlayerCareerTotals.objects.filter(player=self.p1).delete()
+        g3 = Game.objects.create(rival=self.g1.rival, point_gain=0, point_reduce=0, game_date=timezone.now())
+        Stats.objects.create(game=g3, player=self.p1, goals=1)
+        t = self.totals(self.p1)
+        self.assertEqual(t.appearances, 3)
+        self.assertEqual(t.goals, 4)
+
+    def test_player_methods_read_totals(self):
+        p = Player.objects.select_related('career_totals').get(pk=self.p1.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(p.goals(), 3)
+            self.assertEqual(p.games(), 2)
+            self.assertEqual(p.career_summary()['passes'], 3)
+
+    def test_delete_player(self):
+        self.p1.delete()
+        self.assertFalse(PlayerCareerTotals.objects.filter(player_id=self.p1.pk).exists())
+        self.assertEqual(Stats.objects.count(), 0)
+
+    def test_rebuild_and_verify(self):
+        PlayerCareerTotals.objects.filter(player=self.p1).update(goals=99)
+        self.assertEqual(PlayerCareerTotals.verify(), [self.p1.pk])
+        out = StringIO()
+        call_command('rebuild_aggregates', stdout=out)
+        self.assertIn("verified", out.getvalue())
+        self.assertEqual(PlayerCareerTotals.verify(), [])
+        self.assertEqual(self.totals(self.p1).goals, 3)
+
+
+class RivalRecordModelTest(TestCase):
+
+    def setUp(self):
+        self.r1 = Rival.objects.create(team_name="test1", home="test_home")
+        self.r2 = Rival.objects.create(team_name="test2", home="test_home")
+        self.d1 = parse_datetime("2018-06-01 10:00:00")
+        self.d2 = parse_datetime("2018-06-08 10:00:00")
+        self.g1 = Game.objects.create(rival=self.r1, point_gain=2, point_reduce=1, game_date=self.d1)
+        self.g2 = Game.objects.create(rival=self.r1, point_gain=0, point_reduce=0, game_date=self.d2)
+
+    def record(self, rival):
+        return RivalRecord.objects.get(rival=rival)
+
+    def test_create(self):
+        r = self.record(self.r1)
+        self.assertEqual((r.played, r.won, r.lost, r.drawn), (2, 1, 0, 1))
+        self.assertEqual((r.goals_for, r.goals_against), (2, 1))
+        self.assertEqual(r.last_played, self.d2)
+        r = self.record(self.r2)
+        self.assertEqual(r.played, 0)
+        self.assertIsNone(r.last_played)
+
+    def test_update(self):
+        g = Game.objects.get(pk=self.g2.pk)
+        g.point_reduce = 3
+        g.save()
+        r = self.record(self.r1)
+        self.assertEqual((r.played, r.won, r.lost, r.drawn), (2, 1, 1, 0))
+        self.assertEqual((r.goals_for, r.goals_against), (2, 4))
+
+    def test_change_rival(self):
+        g = Game.objects.get(pk=self.g2.pk)
+        g.rival = self.r2
+        g.save()
+        r = self.record(self.r1)
+        self.assertEqual((r.played, r.won, r.drawn), (1, 1, 0))
+        self.assertEqual(r.last_played, self.d1)
+        r = self.record(self.r2)
+        self.assertEqual((r.played, r.won, r.drawn), (1, 0, 1))
+        self.assertEqual(r.last_played, self.d2)
+
+    def test_delete(self):
+        Game.objects.get(pk=self.g2.pk).delete()
+        r = self.record(self.r1)
+        self.assertEqual((r.played, r.won, r.drawn), (1, 1, 0))
+        self.assertEqual(r.last_played, self.d1)
+
+    def test_delete_rival(self):
+        self.r1.delete()
+        self.assertFalse(RivalRecord.objects.filter(rival_id=self.r1.pk).exists())
+
+    def test_rival_methods_read_record(self):
+        r = Rival.objects.select_related('head_to_head').get(pk=self.r1.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(r.hoshitori(), (1, 0, 1))
+            self.assertEqual(r.summary(), "1勝 0敗 1分 50%")
+            self.assertEqual(r.game_summary(), {'game_counts': 2, 'points': 2, 'reduces': 1})
+
+    def test_rebuild_and_verify(self):
+        RivalRecord.objects.filter(rival=self.r1).update(won=9)
+        self.assertEqual(RivalRecord.verify(), [self.r1.pk])
+        RivalRecord.rebuild()
+        self.assertEqual(RivalRecord.verify(), [])
+        self.assertEqual(self.record(self.r1).won, 1)
+
+
+class SeasonModelTest(TestCase):
+
+    def setUp(self):
+        self.s1 = Season.objects.create(name="2018 spring", start=date(2018, 4, 1), end=date(2018, 6, 30))
+        self.s2 = Season.objects.create(name="2018 autumn", start=date(2018, 7, 1), end=date(2018, 12, 31))
+        self.r = Rival.objects.create(team_name="test", home="test_home")
+        self.p1 = Player.objects.create(name="test1", sebango=1)
+        self.p2 = Player.objects.create(name="test2", sebango=2)
+        self.g1 = Game.objects.create(rival=self.r, point_gain=2, point_reduce=1, game_date=parse_datetime("2018-06-30 18:00:00"))
+        self.g2 = Game.objects.create(rival=self.r, point_gain=0, point_reduce=1, game_date=parse_datetime("2018-07-01 10:00:00"))
+        self.s = Stats.objects.create(game=self.g1, player=self.p1, goals=2, assists=1)
+        Stats.objects.create(game=self.g2, player=self.p1, goals=1, assists=0)
+
+    def totals(self, season, player):
+        return PlayerSeasonTotals.objects.filter(season=season, player=player).first()
+
+    def record(self, season):
+        return RivalSeasonRecord.objects.filter(season=season, rival=self.r).first()
+
+    def test_clean(self):
+        with self.assertRaises(ValidationError):
+            Season(name="x", start=date(2018, 6, 1), end=date(2018, 5, 1)).full_clean()
+        with self.assertRaises(ValidationError):
+            Season(name="x", start=date(2018, 6, 1), end=date(2018, 7, 10)).full_clean()
+        Season(name="x", start=date(2019, 1, 1), end=date(2019, 3, 31)).full_clean()
+
+    def test_covering(self):
+        self.assertEqual(list(Season.covering([self.g1.game_date])), [self.s1])
+        self.assertEqual(list(Season.covering([date(2019, 1, 1)])), [])
+
+    def test_rollups(self):
+        t = self.totals(self.s1, self.p1)
+        self.assertEqual((t.appearances, t.goals, t.assists), (1, 2, 1))
+        t = self.totals(self.s2, self.p1)
+        self.assertEqual((t.appearances, t.goals), (1, 1))
+        self.assertIsNone(self.totals(self.s1, self.p2))
+        r = self.record(self.s1)
+        self.assertEqual((r.played, r.won, r.lost, r.goals_for), (1, 1, 0, 2))
+        r = self.record(self.s2)
+        self.assertEqual((r.played, r.won, r.lost, r.goals_against), (1, 0, 1, 1))
+
+    def test_stats_update(self):
+        s = Stats.objects.get(pk=self.s.pk)
+        s.goals = 5
+        s.player = self.p2
+        s.save()
+        self.assertIsNone(self.totals(self.s1, self.p1))
+        self.assertEqual(self.totals(self.s1, self.p2).goals, 5)
+        self.assertEqual(self.totals(self.s2, self.p1).goals, 1)
+
+    def test_stats_delete(self):
+        Stats.objects.get(pk=self.s.pk).delete()
+        self.assertIsNone(self.totals(self.s1, self.p1))
+
+    def test_game_moves_season(self):
+        g = Game.objects.get(pk=self.g1.pk)
+        g.game_date = parse_datetime("2018-08-01 10:00:00")
+        g.save()
+        self.assertIsNone(self.record(self.s1))
+        self.assertEqual(self.record(self.s2).played, 2)
+        self.assertIsNone(self.totals(self.s1, self.p1))
+        self.assertEqual(self.totals(self.s2, self.p1).goals, 3)
+
+    def test_game_delete(self):
+        Game.objects.get(pk=self.g2.pk).delete()
+        self.assertIsNone(self.record(self.s2))
+        self.assertIsNone(self.totals(self.s2, self.p1))
+        self.assertEqual(self.record(self.s1).played, 1)
+
+    def test_game_outside_seasons(self):
+        g = Game.objects.create(rival=self.r, point_gain=1, point_reduce=0, game_date=parse_datetime("2019-01-05 10:00:00"))
+        Stats.objects.create(game=g, player=self.p2, goals=1)
+        self.assertEqual(PlayerSeasonTotals.objects.filter(player=self.p2).count(), 0)
+
+    def test_season_change_rebuilds(self):
+        self.s1.end = date(2018, 7, 1)
+        self.s1.save()
+        self.s2.start = date(2018, 7, 2)
+        self.s2.save()
+        self.assertEqual(self.record(self.s1).played, 2)
+        self.assertIsNone(self.record(self.s2))
+
+    def test_queryset_annotations(self):
+        p = Player.objects.with_season_totals(self.s1).get(pk=self.p1.pk)
+        self.assertEqual((p.games(), p.goals()), (1, 2))
+        self.assertFalse(Player.objects.with_season_totals(self.s1).filter(pk=self.p2.pk).exists())
+        r = Rival.objects.with_season_record(self.s2).get(pk=self.r.pk)
+        self.assertEqual(r.hoshitori(), (0, 1, 0))
+
+    def test_rebuild_and_verify(self):
+        PlayerSeasonTotals.objects.filter(season=self.s1).update(goals=9)
+        RivalSeasonRecord.objects.filter(season=self.s2).delete()
+        self.assertEqual(PlayerSeasonTotals.verify(), [(self.s1.pk, self.p1.pk)])
+        self.assertEqual(RivalSeasonRecord.verify(), [(self.s2.pk, self.r.pk)])
+        call_command('rebuild_aggregates', stdout=StringIO())
+        self.assertEqual(PlayerSeasonTotals.verify(), [])
+        self.assertEqual(RivalSeasonRecord.verify(), [])
+
+
+class CumulativeTotalsModelTest(TestCase):
+
+    def setUp(self):
+        self.r1 = Rival.objects.create(team_name="test1", home="test_home")
+        self.r2 = Rival.objects.create(team_name="test2", home="test_home")
+        self.p = Player.objects.create(name="test", sebango=1)
+        self.games = []
+        # 3/1 勝ち 2-0, 3/8 負け 0-1, 3/15 引分 1-1
+        for day, gain, reduce, goals in ((1, 2, 0, 2), (8, 0, 1, 0), (15, 1, 1, 1)):
+            g = Game.objects.create(rival=self.r1, point_gain=gain, point_reduce=reduce,
+                                    game_date=parse_datetime("2019-03-%02d 10:00:00" % day))
+            Stats.objects.create(game=g, player=self.p, goals=goals, assists=1)
+            self.games.append(g)
+
+    def test_as_of(self):
+        self.assertEqual(PlayerCumulativeTotals.as_of(self.p.pk, date(2019, 2, 28)).goals, 0)
+        t = PlayerCumulativeTotals.as_of(self.p.pk, date(2019, 3, 8))
+        self.assertEqual((t.appearances, t.goals, t.assists), (2, 2, 2))
+        t = PlayerCumulativeTotals.as_of(self.p.pk, date(2019, 3, 31))
+        self.assertEqual((t.appearances, t.goals), (3, 3))
+        r = RivalCumulativeRecord.as_of(self.r1.pk, date(2019, 3, 8))
+        self.assertEqual((r.played, r.won, r.lost, r.drawn, r.goals_for), (2, 1, 1, 0, 2))
+
+    def test_as_of_is_one_query(self):
+        with self.assertNumQueries(1):
+            PlayerCumulativeTotals.as_of(self.p.pk, date(2019, 3, 8))
+
+    def test_between(self):
+        totals = PlayerCumulativeTotals.between(self.p.pk, parse_datetime("2019-03-02 00:00:00"),
+                                                parse_datetime("2019-03-16 00:00:00"))
+        self.assertEqual((totals['appearances'], totals['goals']), (2, 1))
+
+    def test_insert_earlier_game(self):
+        g = Game.objects.create(rival=self.r1, point_gain=3, point_reduce=0, game_date=parse_datetime("2019-03-05 10:00:00"))
+        Stats.objects.create(game=g, player=self.p, goals=3, assists=0)
+        self.assertEqual(PlayerCumulativeTotals.as_of(self.p.pk, date(2019, 3, 8)).goals, 5)
+        self.assertEqual(RivalCumulativeRecord.as_of(self.r1.pk, date(2019, 3, 31)).won, 2)
+        self.assertEqual(PlayerCumulativeTotals.verify(), [])
+        self.assertEqual(RivalCumulativeRecord.verify(), [])
+
+    def test_append_writes_one_row(self):
+        ids = set(PlayerCumulativeTotals.objects.values_list('id', flat=True))
+        g = Game.objects.create(rival=self.r1, point_gain=1, point_reduce=0, game_date=parse_datetime("2019-04-01 10:00:00"))
+        Stats.objects.create(game=g, player=self.p, goals=1, assists=0)
+        self.assertTrue(ids < set(PlayerCumulativeTotals.objects.values_list('id', flat=True)))
+
+    def test_rebuild_reads_bases_in_one_query(self):
+        # 追記の集計し直しは選手の人数によらず、直前の行を1クエリでまとめて読む
+        players = [self.p] + [Player.objects.create(name="squad%d" % i, sebango=10 + i) for i in range(10)]
+        for p in players[1:]:
+            Stats.objects.create(game=self.games[0], player=p, goals=1, assists=0)
+        g = Game.objects.create(rival=self.r1, point_gain=1, point_reduce=0,
+                                game_date=parse_datetime("2019-04-01 10:00:00"))
+        for p in players:
+            Stats.objects.create(game=g, player=p, goals=1, assists=0)
+        with CaptureQueriesContext(connection) as ctx:
+            PlayerCumulativeTotals.rebuild([p.pk for p in players], since=g.game_date)
+        selects = [q['sql'] for q in ctx if 'FROM "record_playercumulativetotals"' in q['sql']
+                   and q['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 1)
+        self.assertEqual(PlayerCumulativeTotals.as_of(self.p.pk, date(2019, 4, 1)).goals, 4)
+        self.assertEqual(PlayerCumulativeTotals.as_of(players[5].pk, date(2019, 4, 1)).goals, 2)
+        self.assertEqual(PlayerCumulativeTotals.verify(), [])
+
+    def test_update_and_delete(self):
+        s = Stats.objects.get(game=self.games[0])
+        s.goals = 0
+        s.save()
+        self.assertEqual(PlayerCumulativeTotals.as_of(self.p.pk, date(2019, 3, 31)).goals, 1)
+        Game.objects.get(pk=self.games[1].pk).delete()
+        t = PlayerCumulativeTotals.as_of(self.p.pk, date(2019, 3, 31))
+        self.assertEqual((t.appearances, t.goals), (2, 1))
+        r = RivalCumulativeRecord.as_of(self.r1.pk, date(2019, 3, 31))
+        self.assertEqual((r.played, r.lost), (2, 0))
+        self.assertEqual(PlayerCumulativeTotals.verify(), [])
+        self.assertEqual(RivalCumulativeRecord.verify(), [])
+
+    def test_move_game(self):
+        g = Game.objects.get(pk=self.games[0].pk)
+        g.game_date = parse_datetime("2019-03-20 10:00:00")
+        g.rival = self.r2
+        g.save()
+        self.assertEqual(PlayerCumulativeTotals.as_of(self.p.pk, date(2019, 3, 8)).goals, 0)
+        self.assertEqual(RivalCumulativeRecord.as_of(self.r1.pk, date(2019, 3, 31)).won, 0)
+        self.assertEqual(RivalCumulativeRecord.as_of(self.r2.pk, date(2019, 3, 31)).won, 1)
+        self.assertEqual(PlayerCumulativeTotals.verify(), [])
+        self.assertEqual(RivalCumulativeRecord.verify(), [])
+
+    def test_rebuild_and_verify(self):
+        PlayerCumulativeTotals.objects.filter(game=self.games[1]).update(goals=9)
+        RivalCumulativeRecord.objects.filter(game=self.games[2]).delete()
+        self.assertEqual(PlayerCumulativeTotals.verify(), [self.p.pk])
+        self.assertEqual(RivalCumulativeRecord.verify(), [self.r1.pk])
+        call_command('rebuild_aggregates', stdout=StringIO())
+        self.assertEqual(PlayerCumulativeTotals.verify(), [])
+        self.assertEqual(RivalCumulativeRecord.verify(), [])
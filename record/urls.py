@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, exports, metrics, views
 
 urlpatterns = [
     path('', views.PortalView.as_view(), name='record_index'),
@@ -20,4 +20,14 @@ urlpatterns = [
     path('players/new', views.PlayerCreateView.as_view(), name='player_new'),
     path('players/update/<int:pk>', views.PlayerUpdateView.as_view(), name='player_update'),
     path('stats/update/<int:pk>', views.StatsUpdateView.as_view(), name='stats_update'),
+    path('leaderboards/', views.leaderboards_view, name='leaderboards'),
+    path('export/<slug:name>.<slug:fmt>', exports.export_view, name='export'),
+    path('api/games/', api.game_list, name='api_game_list'),
+    path('api/games/<int:pk>', api.game_detail, name='api_game_detail'),
+    path('api/players/', api.player_list, name='api_player_list'),
+    path('api/players/<int:pk>', api.player_detail, name='api_player_detail'),
+    path('api/rivals/', api.rival_list, name='api_rival_list'),
+    path('api/rivals/<int:pk>', api.rival_detail, name='api_rival_detail'),
+    path('api/leaderboards/', api.leaderboards, name='api_leaderboards'),
+    path('metrics', metrics.metrics_view, name='metrics'),
 ]
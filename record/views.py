@@ -1,29 +1,99 @@
+from datetime import timedelta
+
+from django.http import Http404, HttpResponseBadRequest
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views import generic
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
+from django.utils.decorators import method_decorator
 
-from .models import Game, Player, Stats, Rival
+from .cache import get_version, cache_page_versioned
+from .pagination import KeysetPaginationMixin
+from .models import Game, Player, Stats, Rival, PlayerCareerTotals, Season, \
+    PlayerSeasonTotals, RivalSeasonRecord, PlayerCumulativeTotals, RivalCumulativeRecord, STATS_FIELDS
 from .forms import GameForm, StatsFormSet, PlayerForm, AddStatsForm
+from .exports import parse_day
+from .instrumentation import count_cache
+from .nplusone import untracked
+from .leaderboards import cached_leaderboards, parse_params
+from .rolling import with_rolling_form, latest_form
 from .service import GameCreateService, StatsCreateService
+from .summary import summarize
 
 # Create your views here.
 
 
-class GameIndexView(generic.ListView):
+def get_season(request):
+    """Return (seasons, selected season or None) for ?season=<id>."""
+    seasons = list(Season.objects.all())
+    raw = request.GET.get('season')
+    if not raw:
+        return seasons, None
+    for season in seasons:
+        if str(season.pk) == raw:
+            return seasons, season
+    raise Http404("No such season")
+
+
+def get_as_of(request, season):
+    """Return the [start, end) range for ?as_of=YYYY-MM-DD, or None.
+
+    The day itself is included; with a season the range starts at the season,
+    and a day before the season gives an empty range.
+    Raises ValueError for a malformed date.
+    """
+    as_of = parse_day(request.GET.get('as_of'))
+    if as_of is None:
+        return None
+    end = as_of + timedelta(days=1)
+    if season is None:
+        return None, end
+    start = season.date_range()[0]
+    # シーズン開始より前の日付では end < start になり差分が負になるので、空の範囲にする
+    return start, max(start, end)
+
+
+class SeasonMixin:
+    """Adds ``seasons`` and the selected ``season`` to list views."""
+
+    def get(self, request, *args, **kwargs):
+        self.seasons, self.season = get_season(request)
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        kwargs['seasons'] = self.seasons
+        kwargs['season'] = self.season
+        return super().get_context_data(**kwargs)
+
+
+@method_decorator(cache_page_versioned('game', 'rival', 'season'), name='dispatch')
+class GameIndexView(SeasonMixin, KeysetPaginationMixin, generic.ListView):
     template_name = "record/game_list.html"
     context_object_name = "games"
+    keyset_fields = ('-id',)
+
+    def get_keyset_fields(self):
+        if self.request.GET.get('order') == 'date':
+            return ('-game_date', '-id')
+        return self.keyset_fields
 
     def get_queryset(self):
-        return Game.objects.order_by('-id')
+        games = Game.objects.select_related('rival')
+        if self.season is not None:
+            games = games.filter(self.season.game_filter())
+        return games
 
 
+@cache_page_versioned('game', 'rival', 'stats', 'player')
 def game_detail_view(request, pk):
-    game = get_object_or_404(Game, pk=pk)
-    statss = Stats.objects.filter(game=game)
-    summary = get_stats_summary(statss)
-    objects = {'game': game, 'statss': statss, 'summary': summary}
+    game = get_object_or_404(Game.objects.select_related('rival'), pk=pk)
+    statss = Stats.objects.filter(game=game).select_related('player')
+    distribution = summarize(statss, STATS_FIELDS)
+    summary = dict(distribution['total'], games=distribution['count'])
+    objects = {'game': game, 'statss': statss, 'summary': summary,
+               'distribution': distribution}
     return render(request, 'record/game_detail.html', objects)
 
 
@@ -33,27 +103,14 @@ def game_create_view(request):
     if request.method == 'POST':
         gameform = GameForm(request.POST)
         game_service = GameCreateService()
-        stats_service = StatsCreateService()
 
-        if gameform.is_valid():
-            game = game_service.create_game(gameform)
-        else:
+        if not gameform.is_valid():
             raise ValueError("INVALID GAME FORM")
 
         statsforms = StatsFormSet(request.POST)
 
-        stats_list = []
         if statsforms.is_valid():
-            game.save()
-            for statsform in statsforms:
-                if statsform.is_valid() & statsform.is_valid_stats():
-                    stats = stats_service.create_stats(game, statsform)
-                    stats_list.append(stats)
-                else:
-                    print("ommit stats")
-            for stats in stats_list:
-                stats.save()
-
+            game_service.create_game_with_stats(gameform, statsforms)
             return redirect('game_list')
         else:
             print("INVALIDE STATS")
@@ -131,13 +188,13 @@ class GameUpdateView(LoginRequiredMixin, generic.UpdateView):
 
 @login_required
 def game_add_stats_view(request, pk):
-    game = Game.objects.get(pk=pk)
+    game = get_object_or_404(Game.objects.select_related('rival'), pk=pk)
 
     if request.method == 'POST':
         statsform = AddStatsForm(request.POST)
         service = StatsCreateService()
 
-        if statsform.is_valid():
+        if statsform.is_valid() and statsform.is_new_in(game):
             stats = service.create_stats(game, statsform)
             stats.save()
             return redirect('game_detail', game.pk)
@@ -148,99 +205,129 @@ def game_add_stats_view(request, pk):
     return render(request, 'record/game_add_stats.html', {'form': statsform, "game": game})
 
 
+@method_decorator(cache_page_versioned(), name='dispatch')
 class PortalView(generic.TemplateView):
     template_name = "record/portal.html"
 
 
-class RivalIndexView(generic.ListView):
+@method_decorator(cache_page_versioned('rival', 'game', 'season'), name='dispatch')
+class RivalIndexView(SeasonMixin, KeysetPaginationMixin, generic.ListView):
     template_name = "record/rival_list.html"
     context_object_name = "rivals"
 
     def get_queryset(self):
-        return Rival.objects.order_by('id')
+        if self.season is not None:
+            return Rival.objects.with_season_record(self.season)
+        return Rival.objects.select_related('head_to_head')
 
 
+@cache_page_versioned('rival', 'game', 'season')
 def rival_detail_view(request, pk):
-    rival = get_object_or_404(Rival, pk=pk)
+    seasons, season = get_season(request)
+    try:
+        as_of = get_as_of(request, season)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    rival = get_object_or_404(Rival.objects.select_related('head_to_head'), pk=pk)
     games = Game.objects.filter(rival=rival)
-    summary = get_game_summary(games)
-    objects = {'games': games, 'rival': rival, 'summary': summary}
+    if as_of is not None:
+        # 累計表の2点の差で、その日までの成績を出す
+        start, end = as_of
+        games = games.filter(game_date__lt=end)
+        if start is not None:
+            games = games.filter(game_date__gte=start)
+        record = RivalCumulativeRecord.between(rival.pk, start, end)
+        rival.won_count, rival.lose_count, rival.even_count = record['won'], record['lost'], record['drawn']
+        summary = {'game_counts': record['played'],
+                   'points': record['goals_for'],
+                   'reduces': record['goals_against']}
+    elif season is None:
+        summary = rival.game_summary()
+    else:
+        games = games.filter(season.game_filter())
+        record = RivalSeasonRecord.objects.filter(season=season, rival=rival).first() or \
+            RivalSeasonRecord(season=season, rival=rival)
+        rival.won_count, rival.lose_count, rival.even_count = record.won, record.lost, record.drawn
+        summary = {'game_counts': record.played,
+                   'points': record.goals_for,
+                   'reduces': record.goals_against}
+    objects = {'games': games, 'rival': rival, 'summary': summary,
+               'seasons': seasons, 'season': season, 'as_of_enabled': True}
     return render(request, 'record/rival_detail.html', objects)
 
 
-class PlayerIndexView(generic.ListView):
+@method_decorator(cache_page_versioned('player', 'stats', 'season'), name='dispatch')
+class PlayerIndexView(SeasonMixin, KeysetPaginationMixin, generic.ListView):
     template_name = "record/player_list.html"
     context_object_name = "players"
 
     def get_queryset(self):
-        return Player.objects.order_by('id')
+        if self.season is not None:
+            return Player.objects.with_season_totals(self.season)
+        return Player.objects.select_related('career_totals')
 
 
+@cache_page_versioned('player', 'stats', 'game', 'rival', 'season')
 def player_detail_view(request, pk):
-    player = get_object_or_404(Player, pk=pk)
-    statss = Stats.objects.filter(player=player)
-    summary = get_stats_summary(statss)
-    avgs = get_stats_summary(Stats.objects.all(), "avg")
+    seasons, season = get_season(request)
+    try:
+        as_of = get_as_of(request, season)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    player = get_object_or_404(Player.objects.select_related('career_totals'), pk=pk)
+    statss = with_rolling_form(Stats.objects.filter(player=player).select_related('game__rival'))
+    if as_of is not None:
+        # 累計表の2点の差で、その日までの成績を出す
+        start, end = as_of
+        statss = statss.filter(game__game_date__lt=end)
+        if start is not None:
+            statss = statss.filter(game__game_date__gte=start)
+        totals = PlayerCumulativeTotals.between(player.pk, start, end)
+        summary = {'games': totals['appearances']}
+        for name in STATS_FIELDS:
+            summary[name] = totals[name]
+    elif season is None:
+        summary = player.career_summary()
+    else:
+        statss = statss.filter(season.game_filter('game__'))
+        totals = PlayerSeasonTotals.objects.filter(season=season, player=player).first() or \
+            PlayerSeasonTotals(season=season, player=player)
+        summary = {'games': totals.appearances}
+        for name in STATS_FIELDS:
+            summary[name] = getattr(totals, name)
+    distribution = summarize(statss, STATS_FIELDS)
+    # 直近の出場試合での調子 (行の評価結果を表でもそのまま使う)
+    form = latest_form(statss)
+    avgs = get_squad_averages()
     objects = {'player': player, 'statss': statss,
-               'summary': summary, 'avgs': avgs}
+               'summary': summary, 'distribution': distribution, 'avgs': avgs,
+               'form': form,
+               'seasons': seasons, 'season': season, 'as_of_enabled': True}
     return render(request, 'record/player_detail.html', objects)
 
 
-def get_stats_summary(statss, func="total"):
-    summary = {}
-    goals = 0
-    assists = 0
-    passes = 0
-    intercepts = 0
-    games = 0
-    tuckles = 0
-    dribbles = 0
-
-    summary = {}
-    for stats in statss:
-        games += 1
-        goals += stats.goals
-        assists += stats.assists
-        passes += stats.passes
-        intercepts += stats.intercepts
-        tuckles += stats.tuckles
-        dribbles += stats.dribbles
-
-    summary['games'] = games
-    summary['goals'] = goals
-    summary['passes'] = passes
-    summary['intercepts'] = intercepts
-    summary['assists'] = assists
-    summary['tuckles'] = tuckles
-    summary['dribbles'] = dribbles
-
-    if (func == "avg") & (len(statss) != 0):
-        summary['games'] = summary['games'] / len(statss)
-        summary['goals'] = summary['goals'] / len(statss)
-        summary['passes'] = summary['passes'] / len(statss)
-        summary['intercepts'] = summary['intercepts'] / len(statss)
-        summary['assists'] = summary['assists'] / len(statss)
-        summary['tuckles'] = summary['tuckles'] / len(statss)
-        summary['dribbles'] = summary['dribbles'] / len(statss)
-
-    return summary
-
-
-def get_game_summary(games):
-    points = 0
-    reduces = 0
-    game_counts = 0
-    summary = {}
-    for game in games:
-        game_counts += 1
-        points += game.point_gain
-        reduces += game.point_reduce
-
-    summary['game_counts'] = game_counts
-    summary['points'] = points
-    summary['reduces'] = reduces
-
-    return summary
+def get_squad_averages():
+    # レーダーチャートのチーム平均は Stats が変わるまでキャッシュする
+    key = 'record:squad_avg:%d' % get_version('stats')
+    with untracked():
+        avgs = cache.get(key)
+    count_cache(hits=avgs is not None, misses=avgs is None)
+    if avgs is None:
+        avgs = PlayerCareerTotals.squad_averages()
+        with untracked():
+            cache.set(key, avgs, None)
+    return avgs
+
+
+def leaderboards_view(request):
+    try:
+        params = parse_params(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    boards = cached_leaderboards(**params)
+    rivals = Rival.objects.order_by('team_name')
+    objects = {'boards': boards, 'rivals': rivals, 'params': params}
+    return render(request, 'record/leaderboards.html', objects)
 
 
 class PlayerCreateView(LoginRequiredMixin, generic.CreateView):
@@ -264,5 +351,14 @@ class StatsUpdateView(LoginRequiredMixin, generic.UpdateView):
     fields = '__all__'
     template_name = 'record/stats_update.html'
 
+    def get_queryset(self):
+        return Stats.objects.select_related('game')
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        # 選択肢のラベル (Game.__str__) が対戦相手を参照するので一緒に取る
+        form.fields['game'].queryset = Game.objects.select_related('rival')
+        return form
+
     def get_success_url(self):
         return reverse_lazy('game_detail', kwargs={'pk': self.object.game.pk})